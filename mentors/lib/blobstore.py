@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# lib/blobstore.py — Content-addressed file storage
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Content-addressed storage of files, keyed by their SHA-256 digest.
+
+Each distinct content is stored once, under ``<root>/ab/cd/abcd...``. Blobs
+are copied to a temporary file in ``<root>/tmp``, hashed while being
+copied, and renamed into place once their digest is checked, so that a
+blob always matches its name and readers never see a partial blob.
+
+Adding a blob and removing one (see BlobStore.locked) take a lock on the
+store, so that a blob found by BlobStore.add is not removed before its
+modification time is updated.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import errno
+import fcntl
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+from . import digest
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class BlobStoreError(Exception):
+    pass
+
+
+class PendingBlob(object):
+    """A file copied to the temporary directory of a BlobStore, not stored yet"""
+
+    def __init__(self, store, tmp_path, file_digests):
+        self.store = store
+        self.tmp_path = tmp_path
+        # The lib.digest.FileDigests of the copy
+        self.file_digests = file_digests
+
+    @property
+    def sha256(self):
+        return self.file_digests.digests['sha256']
+
+    def commit(self):
+        """
+        Move the copy into the store. Returns False if the content was
+        already stored (the copy is then discarded), True otherwise.
+        """
+        destination = self.store.path(self.sha256)
+        with self.store.locked(exclusive=False):
+            if self.store._touch(self.sha256):
+                self.discard()
+                return False
+            try:
+                os.makedirs(os.path.dirname(destination))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            os.rename(self.tmp_path, destination)
+        return True
+
+    def discard(self):
+        """Remove the copy"""
+        try:
+            os.unlink(self.tmp_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class BlobStore(object):
+    """The blobs stored in the ``root`` directory"""
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+    def path(self, sha256):
+        """The path of the blob with the given hex digest"""
+        if not SHA256_RE.match(sha256):
+            raise ValueError('Invalid SHA-256 digest %r' % sha256)
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def __contains__(self, sha256):
+        return bool(SHA256_RE.match(sha256)) and os.path.exists(self.path(sha256))
+
+    def open(self, sha256):
+        """The blob with the given hex digest, as a file object. Raises IOError."""
+        return open(self.path(sha256), 'rb')
+
+    @contextmanager
+    def locked(self, exclusive=True):
+        """
+        Lock the store. Blobs are added under a shared lock; the blobs
+        checked for removal must be checked and removed under the
+        exclusive lock.
+        """
+        try:
+            os.makedirs(self.root)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(os.path.join(self.root, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _touch(self, sha256):
+        """Update the modification time of the blob. Returns False if it doesn't exist."""
+        try:
+            os.utime(self.path(sha256), None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        return True
+
+    def write(self, path, algorithms=digest.DEFAULT_ALGORITHMS):
+        """
+        Copy the file at ``path`` to the temporary directory, computing its
+        ``algorithms`` digests (which must include sha256) in the same read.
+        Returns a PendingBlob, to commit or discard. Raises IOError.
+        """
+        try:
+            os.makedirs(self.tmp_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                file_digests = digest.digest_file(path, algorithms, output=tmp)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.chmod(tmp_path, 0o444)
+        except:
+            os.unlink(tmp_path)
+            raise
+        return PendingBlob(self, tmp_path, file_digests)
+
+    def add(self, path, sha256):
+        """
+        Store the file at ``path``, whose SHA-256 digest should be ``sha256``.
+        The copy is checked against ``sha256`` before being stored; raises
+        BlobStoreError if the file doesn't match (anymore).
+
+        Returns False if the content was already stored, True otherwise.
+        The modification time of the blob is updated either way, so that
+        the garbage collector spares the blobs just added.
+        """
+        with self.locked(exclusive=False):
+            if self._touch(sha256):
+                return False
+
+        pending = self.write(path, ('sha256',))
+        if pending.sha256 != sha256:
+            pending.discard()
+            raise BlobStoreError('%s does not match the digest %s' % (path, sha256))
+        return pending.commit()
+
+    def remove(self, sha256):
+        """Remove the blob with the given hex digest, if it exists"""
+        try:
+            os.unlink(self.path(sha256))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def __iter__(self):
+        """Yields the hex digests of the stored blobs"""
+        if not os.path.isdir(self.root):
+            return
+        for first in sorted(os.listdir(self.root)):
+            if len(first) != 2:
+                continue
+            for second in sorted(os.listdir(os.path.join(self.root, first))):
+                for name in sorted(os.listdir(os.path.join(self.root, first, second))):
+                    if SHA256_RE.match(name):
+                        yield name
+
+    def temporary_files(self):
+        """The paths of the temporary files, left behind by interrupted writes"""
+        if not os.path.isdir(self.tmp_dir):
+            return []
+        return [os.path.join(self.tmp_dir, name) for name in os.listdir(self.tmp_dir)]
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+#
+# lib/deb822.py — Lazy reader of deb822 control data
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Lazy reader of deb822 control data: .changes, .dsc, Packages and Sources
+files.
+
+The paragraphs are found by scanning a string or an mmap for blank lines,
+without copying them: a paragraph is only parsed, with a single regular
+expression pass, when one of its fields is first accessed. Iterating over
+a large Packages file to look at a few paragraphs is thus cheap.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import collections
+import mmap
+import os
+import re
+from collections import namedtuple
+
+
+# Blank lines, possibly holding whitespace, separate the paragraphs
+PARAGRAPH_SEPARATOR_RE = re.compile(r'\n[ \t]*\n')
+# A field: its name, and its value with the continuation lines
+FIELD_RE = re.compile(r'^([^ \t\n][^:\n]*):[ \t]*(.*(?:\n[ \t].*)*)', re.MULTILINE)
+CONTINUATION_FIRST_RE = re.compile(r'\n*[ \t]')
+NON_BLANK_RE = re.compile(r'\S')
+
+PGP_SIGNED_MESSAGE = '-----BEGIN PGP SIGNED MESSAGE-----'
+
+# Size of the reads of file objects that can't be mapped
+READ_CHUNK_SIZE = 1 << 20
+
+
+# One line of a Files or Checksums-* field
+ChecksumEntry = namedtuple('ChecksumEntry', ['checksum', 'size', 'name'])
+
+# result of verify_paragraphs
+SignedParagraphs = namedtuple('SignedParagraphs',
+                              ['signature',  # GpgFileSignature
+                               'paragraphs',  # list of Paragraph of the signed data
+                               ])
+
+
+class Deb822Error(Exception):
+    """Invalid deb822 data"""
+
+
+class Deb822SignatureError(Deb822Error):
+    """The PGP signature of the data is missing or invalid"""
+
+
+class Paragraph(collections.Mapping):
+    """
+    A read-only, case-insensitive mapping of the fields of the paragraph at
+    ``data[start:end]``, where ``data`` is a string or an mmap.
+
+    Nothing is copied out of ``data`` until a field is accessed: the fields
+    of the paragraph are then all parsed at once. The values are byte
+    strings; the first line of a value is stripped, and its continuation
+    lines are kept as they are, as python-debian does.
+    """
+
+    __slots__ = ('_data', '_start', '_end', '_fields', '_names')
+
+    def __init__(self, data, start, end):
+        self._data = data
+        self._start = start
+        self._end = end
+        # field name, in lowercase -> value
+        self._fields = None
+        # field names, in order
+        self._names = None
+
+    def _parse(self):
+        if self._fields is None:
+            data, start, end = self._data, self._start, self._end
+            if CONTINUATION_FIRST_RE.match(data, start, end):
+                raise Deb822Error('Continuation line before the first field')
+            fields = FIELD_RE.findall(data, start, end)
+            if not fields:
+                raise Deb822Error('Paragraph without fields: %r' % data[start:min(end, start + 80)])
+            self._fields = dict((name.lower(), value) for name, value in fields)
+            self._names = [name for name, value in fields]
+        return self._fields
+
+    def __getitem__(self, name):
+        return self._parse()[name.lower()].rstrip()
+
+    def __contains__(self, name):
+        return name.lower() in self._parse()
+
+    def __iter__(self):
+        self._parse()
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._parse())
+
+    def __repr__(self):
+        return '<Paragraph %r>' % self.raw[:80]
+
+    @property
+    def raw(self):
+        """The paragraph, as in the data"""
+        return self._data[self._start:self._end]
+
+    def checksums(self, name):
+        """
+        The entries of the multi-line field ``name``: ``Files`` or
+        ``Checksums-*``, as a list of ChecksumEntry(checksum, size, name).
+        The section and priority columns of .changes files are left out.
+        """
+        entries = []
+        for line in self[name].splitlines():
+            columns = line.split()
+            if not columns:
+                continue
+            if len(columns) < 3 or not columns[1].isdigit():
+                raise Deb822Error('Invalid %s line: %r' % (name, line))
+            entries.append(ChecksumEntry(columns[0].lower(), int(columns[1]), columns[-1]))
+        return entries
+
+
+def _split_paragraphs(data, start=0, end=None):
+    """Yields the Paragraphs of ``data[start:end]``"""
+    if end is None:
+        end = len(data)
+    for separator in PARAGRAPH_SEPARATOR_RE.finditer(data, start, end):
+        if NON_BLANK_RE.search(data, start, separator.start()):
+            yield Paragraph(data, start, separator.start() + 1)
+        start = separator.end()
+    if NON_BLANK_RE.search(data, start, end):
+        yield Paragraph(data, start, end)
+
+
+def _check_unsigned(data):
+    if data[:len(PGP_SIGNED_MESSAGE) + 64].lstrip().startswith(PGP_SIGNED_MESSAGE):
+        raise Deb822SignatureError('PGP-signed data, use verify_paragraphs to read it')
+
+
+def iter_paragraphs(source):
+    """
+    Yields the Paragraphs of ``source``: a string, an mmap, or a file
+    object. Regular files are mapped in memory rather than read; other file
+    objects are read by chunks.
+
+    Raises Deb822SignatureError if ``source`` is PGP-signed, as its
+    signature must be checked with verify_paragraphs.
+    """
+    if isinstance(source, (str, mmap.mmap)):
+        data = source
+    else:
+        data = _map_file(source)
+        if data is None:
+            for paragraph in _iter_file_paragraphs(source):
+                yield paragraph
+            return
+
+    _check_unsigned(data)
+    for paragraph in _split_paragraphs(data):
+        yield paragraph
+
+
+def _map_file(file_object):
+    """An mmap of the rest of ``file_object``, None if it can't be mapped"""
+    try:
+        fileno = file_object.fileno()
+        size = os.fstat(fileno).st_size
+        position = file_object.tell()
+    except (AttributeError, IOError, OSError):
+        return None
+    if size == 0 or position != 0:
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return None
+
+
+def _iter_file_paragraphs(file_object):
+    data = file_object.read(READ_CHUNK_SIZE)
+    _check_unsigned(data)
+    while True:
+        chunk = file_object.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        data += chunk
+        separators = list(PARAGRAPH_SEPARATOR_RE.finditer(data))
+        if separators:
+            last = separators[-1].end()
+            for paragraph in _split_paragraphs(data, 0, last):
+                yield paragraph
+            data = data[last:]
+    for paragraph in _split_paragraphs(data):
+        yield paragraph
+
+
+def verify_paragraphs(gnupg, path=None, file_object=None, data=None, pubring=None):
+    """
+    Check the PGP signature of the control data at ``path``, in
+    ``file_object`` or in ``data`` with ``gnupg.verify_file`` (``gnupg``
+    is a GnuPG or a ShardedKeyring), and parse the signed data.
+
+    Returns a SignedParagraphs(signature, paragraphs). Raises
+    Deb822SignatureError if the signature isn't valid, and the exceptions
+    of verify_file.
+    """
+    kwargs = {'pubring': pubring} if pubring is not None else {}
+    signature = gnupg.verify_file(path=path, file_object=file_object, data=data, **kwargs)
+    if not signature.is_valid or signature.data is None:
+        raise Deb822SignatureError('Invalid PGP signature')
+    return SignedParagraphs(signature, list(_split_paragraphs(signature.data)))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# lib/digest.py — Single-pass computation of several file digests
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Computes several digests of a file in a single read, through a reusable
+buffer, and digests the files of an upload concurrently.
+
+hashlib releases the GIL while hashing large chunks, so the threads of
+digest_files hash on several cores.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import hashlib
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+# The digests of the Debian metadata: MD5sum, SHA1, SHA256 and SHA512
+DEFAULT_ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512')
+
+# Size of the reads, and of the buffer of each thread
+BUFFER_SIZE = 1 << 20
+
+FileDigests = namedtuple('FileDigests',
+                         ['path',
+                          'size',  # number of bytes read
+                          'digests',  # algorithm -> hex digest
+                          ])
+
+_buffers = threading.local()
+
+
+def _buffer(size):
+    """A buffer of ``size`` bytes, reused by all the reads of the thread"""
+    buf = getattr(_buffers, 'buffer', None)
+    if buf is None or len(buf) != size:
+        buf = _buffers.buffer = bytearray(size)
+    return buf
+
+
+def digest_file(path, algorithms=DEFAULT_ALGORITHMS, buffer_size=BUFFER_SIZE, output=None):
+    """
+    Compute the ``algorithms`` digests of the file at ``path``, reading it
+    once. If ``output`` is given, the data read is also written to that
+    file object, so that the copy matches the digests. Returns a
+    FileDigests; raises IOError.
+    """
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in algorithms]
+    buf = _buffer(buffer_size)
+    view = memoryview(buf)
+    size = 0
+
+    with open(path, 'rb') as f:
+        while True:
+            read = f.readinto(buf)
+            if not read:
+                break
+            size += read
+            chunk = view[:read] if read < buffer_size else view
+            for algorithm, algorithm_hash in hashes:
+                algorithm_hash.update(chunk)
+            if output is not None:
+                output.write(chunk)
+
+    return FileDigests(path, size, dict((algorithm, algorithm_hash.hexdigest())
+                                        for algorithm, algorithm_hash in hashes))
+
+
+def digest_files(paths, algorithms=DEFAULT_ALGORITHMS, workers=4):
+    """
+    Compute the ``algorithms`` digests of the files at ``paths``, with
+    ``workers`` threads. Returns the list of their FileDigests, in order;
+    raises the IOError of the first file that couldn't be read.
+    """
+    paths = list(paths)
+    if workers <= 1 or len(paths) <= 1:
+        return [digest_file(path, algorithms) for path in paths]
+
+    pool = ThreadPool(min(workers, len(paths)))
+    try:
+        return pool.map(lambda path: digest_file(path, algorithms), paths)
+    finally:
+        pool.terminate()
@@ -44,11 +44,26 @@ __copyright__ = ', '.join([
 ])
 __license__ = 'MIT'
 
+import bisect
+import errno
+import fcntl
+import hashlib
+import json
 import locale
+import logging
+import math
 import os
 import re
+import select
 import subprocess
-from collections import namedtuple
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple, OrderedDict
+
+from . import openpgp
+
+logger = logging.getLogger(__name__)
 
 
 #
@@ -59,6 +74,27 @@ GPG_KEY_PATTERN = r"^pub\s+(?P<key_id>\S+)\s+(?P<key_date>\S+)"
 GPG_ADDR_PATTERN = r"^(?:pub\s+(?P<key_id>\S+)\s+(?P<key_date>\S+)|uid)(?:\s+(?P<uid_name>.+)\s+<(?P<uid_email>.+?)>)?$"
 GPG_FPR_PATTERN = r"^.* = (?P<fingerprint>(?:[0-9A-F]{4} ){5} (?:[0-9A-F]{4} ){4}[0-9A-F]{4})$"
 
+GPG_KEY_RE = re.compile(GPG_KEY_PATTERN)
+GPG_ADDR_RE = re.compile(GPG_ADDR_PATTERN)
+GPG_FPR_RE = re.compile(GPG_FPR_PATTERN)
+
+# User ids in --with-colons output
+GPG_UID_RE = re.compile(r"^(?P<uid_name>.+)\s+<(?P<uid_email>.+?)>$")
+GPG_COLONS_ESCAPE_RE = re.compile(r"\\x([0-9a-fA-F]{2})")
+
+# OpenPGP public key algorithm ids, and the letters gpg uses for them
+GPG_ALGORITHMS = {
+    '1': 'R',  # RSA
+    '2': 'r',  # RSA encrypt-only
+    '3': 's',  # RSA sign-only
+    '16': 'g',  # ElGamal encrypt-only
+    '17': 'D',  # DSA
+    '18': 'e',  # ECDH
+    '19': 'E',  # ECDSA
+    '20': 'G',  # ElGamal
+    '22': 'E',  # EdDSA
+}
+
 
 #
 # Result objects
@@ -71,7 +107,35 @@ GpgFileSignature = namedtuple('GpgFileSignature',
                                ])
 
 
-GpgKey = namedtuple('GpgKey', ['id', 'fingerprint', 'type', 'strength'])
+# result of one of the verifications of GnuPG.verify_many
+GpgBatchResult = namedtuple('GpgBatchResult',
+                            ['item',  # the verified path, file object or data
+                             'signature',  # GpgFileSignature, or None
+                             'error',  # exception raised verifying item, or None
+                             ])
+
+
+# result of GnuPG.sign_detached and GnuPG.clearsign
+GpgSignature = namedtuple('GpgSignature',
+                          ['data',  # armored detached signature, or clearsigned text
+                           'fingerprint',  # of the signing key
+                           'created',  # timestamp
+                           ])
+
+
+# result of GnuPG.compact_keyring
+GpgCompaction = namedtuple('GpgCompaction', ['keys', 'size_before', 'size_after'])
+
+
+GpgKey = namedtuple('GpgKey', ['id', 'fingerprint', 'type', 'strength',
+                               # only filled in by the --with-colons and
+                               # in-process parsers:
+                               'created',  # timestamp
+                               'expires',  # timestamp, or None
+                               'validity',  # gpg's validity letter
+                               'subkeys',  # tuple of GpgKey
+                               ])
+GpgKey.__new__.__defaults__ = (None, None, None, None)
 
 
 GpgKeyBlock = namedtuple('GpgKeyBlock', ['key', 'user_ids'])
@@ -120,12 +184,559 @@ class GpgFailure(GpgBaseException):
 class GpgMissingData(GpgBaseException):
     """ Some data is missing for the gpg command. """
 
+class GpgNoSigningHomedir(GpgBaseException):
+    """ No homedir holding the signing keys has been provided """
+
 class GpgInvalidKeyBlock(GpgBaseException):
     """ Data is not a valid key block """
 
 class GpgKeyBlockParsingError(GpgBaseException):
     """ Error while parsing the key block """
 
+class GpgTimeout(GpgFailure):
+    """ gpg didn't finish in time, and has been killed """
+
+class GpgOverloaded(GpgBaseException):
+    """ Too many gpg processes are running already """
+
+
+#
+# Process I/O
+#
+
+GPG_STATUS_PREFIX = '[GNUPG:] '
+
+# Size of the reads and writes on gpg's pipes
+GPG_PIPE_CHUNK_SIZE = 65536
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _set_cloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+class GpgProcessIO(object):
+    """
+    Non-blocking I/O on the pipes of a running gpg process.
+
+    Feeds ``stdin`` to the process, collects its stdout and stderr, and
+    parses the status lines written on ``status_fd`` as they arrive, calling
+    ``status_callback`` with each of them. The pipes are serviced by
+    :func:`communicate`.
+    """
+
+    def __init__(self, process, stdin=None, status_fd=None, status_callback=None,
+                 timeout=None, on_close=None):
+        self.process = process
+        self.status = []
+        self.status_callback = status_callback
+
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+        self.timed_out = False
+        self._on_close = on_close
+
+        self._output = {'out': [], 'err': []}
+        self._readers = {}
+        for name, pipe in (('out', process.stdout), ('err', process.stderr)):
+            _set_nonblocking(pipe.fileno())
+            self._readers[pipe.fileno()] = name
+
+        self._status_fd = status_fd
+        self._status_buffer = ''
+        if status_fd is not None:
+            _set_nonblocking(status_fd)
+            self._readers[status_fd] = 'status'
+
+        if isinstance(stdin, unicode):
+            stdin = stdin.encode('utf-8')
+        self._stdin = stdin or ''
+        self._stdin_offset = 0
+        if self._stdin:
+            _set_nonblocking(process.stdin.fileno())
+        else:
+            process.stdin.close()
+
+    @property
+    def readers(self):
+        """File descriptors waiting to be read"""
+        return list(self._readers)
+
+    @property
+    def writers(self):
+        """File descriptors waiting to be written"""
+        if self.process.stdin.closed:
+            return []
+        return [self.process.stdin.fileno()]
+
+    @property
+    def output_closed(self):
+        """True once gpg has closed its stdout and stderr"""
+        return 'out' not in self._readers.values() and 'err' not in self._readers.values()
+
+    def handle_read(self, fd):
+        """Read what is available on ``fd``"""
+        try:
+            data = os.read(fd, GPG_PIPE_CHUNK_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+
+        name = self._readers[fd]
+        if not data:
+            del self._readers[fd]
+            if name != 'status':
+                getattr(self.process, 'std' + name).close()
+        elif name == 'status':
+            self._handle_status(data)
+        else:
+            self._output[name].append(data)
+
+    def handle_write(self, fd):
+        """Write the next chunk of stdin to ``fd``"""
+        chunk = self._stdin[self._stdin_offset:self._stdin_offset + GPG_PIPE_CHUNK_SIZE]
+        try:
+            self._stdin_offset += os.write(fd, chunk)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            if e.errno != errno.EPIPE:
+                raise
+            # gpg doesn't want any more input
+            self._stdin_offset = len(self._stdin)
+
+        if self._stdin_offset >= len(self._stdin):
+            self.process.stdin.close()
+
+    def kill(self):
+        """Kill gpg, once its deadline has passed"""
+        self.timed_out = True
+        if self.process.poll() is None:
+            self.process.kill()
+        for fd, name in self._readers.items():
+            if name != 'status':
+                del self._readers[fd]
+                getattr(self.process, 'std' + name).close()
+        if not self.process.stdin.closed:
+            self.process.stdin.close()
+
+    def _handle_status(self, data):
+        lines = (self._status_buffer + data).split('\n')
+        self._status_buffer = lines.pop()
+        striplen = len(GPG_STATUS_PREFIX)
+        for line in lines:
+            status = line[striplen:].split()
+            self.status.append(status)
+            if self.status_callback is not None:
+                self.status_callback(status)
+
+    def close(self):
+        """Read the last status lines and close the status pipe"""
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+        if self._status_fd is None:
+            return
+        # Another process started concurrently may still hold the write end
+        # of the status pipe: read what is there without waiting for EOF.
+        while self._status_fd in self._readers:
+            try:
+                data = os.read(self._status_fd, GPG_PIPE_CHUNK_SIZE)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.EAGAIN:
+                    raise
+                data = ''
+            if not data:
+                del self._readers[self._status_fd]
+            else:
+                self._handle_status(data)
+        if self._status_buffer:
+            self._handle_status('\n')
+        os.close(self._status_fd)
+        self._status_fd = None
+
+    @property
+    def bytes_in(self):
+        """Size of the input fed to gpg"""
+        return len(self._stdin)
+
+    @property
+    def bytes_out(self):
+        """Size of the output of gpg, stdout and stderr"""
+        return sum(len(chunk) for name in ('out', 'err') for chunk in self._output[name])
+
+    def result(self):
+        """Returns (stdout, stderr, status, exit code)"""
+        return (''.join(self._output['out']), ''.join(self._output['err']),
+                self.status, self.process.returncode)
+
+
+def communicate(ios):
+    """
+    Service the pipes of the given GpgProcessIO objects until their gpg
+    processes exit, yielding each of them when it's done.
+
+    The processes still running past their deadline are killed, and
+    yielded with their ``timed_out`` attribute set.
+    """
+    pending = list(ios)
+    while pending:
+        for io in poll(pending):
+            pending.remove(io)
+            yield io
+
+
+def poll(ios):
+    """
+    Wait until some pipes of the given GpgProcessIO objects are ready, and
+    service them. Returns the objects whose gpg process is done.
+    """
+    readers = {}
+    writers = {}
+    for io in ios:
+        readers.update((fd, io) for fd in io.readers)
+        writers.update((fd, io) for fd in io.writers)
+
+    timeout = None
+    deadlines = [io.deadline for io in ios if io.deadline is not None]
+    if deadlines:
+        timeout = max(0, min(deadlines) - time.time())
+
+    try:
+        readable, writable, _ = select.select(list(readers), list(writers), [], timeout)
+    except select.error as e:
+        if e.args[0] == errno.EINTR:
+            return []
+        raise
+
+    for fd in writable:
+        writers[fd].handle_write(fd)
+    for fd in readable:
+        readers[fd].handle_read(fd)
+
+    now = time.time()
+    for io in ios:
+        if io.deadline is not None and io.deadline <= now and not io.output_closed:
+            io.kill()
+
+    done = [io for io in ios if io.output_closed]
+    for io in done:
+        # gpg only closes its stdout and stderr when it exits, so it
+        # can't be blocked on a full status pipe anymore.
+        io.process.wait()
+        io.close()
+    return done
+
+
+#
+# Concurrency limits
+#
+
+class GpgLimiter(object):
+    """
+    Limits the number of gpg processes running at once.
+
+    ``max_processes``
+        the maximum number of gpg processes run at once by the threads of
+        this process (None for no limit)
+    ``lock_dir``, ``max_host_processes``
+        if both set, also limit the number of gpg processes run at once by
+        all the processes sharing ``lock_dir``, each of them holding a lock
+        on one of ``max_host_processes`` slot files
+    ``wait``
+        the number of seconds to wait for a free slot before raising
+        GpgOverloaded
+    """
+
+    # Delay between two attempts at locking a slot file
+    poll_interval = 0.01
+
+    def __init__(self, max_processes=None, lock_dir=None, max_host_processes=None, wait=0):
+        self.max_processes = max_processes
+        self.lock_dir = lock_dir
+        self.max_host_processes = max_host_processes
+        self.wait = wait
+
+        self.running = 0
+        self.rejected = 0
+
+        self._condition = threading.Condition()
+
+        if self.lock_dir is not None and self.max_host_processes and not os.path.isdir(self.lock_dir):
+            try:
+                os.makedirs(self.lock_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def acquire(self, wait=None):
+        """
+        Wait for a free slot, and return a function releasing it.
+
+        ``wait`` overrides the number of seconds to wait for the slot.
+        """
+        if wait is None:
+            wait = self.wait
+        deadline = time.time() + wait
+
+        with self._condition:
+            while self.max_processes is not None and self.running >= self.max_processes:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise GpgOverloaded('Too many gpg processes running in this process')
+                self._condition.wait(remaining)
+            self.running += 1
+
+        try:
+            lock_file = self._lock_slot_file(deadline)
+        except:
+            self._release()
+            raise
+
+        def release():
+            if lock_file is not None:
+                lock_file.close()
+            self._release()
+
+        return release
+
+    def _release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+    def _lock_slot_file(self, deadline):
+        if self.lock_dir is None or not self.max_host_processes:
+            return None
+
+        while True:
+            for slot in xrange(self.max_host_processes):
+                lock_file = open(os.path.join(self.lock_dir, 'slot-%d.lock' % slot), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    lock_file.close()
+                    if e.errno not in (errno.EAGAIN, errno.EACCES):
+                        raise
+                else:
+                    return lock_file
+
+            if time.time() >= deadline:
+                with self._condition:
+                    self.rejected += 1
+                raise GpgOverloaded('Too many gpg processes running on this host')
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        """Returns the number of running gpg processes and of rejected runs"""
+        with self._condition:
+            return {
+                'running': self.running,
+                'rejected': self.rejected,
+            }
+
+
+#
+# Instrumentation
+#
+
+# The gpg commands used as the verb of the GpgCommandEvents
+GPG_COMMANDS = frozenset([
+    '--check-trustdb', '--clearsign', '--decrypt', '--delete-key', '--detach-sign', '--export',
+    '--import', '--list-keys', '--quick-gen-key', '--recv-keys', '--refresh-keys', '--sign',
+    '--update-trustdb', '--verify',
+])
+
+# Digest algorithm of the signatures made by GnuPG.sign_detached and
+# GnuPG.clearsign (gpg 1 defaults to SHA1, which apt rejects)
+GPG_SIGNING_DIGEST = 'SHA256'
+
+# Upper bounds of the buckets of the gpg latency histograms, in seconds
+GPG_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+GpgCommandEvent = namedtuple('GpgCommandEvent', ['command', 'keyring', 'code', 'bytes_in', 'bytes_out', 'seconds'])
+
+
+def gpg_command_verb(args):
+    """The gpg command run with ``args``, 'default' when there is none"""
+    for arg in args or ():
+        if arg in GPG_COMMANDS:
+            return arg[2:]
+    return 'default'
+
+
+class GpgMetrics(object):
+    """
+    Aggregates the GpgCommandEvents of the process: for each command, the
+    number of runs and failures, the bytes fed to and read from gpg, and a
+    histogram of the wall time.
+
+    Recording an event only takes a lock and a few additions, so that the
+    metrics can be left on in production.
+    """
+
+    def __init__(self, buckets=GPG_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def record(self, event):
+        """Adds ``event`` to the metrics of its command"""
+        bucket = bisect.bisect_left(self.buckets, event.seconds)
+        with self._lock:
+            metrics = self._commands.get(event.command)
+            if metrics is None:
+                metrics = self._commands[event.command] = {
+                    'count': 0,
+                    'failures': 0,
+                    'bytes_in': 0,
+                    'bytes_out': 0,
+                    'seconds': 0.0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            metrics['count'] += 1
+            if event.code != 0:
+                metrics['failures'] += 1
+            metrics['bytes_in'] += event.bytes_in
+            metrics['bytes_out'] += event.bytes_out
+            metrics['seconds'] += event.seconds
+            metrics['histogram'][bucket] += 1
+
+    def clear(self):
+        """Forgets all the recorded events"""
+        with self._lock:
+            self._commands.clear()
+
+    def stats(self):
+        """
+        Returns the metrics of each command. The histograms are lists of
+        (upper bound in seconds, number of runs) pairs, the last bound being
+        None.
+        """
+        bounds = self.buckets + (None,)
+        with self._lock:
+            stats = {}
+            for command, metrics in self._commands.iteritems():
+                stats[command] = dict(metrics, histogram=zip(bounds, metrics['histogram']))
+            return stats
+
+
+#
+# Result cache
+#
+
+class GpgResultCache(object):
+    """
+    Bounded LRU cache for the results of gpg runs, keyed by the SHA-256 of
+    the data fed to gpg.
+
+    ``size``
+        the maximum number of results kept in this process
+    ``shared_cache``
+        an optional object with the ``get``/``set`` interface of a Django
+        cache, used to share the results between processes
+    ``prefix``
+        the prefix of the keys stored in ``shared_cache``
+    ``timeout``
+        the number of seconds the results are kept, None to keep them until
+        they are evicted. Results can also be given their own expiry time,
+        see :meth:`set`.
+    """
+
+    def __init__(self, size=1024, shared_cache=None, prefix='gpg', timeout=None):
+        self.size = size
+        self.shared_cache = shared_cache
+        self.prefix = prefix
+        self.timeout = timeout
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(data):
+        """Returns the key under which the result for ``data`` is cached"""
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, digest):
+        """Returns the result cached under ``digest``, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self._entries[digest] = entry
+                self.hits += 1
+                return entry[0]
+
+        if self.shared_cache is not None:
+            entry = self.shared_cache.get('%s:%s' % (self.prefix, digest))
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self._store(digest, entry)
+                with self._lock:
+                    self.shared_hits += 1
+                return entry[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, digest, value, expires=None):
+        """
+        Caches ``value`` under ``digest``, until the ``expires`` timestamp
+        if it comes before the cache timeout.
+        """
+        if self.timeout is not None:
+            expires = min(expires or float('inf'), time.time() + self.timeout)
+        entry = (value, expires)
+        self._store(digest, entry)
+        if self.shared_cache is not None:
+            if expires is None:
+                self.shared_cache.set('%s:%s' % (self.prefix, digest), entry)
+            else:
+                # At least a second, as 0 means "forever" for some backends
+                self.shared_cache.set('%s:%s' % (self.prefix, digest), entry,
+                                      max(1, int(math.ceil(expires - time.time()))))
+
+    def _store(self, digest, entry):
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._entries[digest] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-process cache and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        """Returns the hit/miss counters and the current number of entries"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'size': self.size,
+            }
+
 
 #
 # Main class
@@ -135,9 +746,23 @@ class GnuPG(object):
     """ Wrapper for some GnuPG operations """
 
     def __init__(self, gpg_path='/usr/bin/gpg',
-                 default_keyring='~/.gnupg/keyring.gpg'):
+                 default_keyring='~/.gnupg/keyring.gpg',
+                 key_block_cache=None, timeout=None, limiter=None,
+                 verify_cache=None, in_process_parsing=True, metrics=None,
+                 signing_homedir=None, signing_key=None, trust_model=None,
+                 auto_check_trustdb=True):
         self.gpg_path = gpg_path
         self.default_keyring = os.path.expanduser(default_keyring)
+        self.key_block_cache = key_block_cache
+        self.verify_cache = verify_cache
+        self.in_process_parsing = in_process_parsing
+        self.timeout = timeout
+        self.limiter = limiter
+        self.metrics = metrics
+        self.signing_homedir = signing_homedir
+        self.signing_key = signing_key
+        self.trust_model = trust_model
+        self.auto_check_trustdb = auto_check_trustdb
 
         if self.gpg_path and not os.path.isfile(self.gpg_path):
             self.gpg_path = None
@@ -183,27 +808,119 @@ class GnuPG(object):
         If ``path`` is not None, pass it as an argument to gnupg.
         Else, if ``file_object`` is not None, pass its content to
         gnupg's stdin.
+
+        If the GnuPG object has a ``verify_cache``, the results for the
+        same signed data and the same keyring generation are looked up
+        there first.
+        """
+        return self._verify_operation(path, file_object, data, pubring).result()
+
+    def verify_many(self, items, pubring=None, workers=4):
+        """
+        Check the status of the signatures of many files, running at most
+        ``workers`` gpg processes at once.
+
+        Each of ``items`` is the path to a signed file, a file object or
+        the signed data. Yields a GpgBatchResult(item, signature, error) for
+        each of them, as their verification completes. A failed
+        verification doesn't stop the others: its exception is reported in
+        ``error``.
+        """
+        items_by_operation = {}
+
+        def operations():
+            for item in items:
+                try:
+                    operation = self._verify_operation(pubring=pubring, **self._verify_item_input(item))
+                except (GpgBaseException, EnvironmentError) as e:
+                    operation = GpgOperation.completed(self, exception=e)
+                items_by_operation[operation] = item
+                yield operation
+
+        for operation in as_completed(operations(), workers):
+            item = items_by_operation.pop(operation)
+            error = operation.exception()
+            if error is not None:
+                yield GpgBatchResult(item, None, error)
+            else:
+                yield GpgBatchResult(item, operation.result(), None)
+
+    @staticmethod
+    def _verify_item_input(item):
+        if hasattr(item, 'read'):
+            return {'file_object': item}
+        # Signed data spans several lines, and may not be representable in
+        # the filesystem encoding
+        if '\0' in item or '\n' in item:
+            return {'data': item}
+        try:
+            if os.path.isfile(item):
+                return {'path': item}
+        except UnicodeError:
+            pass
+        return {'data': item}
+
+    def _verify_operation(self, path=None, file_object=None, data=None, pubring=None):
+        """Returns a GpgOperation checking the given file's signature"""
+        (stdin, args) = self._verify_file_input(path, file_object, data)
+        if self.verify_cache is None:
+            return GpgOperation(self, self._parse_verify_result, stdin, args, pubring)
+
+        if stdin is not None:
+            digest = self.verify_cache.digest(stdin)
+        else:
+            digest = self._file_digest(args[-1])
+        key = '%s:%s' % (digest, self.keyring_generation(pubring))
+
+        signature = self.verify_cache.get(key)
+        if signature is not None:
+            return GpgOperation.completed(self, signature)
+
+        def parse(out, err, status, code):
+            signature = self._parse_verify_result(out, err, status, code)
+            self.verify_cache.set(key, signature, expires=self._signature_expiry(status))
+            return signature
+
+        return GpgOperation(self, parse, stdin, args, pubring)
+
+    @staticmethod
+    def _signature_expiry(status):
+        """
+        The expiry timestamp of the signature, from its VALIDSIG status
+        line, or None. The expiry of the key isn't given by gpg for valid
+        keys: it is covered by the timeout of the verify cache.
         """
+        for line in status:
+            if line[0] == 'VALIDSIG' and len(line) > 4 and line[4].isdigit() and int(line[4]):
+                return int(line[4])
+        return None
 
+    @staticmethod
+    def _file_digest(path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(GPG_PIPE_CHUNK_SIZE), ''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _verify_file_input(self, path=None, file_object=None, data=None):
         # cmd: --decrypt
         args = ['--decrypt']
+        stdin = None
 
-        keywords_args = {'pubring': pubring}
         if path is not None and os.path.isfile(path):
             args.append(path)
         elif file_object is not None:
             if file_object.closed:
                 raise GpgVerifyInvalidData()
             else:
-                data = file_object.read()
-                keywords_args['stdin'] = data
+                stdin = file_object.read()
         elif data is not None:
-            keywords_args['stdin'] = data
+            stdin = data
         else:
             raise GpgVerifyNoData()
 
-        (out, err, status, code) = self._run(args=args, **keywords_args)
-        return self._parse_verify_result(out, err, status, code)
+        return (stdin, args)
 
     def _parse_verify_result(self, out, err, status, code):
         # documentation for status lines in /usr/share/doc/gnupg/DETAILS.gz
@@ -227,10 +944,149 @@ class GnuPG(object):
                                 fingerprint=fingerprint,
                                 data=data)
 
+    def sign_detached(self, data=None, path=None, keyid=None):
+        """
+        Make an armored detached signature of ``data``, or of the file at
+        ``path``, with the key ``keyid`` (by default, ``signing_key``, or
+        the default key) of the ``signing_homedir``.
+
+        Returns a GpgSignature(data, fingerprint, created).
+        """
+        return self._sign_operation(data, path, keyid).result()
+
+    def clearsign(self, data=None, path=None, keyid=None):
+        """
+        Clearsign ``data``, or the file at ``path``, like sign_detached.
+
+        Returns a GpgSignature whose ``data`` is the clearsigned text.
+        """
+        return self._sign_operation(data, path, keyid, clearsign=True).result()
+
+    def sign_many(self, items, clearsign=False, keyid=None, workers=4):
+        """
+        Sign many files, running at most ``workers`` gpg processes at once.
+
+        Each of ``items`` is the path to a file, a file object or the data
+        to sign. Yields a GpgBatchResult(item, signature, error) for each of
+        them, as their signature completes; a failed signature doesn't stop
+        the others.
+
+        With gpg 2, all the gpg processes talk to the gpg-agent of the
+        ``signing_homedir``, which holds the secret key for the whole run.
+        """
+        items_by_operation = {}
+
+        def operations():
+            for item in items:
+                try:
+                    item_input = self._verify_item_input(item)
+                    if 'file_object' in item_input:
+                        item_input = {'data': item_input['file_object'].read()}
+                    operation = self._sign_operation(keyid=keyid, clearsign=clearsign, **item_input)
+                except (GpgBaseException, EnvironmentError) as e:
+                    operation = GpgOperation.completed(self, exception=e)
+                items_by_operation[operation] = item
+                yield operation
+
+        for operation in as_completed(operations(), workers):
+            item = items_by_operation.pop(operation)
+            error = operation.exception()
+            if error is not None:
+                yield GpgBatchResult(item, None, error)
+            else:
+                yield GpgBatchResult(item, operation.result(), None)
+
+    def _sign_operation(self, data=None, path=None, keyid=None, clearsign=False):
+        """Returns a GpgOperation signing the given data or file"""
+        if self.signing_homedir is None:
+            raise GpgNoSigningHomedir()
+
+        args = ['--armor', '--digest-algo', GPG_SIGNING_DIGEST, '--output', '-']
+        if keyid is None:
+            keyid = self.signing_key
+        if keyid is not None:
+            args.extend(['--local-user', keyid])
+        args.append('--clearsign' if clearsign else '--detach-sign')
+
+        stdin = None
+        if data is not None:
+            stdin = data
+        elif path is not None:
+            args.append(path)
+        else:
+            raise GpgMissingData()
+
+        return GpgOperation(self, self._parse_sign_result, stdin, args, homedir=self.signing_homedir)
+
+    def _parse_sign_result(self, out, err, status, code):
+        # documentation for status lines in /usr/share/doc/gnupg/DETAILS.gz
+        for line in status:
+            if line[0] == 'SIG_CREATED' and len(line) >= 7:
+                if code != 0:
+                    break
+                return GpgSignature(data=out, fingerprint=line[6], created=int(line[5]))
+
+        raise GpgFailure(err)
+
     def parse_key_block(self, data=None, path=None):
         """
         Parse a PGP public key block
+
+        If the GnuPG object has a ``key_block_cache``, the results of parsing
+        ``data`` are looked up there first.
+
+        Unless ``in_process_parsing`` is False, the usual key blocks are
+        parsed by lib.openpgp, without running gpg.
         """
+        if data is None or self.key_block_cache is None:
+            return self._parse_key_block(data=data, path=path)
+
+        digest = self.key_block_cache.digest(data)
+        key_block = self.key_block_cache.get(digest)
+        if key_block is None:
+            key_block = self._parse_key_block(data=data)
+            self.key_block_cache.set(digest, key_block)
+        return key_block
+
+    def _parse_key_block(self, data=None, path=None):
+        key_block = self._parse_key_block_in_process(data, path)
+        if key_block is not None:
+            return key_block
+
+        (stdin, args) = self._key_block_input(data, path)
+        (out, err, status, code) = self._run(stdin, args)
+        return self._parse_key_block_result(out, err, code)
+
+    def _parse_key_block_in_process(self, data=None, path=None):
+        """Returns the parsed key block, or None if gpg needs to parse it"""
+        if not self.in_process_parsing:
+            return None
+
+        try:
+            if data is None:
+                if path is None:
+                    return None
+                with open(path, 'rb') as f:
+                    data = f.read()
+            key_block = openpgp.parse_key_block(data)
+        except (openpgp.OpenPGPError, IOError):
+            return None
+
+        user_ids = []
+        for user_id in key_block.user_ids:
+            m = GPG_UID_RE.match(user_id)
+            if m is not None:
+                user_ids.append(GpgUserId(m.group('uid_name'), m.group('uid_email')))
+
+        subkeys = tuple(self._openpgp_key(subkey) for subkey in key_block.subkeys)
+        return GpgKeyBlock(self._openpgp_key(key_block.key, subkeys), user_ids)
+
+    @staticmethod
+    def _openpgp_key(key, subkeys=()):
+        return GpgKey(key.fingerprint[-8:], key.fingerprint, GPG_ALGORITHMS.get(str(key.algorithm), '?'),
+                      key.strength, key.created, subkeys=subkeys)
+
+    def _key_block_input(self, data=None, path=None):
         stdin = None
         args = []
 
@@ -242,8 +1098,7 @@ class GnuPG(object):
         else:
             raise GpgMissingData()
 
-        (out, err, status, code) = self._run(stdin, args)
-        return self._parse_key_block_result(out, err, code)
+        return (stdin, args)
 
     def _parse_key_block_result(self, out, err, code):
         if code != 0:
@@ -259,12 +1114,12 @@ class GnuPG(object):
         fingerprint = None
         user_ids = []
         for line in lines:
-            m = re.match(GPG_KEY_PATTERN, line)
+            m = GPG_KEY_RE.match(line)
             if m is not None:
                 if key is None and m.group('key_id') is not None:
                     key = self.string_to_key(m.group('key_id'))
 
-            m = re.match(GPG_ADDR_PATTERN, line)
+            m = GPG_ADDR_RE.match(line)
             if m is not None:
                 if m.group('uid_name') is not None and m.group('uid_email') is not None:
                     uid_name = m.group('uid_name')
@@ -272,7 +1127,7 @@ class GnuPG(object):
                     user_id = GpgUserId(uid_name, uid_email)
                     user_ids.append(user_id)
 
-            m = re.match(GPG_FPR_PATTERN, line)
+            m = GPG_FPR_RE.match(line)
             if m is not None:
                 fingerprint = m.group('fingerprint').replace(' ', '')
 
@@ -281,10 +1136,20 @@ class GnuPG(object):
         else:
             raise GpgKeyBlockParsingError()
 
-    def list_keys(self, pubring=None):
+    def list_keys(self, pubring=None, with_colons=False):
         """
         List all the keys from the keyring
+
+        If ``with_colons`` is True, gpg's machine-readable output is parsed
+        while gpg runs, and the yielded key blocks have their creation and
+        expiry dates, validity and subkeys filled in.
         """
+        if with_colons:
+            args = ('--with-colons', '--fixed-list-mode', '--list-keys')
+            for key_block in self._parse_colons_listing(self._run_lines(args=args, pubring=pubring)):
+                yield key_block
+            return
+
         args = ('--list-keys',)
 
         (out, err, status, code) = self._run(args=args, pubring=pubring)
@@ -293,9 +1158,12 @@ class GnuPG(object):
             return
 
         # Remove the first two useless lines
-        outlines = out.splitlines()[2:]
+        for key_block in self._parse_key_listing(out.splitlines()[2:]):
+            yield key_block
+
+    def _parse_key_listing(self, lines):
         cur_block = []
-        for line in outlines:
+        for line in lines:
             if line:
                 cur_block.append(line)
             else:
@@ -304,12 +1172,66 @@ class GnuPG(object):
         if cur_block:
             yield self._parse_key_info(cur_block)
 
+    def _parse_colons_listing(self, lines):
+        # documentation for the colon listings in /usr/share/doc/gnupg/DETAILS.gz
+        key = None
+        user_ids = []
+        subkeys = []
+        current = None
+
+        for line in lines:
+            record = line[:4]
+
+            if record == 'pub:' or record == 'sub:':
+                fields = line.split(':', 8)
+                current = [fields[4][-8:], None, GPG_ALGORITHMS.get(fields[3], '?'), int(fields[2] or 0),
+                           int(fields[5]) if fields[5] else None,
+                           int(fields[6]) if fields[6] else None,
+                           fields[1]]
+                if record == 'pub:':
+                    if key is not None:
+                        yield self._colons_key_block(key, subkeys, user_ids)
+                    key = current
+                    user_ids = []
+                    subkeys = []
+                else:
+                    subkeys.append(current)
+
+            elif record == 'fpr:':
+                if current is not None and current[1] is None:
+                    current[1] = line.split(':', 10)[9]
+
+            elif record == 'uid:':
+                if key is not None:
+                    uid = line.split(':', 10)[9]
+                    if '\\' in uid:
+                        uid = GPG_COLONS_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)), uid)
+                    m = GPG_UID_RE.match(uid.decode('utf-8', 'replace'))
+                    if m is not None:
+                        user_ids.append(GpgUserId(m.group('uid_name'), m.group('uid_email')))
+
+        if key is not None:
+            yield self._colons_key_block(key, subkeys, user_ids)
+
+    @staticmethod
+    def _colons_key_block(key, subkeys, user_ids):
+        subkeys = tuple(GpgKey(*(subkey + [()])) for subkey in subkeys)
+        return GpgKeyBlock(GpgKey(*(key + [subkeys])), user_ids)
+
     def add_key(self, data=None, path=None, pubring=None):
         """
         Adds a key to the public keyring.
         Returns a GpgResult(code, stdout, stderr, status, success).
         """
-        args = ('--import-options', 'import-minimal', '--import')
+        (stdin, args) = self._add_key_input(data, path)
+        try:
+            (out, err, status, code) = self._run(stdin=stdin, args=args, pubring=pubring)
+        finally:
+            self.bump_keyring_generation(pubring)
+        return self._parse_add_key_result(out, err, status, code)
+
+    def _add_key_input(self, data=None, path=None):
+        args = ['--import-options', 'import-minimal', '--import']
         stdin = None
         if data is not None:
             stdin = data
@@ -318,8 +1240,9 @@ class GnuPG(object):
         else:
             raise GpgMissingData()
 
-        (out, err, status, code) = self._run(stdin=stdin, args=args, pubring=pubring)
+        return (stdin, args)
 
+    def _parse_add_key_result(self, out, err, status, code):
         success = False
         for line in status:
             if line[0] == 'IMPORT_OK':
@@ -333,59 +1256,803 @@ class GnuPG(object):
         Removes a key from the public keyring
         Returns a GpgResult(code, stdout, stderr, status, success).
         """
-        args = ('--yes', '--delete-key', keyid)
-        (out, err,  status, code) = self._run(args=args, pubring=pubring)
+        return self.remove_keys([keyid], pubring)
+
+    def remove_keys(self, keyids, pubring=None):
+        """
+        Removes several keys from the public keyring, with a single gpg run
+        Returns a GpgResult(code, stdout, stderr, status, success).
+        """
+        args = ['--yes', '--delete-key']
+        args.extend(keyids)
+        try:
+            (out, err, status, code) = self._run(args=args, pubring=pubring)
+        finally:
+            self.bump_keyring_generation(pubring)
+        return self._parse_remove_key_result(out, err, status, code)
+
+    def export_keys(self, keyids=None, pubring=None):
+        """
+        Returns the given keys (by default, all the keys of the keyring), as
+        binary OpenPGP data
+        """
+        args = ['--export']
+        if keyids is not None:
+            args.extend(keyids)
+        (out, err, status, code) = self._run(args=args, pubring=pubring)
+        if code != 0:
+            raise GpgFailure('gpg --export failed: %s' % err)
+        return out
+
+    def check_trustdb(self, pubring=None):
+        """
+        Run gpg's trust database maintenance, which gpg otherwise runs
+        whenever it deems it necessary, unless ``auto_check_trustdb`` is
+        False. Meant to be run offline.
+        Returns a GpgResult(code, stdout, stderr, status, success).
+        """
+        (out, err, status, code) = self._run(args=['--check-trustdb'], pubring=pubring)
+        return GpgResult(code, out, err, status, code == 0)
+
+    def compact_keyring(self, pubring=None):
+        """
+        Rewrite the keyring with only its current keys, without the space
+        and the leftovers of the deleted keys. Meant to be run offline.
+
+        The rewritten keyring atomically replaces the old one, unless the
+        keyring changed in the meantime, in which case GpgFailure is raised
+        and the keyring is left alone.
+
+        Returns a GpgCompaction(keys, size_before, size_after).
+        """
+        if pubring is None:
+            pubring = self.default_keyring
+
+        generation = self.keyring_generation(pubring)
+        size_before = os.path.getsize(pubring)
+        data = self.export_keys(pubring=pubring)
+
+        directory, name = os.path.split(pubring)
+        compacted = os.path.join(directory, '.compact-' + name)
+        leftovers = [compacted, compacted + '~', compacted + '.generation']
+
+        def remove_leftovers():
+            for path in leftovers:
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+        remove_leftovers()
+        try:
+            if data:
+                result = self.add_key(data=data, pubring=compacted)
+                if not result.success:
+                    raise GpgFailure('gpg --import failed: %s' % result.err)
+            else:
+                open(compacted, 'wb').close()
+            os.chmod(compacted, os.stat(pubring).st_mode & 0o7777)
+
+            if self.keyring_generation(pubring) != generation:
+                raise GpgFailure('%s changed while being compacted' % pubring)
+            os.rename(compacted, pubring)
+        finally:
+            remove_leftovers()
+        self.bump_keyring_generation(pubring)
 
+        keys = sum(1 for key_block_data in openpgp.split_key_blocks(data)) if data else 0
+        return GpgCompaction(keys, size_before, os.path.getsize(pubring))
+
+    def keyring_generation(self, pubring=None):
+        """
+        Returns a string changing whenever the keys of the keyring may have
+        changed: on each add_key and remove_key, counted in the
+        ``pubring + ".generation"`` file, and on any other change of the
+        keyring file itself.
+        """
+        if pubring is None:
+            pubring = self.default_keyring
+        if not isinstance(pubring, basestring):
+            return '/'.join(self.keyring_generation(keyring) for keyring in pubring)
+
+        try:
+            with open(pubring + '.generation') as f:
+                counter = f.read().strip() or '0'
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            counter = '0'
+
+        try:
+            st = os.stat(pubring)
+            keyring_state = '%d-%d-%d' % (st.st_ino, st.st_size, int(st.st_mtime * 1000000))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            keyring_state = '-'
+
+        return '%s:%s:%s' % (GpgResultCache.digest(pubring)[:16], counter, keyring_state)
+
+    def bump_keyring_generation(self, pubring=None):
+        """Increments the add_key/remove_key counter of the keyring"""
+        if pubring is None:
+            pubring = self.default_keyring
+
+        with open(pubring + '.generation', 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            counter = int(f.read().strip() or 0)
+            f.seek(0)
+            f.truncate()
+            f.write('%d\n' % (counter + 1))
+
+    def _parse_remove_key_result(self, out, err, status, code):
         success = code == 0
 
         return GpgResult(code, out, err, status, success)
 
-    def _run(self, stdin=None, args=None, pubring=None):
+    def _command(self, args=None, pubring=None, status_fd=None, homedir=None):
+        """
+        Build the gpg command line for the given arguments and keyring,
+        writing status lines to ``status_fd`` if not None.
+
+        If ``homedir`` is not None, gpg uses the keyrings of that directory
+        instead of ``pubring``.
+        """
+        if self.gpg_path is None:
+            raise GpgPathNotInitialised()
+
+        options = ['--no-options', '--batch']
+        if not self.auto_check_trustdb:
+            options.append('--no-auto-check-trustdb')
+        if self.trust_model is not None:
+            options.extend(['--trust-model', self.trust_model])
+
+        if homedir is not None:
+            cmd = [self.gpg_path] + options + ['--homedir', homedir]
+            if status_fd is not None:
+                cmd.extend(['--status-fd', '{0}'.format(status_fd)])
+            cmd.extend(args or [])
+            return cmd
+
+        if pubring is None:
+            pubring = self.default_keyring
+        if isinstance(pubring, basestring):
+            pubrings = [pubring]
+        else:
+            pubrings = pubring
+
+        cmd = [self.gpg_path] + options + ['--with-fingerprint']
+        if status_fd is not None:
+            cmd.extend(['--status-fd', '{0}'.format(status_fd)])
+        cmd.extend([
+            '--no-default-keyring',
+            '--secret-keyring', pubrings[0] + ".secret",
+        ])
+        for pubring in pubrings:
+            cmd.extend(['--keyring', pubring])
+        if args is not None:
+            cmd.extend(args)
+
+        return cmd
+
+    def _run_lines(self, args=None, pubring=None, timeout=None):
+        """
+        Run gpg with the given arguments and yield its output line by line,
+        as gpg writes it.
+
+        ``args``
+            a list of strings to be passed as argument(s) to gpg
+        ``pubring``
+            the path to the public gpg keyring.
+        ``timeout``
+            the number of seconds after which gpg gets killed, defaults to
+            the ``timeout`` of the GnuPG object
+        """
+        cmd = self._command(args, pubring)
+        if timeout is None:
+            timeout = self.timeout
+
+        release = self._acquire()
+        killer = None
+        timed_out = []
+        process = None
+        bytes_out = 0
+        started = time.time()
+
+        def kill(process):
+            timed_out.append(True)
+            process.kill()
+
+        try:
+            # stderr goes to a file, so that gpg never blocks on it while we
+            # are reading its output
+            with tempfile.TemporaryFile() as stderr, open(os.devnull) as stdin:
+                process = subprocess.Popen(cmd, stdin=stdin,
+                                           stderr=stderr,
+                                           stdout=subprocess.PIPE)
+                if timeout is not None:
+                    killer = threading.Timer(timeout, kill, [process])
+                    killer.start()
+                try:
+                    for line in iter(process.stdout.readline, ''):
+                        bytes_out += len(line)
+                        yield line
+                finally:
+                    process.stdout.close()
+                    if process.poll() is None:
+                        process.kill()
+                    process.wait()
+                    bytes_out += os.fstat(stderr.fileno()).st_size
+        finally:
+            if killer is not None:
+                killer.cancel()
+            release()
+            if process is not None:
+                self._record(args, pubring, process.returncode, 0, bytes_out, started)
+
+        if timed_out:
+            raise GpgTimeout('gpg ran for more than %s seconds' % timeout)
+
+    def _acquire(self, wait=None):
+        """Wait for the limiter to allow running gpg, return its release function"""
+        if self.limiter is None:
+            return lambda: None
+        return self.limiter.acquire(wait)
+
+    def _start(self, stdin=None, args=None, pubring=None, status_callback=None, timeout=None, wait=None,
+               homedir=None):
+        """
+        Start gpg with the given arguments, and return a GpgProcessIO to
+        feed it ``stdin`` and collect its output.
+
+        ``wait`` overrides the number of seconds the limiter waits for a
+        free slot. ``homedir`` is passed to :meth:`_command`.
+        """
+        if self.gpg_path is None:
+            raise GpgPathNotInitialised()
+        if timeout is None:
+            timeout = self.timeout
+
+        release = self._acquire(wait)
+        started = time.time()
+
+        def close():
+            release()
+            self._record(args, homedir or pubring, io.process.returncode, io.bytes_in, io.bytes_out, started)
+
+        try:
+            in_status_fd, out_status_fd = os.pipe()
+        except:
+            release()
+            raise
+        # Only the gpg process we start gets the write end of the pipe
+        _set_cloexec(in_status_fd)
+
+        try:
+            cmd = self._command(args, pubring, status_fd=out_status_fd, homedir=homedir)
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       stdout=subprocess.PIPE)
+        except:
+            os.close(in_status_fd)
+            release()
+            raise
+        finally:
+            os.close(out_status_fd)
+
+        io = GpgProcessIO(process, stdin=stdin, status_fd=in_status_fd,
+                          status_callback=status_callback,
+                          timeout=timeout, on_close=close)
+        return io
+
+    def _record(self, args, pubring, code, bytes_in, bytes_out, started):
+        """Log a GpgCommandEvent for a gpg run, and pass it to ``metrics``"""
+        keyring = pubring or self.default_keyring
+        if not isinstance(keyring, basestring):
+            keyring = ','.join(keyring)
+        event = GpgCommandEvent(gpg_command_verb(args), keyring, code, bytes_in, bytes_out,
+                                time.time() - started)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('gpg %s on %s: exit code %s, %d bytes in, %d bytes out, %.3fs',
+                         *event, extra={'gpg_event': event._asdict()})
+        if self.metrics is not None:
+            try:
+                self.metrics.record(event)
+            except Exception:
+                logger.exception('Could not record the metrics of gpg %s', event.command)
+
+    def _run(self, stdin=None, args=None, pubring=None, status_callback=None, timeout=None, homedir=None):
         """
         Run gpg with the given stdin and arguments and return the output
-        (stdout and stderr) and exit status.
+        (stdout and stderr), the parsed status lines and exit status.
+
+        gpg's stdin, stdout, stderr and status pipes are all serviced at
+        the same time, so that gpg never blocks on a full pipe.
 
         ``stdin``
             Feed gpg with this input to stdin
         ``args``
             a list of strings to be passed as argument(s) to gpg
         ``pubring``
-            the path to the public gpg keyring. Note that
-            ``pubring + ".secret"`` will be used as the private keyring
+            the path to the public gpg keyring, or a list of paths. Note that
+            ``pubring + ".secret"`` (for the first one) will be used as the
+            private keyring
+        ``status_callback``
+            a function called with each status line (split in words), as
+            soon as gpg writes it
+        ``timeout``
+            the number of seconds after which gpg gets killed and GpgTimeout
+            is raised, defaults to the ``timeout`` of the GnuPG object
+        ``homedir``
+            run gpg with the keyrings of this directory instead of
+            ``pubring``
+
+        If the GnuPG object has a ``limiter``, GpgOverloaded is raised when
+        too many gpg processes are running already.
+        """
+        io = self._start(stdin, args, pubring, status_callback, timeout, homedir=homedir)
+        for io in communicate([io]):
+            pass
+
+        if io.timed_out:
+            raise GpgTimeout('gpg ran for more than %s seconds' % (timeout or self.timeout))
+
+        return io.result()
+
 
+#
+# Sharded keyrings
+#
+
+class ShardedKeyring(object):
+    """
+    A set of ``shards`` keyrings in ``directory``, each of them holding the
+    keys whose fingerprint starts with the same prefix, so that gpg never
+    has to load or rewrite all the keys at once.
+
+    An index, in ``directory/index.json``, maps the fingerprints and long
+    key ids of the keys and subkeys to their shard. Verifications only
+    pass the keyring of the shard of the signature's issuer to gpg, and
+    fall back to all the shards for unknown issuers.
+
+    The methods are the ones of GnuPG, without ``pubring`` argument.
+    """
+
+    def __init__(self, gnupg, directory, shards=16):
+        self.gnupg = gnupg
+        self.directory = directory
+        self.shards = shards
+
+        self.index_path = os.path.join(directory, 'index.json')
+        self._index = None
+        self._index_version = None
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def shard_for(self, fingerprint):
+        """Returns the shard number of the key with the given fingerprint"""
+        return int(fingerprint[:8], 16) % self.shards
+
+    def shard_path(self, shard):
+        """Returns the path of the keyring of the given shard"""
+        return os.path.join(self.directory, 'shard-%02x.gpg' % shard)
+
+    def keyrings(self):
+        """Returns the paths of all the existing shard keyrings"""
+        keyrings = [self.shard_path(shard) for shard in xrange(self.shards)]
+        return [keyring for keyring in keyrings if os.path.exists(keyring)]
+
+    def index(self):
+        """Returns the index, as a dictionary of fingerprints and key ids to shards"""
+        # The index is replaced on each update, changing its inode
+        try:
+            st = os.stat(self.index_path)
+            version = (st.st_ino, st.st_mtime)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            version = None
+
+        with self._lock:
+            if self._index is None or version != self._index_version:
+                self._index = self._read_index()['shards']
+                self._index_version = version
+            return self._index
+
+    def _read_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # shards: fingerprint or key id -> shard,
+            # ids: fingerprint -> fingerprints and key ids of the key and its subkeys
+            return {'shards': {}, 'ids': {}}
+
+    def _update_index(self, add=(), remove=()):
         """
-        if self.gpg_path is None:
-            raise GpgPathNotInitialised()
+        Add the GpgKeyBlock objects ``add`` to the index, and remove the keys
+        with the fingerprints ``remove`` from it.
+        """
+        with open(self.index_path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._read_index()
+
+            for fingerprint in remove:
+                for key in index['ids'].pop(fingerprint, [fingerprint]):
+                    index['shards'].pop(key, None)
+
+            for key_block in add:
+                fingerprint = key_block.key.fingerprint
+                shard = self.shard_for(fingerprint)
+                ids = [fingerprint, fingerprint[-16:]]
+                for subkey in key_block.key.subkeys or ():
+                    ids.extend([subkey.fingerprint, subkey.fingerprint[-16:]])
+                index['ids'][fingerprint] = ids
+                index['shards'].update((key, shard) for key in ids)
+
+            with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+                json.dump(index, f, sort_keys=True)
+            os.rename(f.name, self.index_path)
+
+    def shards_for_signature(self, data):
+        """Returns the keyrings of the shards holding the issuers of the signatures in ``data``"""
+        index = self.index()
+        shards = set()
+        for issuer in openpgp.signature_issuers(data):
+            shard = index.get(issuer)
+            if shard is None:
+                shards = None
+                break
+            shards.add(shard)
 
-        if pubring is None:
-            pubring = self.default_keyring
+        if shards:
+            return [self.shard_path(number) for number in sorted(shards)]
+        return self.keyrings() or [self.shard_path(0)]
 
-        in_status_fd, out_status_fd = os.pipe()
+    def verify_file(self, path=None, file_object=None, data=None):
+        """See GnuPG.verify_file"""
+        if path is not None and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                pubring = self.shards_for_signature(f.read())
+        else:
+            if file_object is not None and not file_object.closed:
+                data = file_object.read()
+            if data is None:
+                return self.gnupg.verify_file(path=path, file_object=file_object)
+            pubring = self.shards_for_signature(data)
+            path = None
+        return self.gnupg.verify_file(path=path, data=data, pubring=pubring)
 
-        cmd = [
-            self.gpg_path,
-            '--no-options',
-            '--batch',
-            '--with-fingerprint',
-            '--status-fd', '{0}'.format(out_status_fd),
-            '--no-default-keyring',
-            '--secret-keyring', pubring + ".secret",
-            '--keyring', pubring,
-        ]
-        if args is not None:
-            cmd.extend(args)
+    def add_key(self, data=None, path=None):
+        """
+        Adds the keys of ``data`` or of the file at ``path`` to their
+        shard, with one gpg run per shard.
+        Returns the GpgResult of the last gpg run.
+        """
+        if data is None:
+            if path is None:
+                raise GpgMissingData()
+            with open(path, 'rb') as f:
+                data = f.read()
+
+        by_shard = {}
+        key_blocks = []
+        try:
+            for key_block_data in openpgp.split_key_blocks(data):
+                key_block = self.gnupg.parse_key_block(data=key_block_data)
+                by_shard.setdefault(self.shard_for(key_block.key.fingerprint), []).append(key_block_data)
+                key_blocks.append(key_block)
+        except openpgp.OpenPGPError:
+            raise GpgInvalidKeyBlock()
+
+        result = GpgResult(0, '', '', [], False)
+        for shard, keys_data in sorted(by_shard.items()):
+            result = self.gnupg.add_key(data=''.join(keys_data), pubring=self.shard_path(shard))
+            if not result.success:
+                return result
+        self._update_index(add=key_blocks)
+        return result
+
+    def remove_key(self, keyid):
+        """See GnuPG.remove_key"""
+        return self.remove_keys([keyid])
+
+    def remove_keys(self, keyids):
+        """
+        Removes the keys with the given fingerprints from their shard, with
+        one gpg run per shard.
+        Returns the GpgResult of the last gpg run.
+        """
+        index = self.index()
+        by_shard = {}
+        for keyid in keyids:
+            shard = index.get(keyid)
+            if shard is None:
+                shard = self.shard_for(keyid)
+            by_shard.setdefault(shard, []).append(keyid)
+
+        result = GpgResult(0, '', '', [], True)
+        removed = []
+        for shard, shard_keyids in sorted(by_shard.items()):
+            result = self.gnupg.remove_keys(shard_keyids, pubring=self.shard_path(shard))
+            if not result.success:
+                break
+            removed.extend(shard_keyids)
+        self._update_index(remove=removed)
+        return result
+
+    def list_keys(self, with_colons=False):
+        """See GnuPG.list_keys"""
+        for pubring in self.keyrings():
+            for key_block in self.gnupg.list_keys(pubring=pubring, with_colons=with_colons):
+                yield key_block
+
+    def import_keyring(self, pubring):
+        """
+        Splits the keys of the monolithic keyring ``pubring`` into the
+        shards. Returns the number of imported keys.
+        """
+        data = self.gnupg.export_keys(pubring=pubring)
+        if not data:
+            return 0
+        result = self.add_key(data=data)
+        if not result.success:
+            raise GpgFailure('gpg --import failed: %s' % result.err)
+        return sum(1 for key_block_data in openpgp.split_key_blocks(data))
+
+
+#
+# Asynchronous API
+#
+
+class GpgOperation(object):
+    """
+    A gpg run scheduled by AsyncGnuPG.
+
+    gpg is started when the operation is passed to :func:`as_completed` or
+    :func:`gather`, or when :meth:`result` is called. Its output is parsed
+    by ``parse(out, err, status, code)`` once it exits. ``on_exit()`` is
+    called once a started gpg process has exited, whatever the outcome:
+    timeout, parsing failure or operation abandoned.
+    """
+
+    def __init__(self, gnupg, parse, stdin=None, args=None, pubring=None, homedir=None, on_exit=None):
+        self.gnupg = gnupg
+        self.parse = parse
+        self.stdin = stdin
+        self.args = args
+        self.pubring = pubring
+        self.homedir = homedir
+        self.on_exit = on_exit
+
+        self.done = False
+        self._result = None
+        self._exception = None
+
+    @classmethod
+    def completed(cls, gnupg, result=None, exception=None):
+        """Returns an operation that doesn't need to run gpg"""
+        operation = cls(gnupg, parse=None)
+        operation._set_result(result, exception)
+        return operation
+
+    def _set_result(self, result=None, exception=None):
+        self._result = result
+        self._exception = exception
+        self.done = True
+
+    def start(self, wait=None):
+        """Start gpg, and return the GpgProcessIO servicing its pipes"""
+        return self.gnupg._start(stdin=self.stdin, args=self.args, pubring=self.pubring, wait=wait,
+                                 homedir=self.homedir)
+
+    def exited(self):
+        """Called once the gpg process of the operation has exited"""
+        if self.on_exit is not None:
+            on_exit, self.on_exit = self.on_exit, None
+            on_exit()
+
+    def finish(self, io):
+        """Parse the output of the gpg process serviced by ``io``"""
+        self.exited()
+        if io.timed_out:
+            self._set_exception(GpgTimeout('gpg ran for more than %s seconds' % self.gnupg.timeout))
+            return
+        try:
+            self._set_result(self.parse(*io.result()))
+        except GpgBaseException as e:
+            self._set_exception(e)
+
+    def _set_exception(self, exception):
+        self._set_result(exception=exception)
+
+    def exception(self):
+        """Runs gpg if needed, and returns the exception it raised, if any"""
+        if not self.done:
+            for operation in as_completed([self]):
+                pass
+        return self._exception
+
+    def result(self):
+        """Runs gpg if needed, and returns the parsed result"""
+        exception = self.exception()
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+def as_completed(operations, concurrency=None):
+    """
+    Run the given GpgOperation objects, with at most ``concurrency`` gpg
+    processes at once, and yield them as they complete.
+
+    All the gpg processes are serviced by the calling thread. Failures,
+    including the OSError of a gpg process that couldn't be started, are
+    stored in the operations, see :meth:`GpgOperation.exception`. The gpg
+    processes still running when the iteration is stopped are killed.
+    """
+    queue = deque()
+    for operation in operations:
+        if operation.done:
+            yield operation
+        else:
+            queue.append(operation)
+
+    running = {}
+    try:
+        for operation in _run_operations(queue, running, concurrency):
+            yield operation
+    finally:
+        for io, operation in running.items():
+            io.kill()
+            io.process.wait()
+            io.close()
+            operation.exited()
+
+
+def _run_operations(queue, running, concurrency):
+    """Start the operations of ``queue``, keeping the running ones in ``running``; see as_completed"""
+    blocked = False
+    while queue or running:
+        while queue and not blocked and (concurrency is None or len(running) < concurrency):
+            operation = queue[0]
+            try:
+                # Our own running processes may be holding all the slots of
+                # the limiter: don't wait for them, they get serviced below.
+                io = operation.start(wait=0 if running else None)
+            except GpgOverloaded as e:
+                if running:
+                    # Try again once one of them is done
+                    blocked = True
+                    break
+                queue.popleft()
+                operation._set_exception(e)
+                yield operation
+            except (GpgBaseException, EnvironmentError) as e:
+                queue.popleft()
+                operation._set_exception(e)
+                yield operation
+            else:
+                queue.popleft()
+                running[io] = operation
+
+        if running:
+            for io in poll(list(running)):
+                blocked = False
+                operation = running.pop(io)
+                operation.finish(io)
+                yield operation
+
+
+def gather(operations, concurrency=None, return_exceptions=False):
+    """
+    Run the given GpgOperation objects, with at most ``concurrency`` gpg
+    processes at once, and return their results in order.
+
+    If ``return_exceptions`` is True, failures are returned in place of the
+    results, else the first failure is raised once all the operations are
+    done.
+    """
+    operations = list(operations)
+    for operation in as_completed(operations, concurrency):
+        pass
+
+    results = []
+    for operation in operations:
+        exception = operation.exception()
+        if exception is not None and not return_exceptions:
+            raise exception
+        results.append(exception if exception is not None else operation.result())
+    return results
+
+
+class AsyncGnuPG(GnuPG):
+    """
+    GnuPG wrapper whose operations return a GpgOperation instead of waiting
+    for gpg to finish, so that many gpg processes can be run at once by a
+    single thread.
+
+    The results are the same as the ones of the GnuPG methods.
+    """
+
+    def verify_file(self, path=None, file_object=None, data=None, pubring=None):
+        return self._verify_operation(path, file_object, data, pubring)
 
-        process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   stdout=subprocess.PIPE)
-        (output, outerr) = process.communicate(input=stdin)
-        code = process.returncode
-        os.close(out_status_fd)
+    def sign_detached(self, data=None, path=None, keyid=None):
+        return self._sign_operation(data, path, keyid)
 
-        with os.fdopen(in_status_fd, 'r') as f:
-            striplen = len('[GNUPG:] ')
-            status = []
-            for line in f.readlines():
-                status.append(line[striplen:].split())
+    def clearsign(self, data=None, path=None, keyid=None):
+        return self._sign_operation(data, path, keyid, clearsign=True)
 
-        return (output, outerr, status, code)
+    def parse_key_block(self, data=None, path=None):
+        if data is not None and self.key_block_cache is not None:
+            digest = self.key_block_cache.digest(data)
+            key_block = self.key_block_cache.get(digest)
+            if key_block is None:
+                key_block = self._parse_key_block_in_process(data)
+                if key_block is not None:
+                    self.key_block_cache.set(digest, key_block)
+            if key_block is not None:
+                return GpgOperation.completed(self, key_block)
+
+            def parse(out, err, status, code):
+                key_block = self._parse_key_block_result(out, err, code)
+                self.key_block_cache.set(digest, key_block)
+                return key_block
+        else:
+            key_block = self._parse_key_block_in_process(data, path)
+            if key_block is not None:
+                return GpgOperation.completed(self, key_block)
+
+            def parse(out, err, status, code):
+                return self._parse_key_block_result(out, err, code)
+
+        (stdin, args) = self._key_block_input(data, path)
+        return GpgOperation(self, parse, stdin, args)
+
+    def add_key(self, data=None, path=None, pubring=None):
+        # gpg may have changed the keyring even if it timed out or failed
+        (stdin, args) = self._add_key_input(data, path)
+        return GpgOperation(self, self._parse_add_key_result, stdin, args, pubring,
+                            on_exit=lambda: self.bump_keyring_generation(pubring))
+
+    def remove_key(self, keyid, pubring=None):
+        args = ('--yes', '--delete-key', keyid)
+        return GpgOperation(self, self._parse_remove_key_result, args=args, pubring=pubring,
+                            on_exit=lambda: self.bump_keyring_generation(pubring))
+
+    def list_keys(self, pubring=None, with_colons=False):
+        """The result is a list of GpgKeyBlock"""
+        if with_colons:
+            args = ('--with-colons', '--fixed-list-mode', '--list-keys')
+
+            def parse(out, err, status, code):
+                return list(self._parse_colons_listing(out.splitlines()))
+        else:
+            args = ('--list-keys',)
+
+            def parse(out, err, status, code):
+                if code:
+                    return []
+                return list(self._parse_key_listing(out.splitlines()[2:]))
+
+        return GpgOperation(self, parse, args=args, pubring=pubring)
+
+    def verify_files(self, paths, pubring=None, concurrency=None, return_exceptions=False):
+        """
+        Verify the signatures of the files at ``paths``, running at most
+        ``concurrency`` gpg processes at once. Returns the list of their
+        GpgFileSignature, see :func:`gather` for ``return_exceptions``.
+        """
+        operations = [self.verify_file(path=path, pubring=pubring) for path in paths]
+        return gather(operations, concurrency, return_exceptions)
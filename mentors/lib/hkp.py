@@ -0,0 +1,147 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/hkp.py: HKP keyserver client
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Minimal client for the HTTP Keyserver Protocol, fetching public keys by
+fingerprint with conditional requests.
+"""
+
+import httplib
+import socket
+import urllib
+import urllib2
+import urlparse
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+# Default ports of the hkp:// and hkps:// schemes
+HKP_PORTS = {'hkp': 11371, 'hkps': 443}
+
+# Status of a HKPResult
+KEY_MODIFIED = 'modified'
+KEY_NOT_MODIFIED = 'not-modified'
+KEY_NOT_FOUND = 'not-found'
+
+HKPResult = namedtuple('HKPResult',
+                       ['fingerprint',
+                        'status',  # KEY_MODIFIED, KEY_NOT_MODIFIED or KEY_NOT_FOUND
+                        'data',  # the armored key block, if modified
+                        'etag',  # validators for the next conditional request
+                        'last_modified',
+                        ])
+
+
+class HKPError(Exception):
+    """The keyserver couldn't be reached, or answered with an error"""
+
+
+class HKPClient(object):
+    """
+    Fetches keys from the keyserver at ``url`` (``hkp://``, ``hkps://``,
+    ``http://`` or ``https://``), giving up on each request after
+    ``timeout`` seconds.
+    """
+
+    def __init__(self, url, timeout=30):
+        self.base_url = self.http_url(url)
+        self.timeout = timeout
+        self._opener = urllib2.build_opener()
+
+    @staticmethod
+    def http_url(url):
+        """The http(s) URL of the keyserver at ``url``"""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in HKP_PORTS:
+            return url.rstrip('/')
+        netloc = parts.netloc
+        if parts.port is None:
+            netloc = '%s:%d' % (netloc, HKP_PORTS[parts.scheme])
+        scheme = 'https' if parts.scheme == 'hkps' else 'http'
+        return urlparse.urlunsplit((scheme, netloc, parts.path.rstrip('/'), '', ''))
+
+    def lookup_url(self, fingerprint):
+        return '%s/pks/lookup?%s' % (self.base_url, urllib.urlencode([
+            ('op', 'get'),
+            ('options', 'mr'),
+            ('search', '0x%s' % fingerprint),
+        ]))
+
+    def fetch_key(self, fingerprint, etag=None, last_modified=None):
+        """
+        Fetch the key with the given fingerprint. If ``etag`` or
+        ``last_modified`` are given, the keyserver may answer that the key
+        didn't change since they were returned.
+
+        Returns a HKPResult, raises HKPError.
+        """
+        request = urllib2.Request(self.lookup_url(fingerprint))
+        if etag:
+            request.add_header('If-None-Match', etag)
+        if last_modified:
+            request.add_header('If-Modified-Since', last_modified)
+
+        try:
+            response = self._opener.open(request, timeout=self.timeout)
+            try:
+                data = response.read()
+            finally:
+                response.close()
+        except urllib2.HTTPError as e:
+            if e.code == 304:
+                return HKPResult(fingerprint, KEY_NOT_MODIFIED, None, etag, last_modified)
+            if e.code == 404:
+                return HKPResult(fingerprint, KEY_NOT_FOUND, None, None, None)
+            raise HKPError('%s: HTTP error %d' % (fingerprint, e.code))
+        except (urllib2.URLError, httplib.HTTPException, socket.error) as e:
+            raise HKPError('%s: %s' % (fingerprint, getattr(e, 'reason', e)))
+
+        headers = response.info()
+        return HKPResult(fingerprint, KEY_MODIFIED, data, headers.get('ETag'), headers.get('Last-Modified'))
+
+    def fetch_keys(self, requests, concurrency=4):
+        """
+        Fetch many keys, with at most ``concurrency`` requests at once.
+
+        ``requests`` is an iterable of (fingerprint, etag, last_modified)
+        tuples. Yields a (fingerprint, HKPResult, None) or a (fingerprint,
+        None, HKPError) tuple for each of them, as the requests complete.
+        """
+        def fetch(request):
+            try:
+                return request[0], self.fetch_key(*request), None
+            except HKPError as e:
+                return request[0], None, e
+
+        pool = ThreadPool(concurrency)
+        try:
+            for result in pool.imap_unordered(fetch, requests):
+                yield result
+        finally:
+            pool.terminate()
@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/middleware.py: "site-wide" middleware
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.http import HttpResponse
+from django.utils.translation import ugettext as _
+
+from .gnupg import GpgOverloaded
+
+
+class GpgOverloadedMiddleware(object):
+    """Answers "503 Service Unavailable" when too many gpg processes are running"""
+
+    retry_after = 30
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, GpgOverloaded):
+            response = HttpResponse(_("The server is overloaded, please try again later."),
+                                    content_type='text/plain; charset=utf-8', status=503)
+            response['Retry-After'] = str(self.retry_after)
+            return response
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+#
+# lib/openpgp.py — Minimal OpenPGP packet reader
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Pure-Python reader for the subset of OpenPGP (RFC 4880) needed to describe
+a public key block: ASCII armor, packet framing, version 4 public keys and
+subkeys, and user ids. It also finds the issuers of signatures.
+
+Anything else (older or newer key versions, elliptic curve keys, partial
+body lengths...) raises UnsupportedOpenPGP, so that callers can fall back
+to gpg.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import binascii
+import bz2
+import hashlib
+import struct
+import zlib
+from collections import namedtuple
+
+
+#
+# Packet tags and algorithms
+#
+
+TAG_SIGNATURE = 2
+TAG_ONE_PASS_SIGNATURE = 4
+TAG_PUBLIC_KEY = 6
+TAG_COMPRESSED_DATA = 8
+TAG_TRUST = 12
+TAG_USER_ID = 13
+TAG_PUBLIC_SUBKEY = 14
+
+# Number of MPIs in the key material, for the algorithms we know the
+# strength of (the size of their first MPI)
+KEY_MPI_COUNTS = {
+    1: 2,  # RSA: n, e
+    2: 2,  # RSA encrypt-only
+    3: 2,  # RSA sign-only
+    16: 3,  # ElGamal encrypt-only: p, g, y
+    17: 4,  # DSA: p, q, g, y
+    20: 3,  # ElGamal
+}
+
+# Signature subpackets
+SUBPACKET_ISSUER = 16
+SUBPACKET_ISSUER_FINGERPRINT = 33
+
+ARMOR_BEGIN = '-----BEGIN PGP %s-----'
+ARMOR_END = '-----END PGP %s-----'
+PUBLIC_KEY_BLOCK = 'PUBLIC KEY BLOCK'
+
+CRC24_INIT = 0xB704CE
+CRC24_POLY = 0x1864CFB
+
+
+#
+# Result objects
+#
+
+PublicKey = namedtuple('PublicKey',
+                       ['algorithm',  # OpenPGP algorithm id
+                        'strength',  # in bits
+                        'created',  # timestamp
+                        'fingerprint',  # upper-case hex
+                        ])
+
+
+KeyBlock = namedtuple('KeyBlock',
+                      ['key',  # PublicKey
+                       'user_ids',  # list of unicode strings
+                       'subkeys',  # list of PublicKey
+                       ])
+
+
+#
+# Exceptions
+#
+
+class OpenPGPError(Exception):
+    """Malformed OpenPGP data"""
+
+
+class UnsupportedOpenPGP(OpenPGPError):
+    """Valid OpenPGP data this module doesn't know how to read"""
+
+
+#
+# Armor
+#
+
+def _crc24_table():
+    table = []
+    for byte in xrange(256):
+        crc = byte << 16
+        for i in xrange(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= CRC24_POLY
+        table.append(crc & 0xFFFFFF)
+    return table
+
+CRC24_TABLE = _crc24_table()
+
+
+def crc24(data):
+    """Returns the CRC-24 of ``data``, as used in the armor checksum"""
+    crc = CRC24_INIT
+    table = CRC24_TABLE
+    for byte in bytearray(data):
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+
+def dearmor(data, block=PUBLIC_KEY_BLOCK):
+    """
+    Returns the binary content of the ASCII-armored ``block`` (by default,
+    a public key block) in ``data``. Binary data is returned as is.
+    """
+    if isinstance(data, unicode):
+        try:
+            data = data.encode('ascii')
+        except UnicodeEncodeError:
+            raise OpenPGPError('Non-ASCII armored data')
+
+    armor_begin = ARMOR_BEGIN % block
+    armor_end = ARMOR_END % block
+
+    start = data.find(armor_begin)
+    if start == -1:
+        if data and ord(data[0]) & 0x80:
+            return data
+        raise OpenPGPError('No %s found' % block.lower())
+
+    lines = iter(data[start + len(armor_begin):].splitlines()[1:])
+
+    # Armor headers, up to an empty line
+    for line in lines:
+        line = line.strip()
+        if not line:
+            break
+        if ':' not in line:
+            raise OpenPGPError('Invalid armor header')
+
+    body = []
+    checksum = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('-----'):
+            if line != armor_end:
+                raise OpenPGPError('Invalid armor tail')
+            break
+        if line.startswith('='):
+            checksum = line[1:]
+        elif line:
+            body.append(line)
+    else:
+        raise OpenPGPError('Truncated armor')
+
+    if data.find(armor_begin, start + len(armor_begin)) != -1:
+        raise UnsupportedOpenPGP('Several armored blocks')
+
+    try:
+        packets = binascii.a2b_base64(''.join(body))
+        if checksum is not None:
+            (crc,) = struct.unpack('>I', '\0' + binascii.a2b_base64(checksum))
+    except (binascii.Error, struct.error):
+        raise OpenPGPError('Invalid armor encoding')
+
+    if checksum is not None and crc != crc24(packets):
+        raise OpenPGPError('Armor checksum mismatch')
+
+    return packets
+
+
+def armor(data):
+    """Returns the ASCII armor of the binary public key block ``data``"""
+    body = binascii.b2a_base64(data).replace('\n', '')
+    lines = [ARMOR_BEGIN % PUBLIC_KEY_BLOCK, '']
+    lines.extend(body[i:i + 64] for i in xrange(0, len(body), 64))
+    lines.append('=' + binascii.b2a_base64(struct.pack('>I', crc24(data))[1:]).strip())
+    lines.append(ARMOR_END % PUBLIC_KEY_BLOCK)
+    return '\n'.join(lines) + '\n'
+
+
+#
+# Packets
+#
+
+def iter_packets(data):
+    """Yields the (tag, body) of the OpenPGP packets in ``data``"""
+    for tag, start, body_start, end in _iter_packet_offsets(data):
+        yield tag, data[body_start:end]
+
+
+def _iter_packet_offsets(data):
+    """
+    Yields the tag, and the offsets of the start, body and end of the
+    OpenPGP packets in ``data``
+    """
+    offset = 0
+    end = len(data)
+
+    while offset < end:
+        start = offset
+        header = ord(data[offset])
+        if not header & 0x80:
+            raise OpenPGPError('Invalid packet header')
+
+        if header & 0x40:
+            # New format
+            tag = header & 0x3F
+            if offset + 1 >= end:
+                raise OpenPGPError('Truncated packet header')
+            first = ord(data[offset + 1])
+            if first < 192:
+                length = first
+                offset += 2
+            elif first < 224:
+                if offset + 2 >= end:
+                    raise OpenPGPError('Truncated packet header')
+                length = ((first - 192) << 8) + ord(data[offset + 2]) + 192
+                offset += 3
+            elif first == 255:
+                if offset + 5 >= end:
+                    raise OpenPGPError('Truncated packet header')
+                (length,) = struct.unpack('>I', data[offset + 2:offset + 6])
+                offset += 6
+            else:
+                raise UnsupportedOpenPGP('Partial body lengths')
+        else:
+            # Old format
+            tag = (header >> 2) & 0x0F
+            length_type = header & 0x03
+            if length_type == 3:
+                length = end - offset - 1
+                offset += 1
+            else:
+                size = 1 << length_type
+                if offset + size >= end:
+                    raise OpenPGPError('Truncated packet header')
+                (length,) = struct.unpack('>' + 'BHI'[length_type], data[offset + 1:offset + 1 + size])
+                offset += 1 + size
+
+        if offset + length > end:
+            raise OpenPGPError('Truncated packet')
+        yield tag, start, offset, offset + length
+        offset += length
+
+
+def parse_public_key(body):
+    """Returns the PublicKey for the body of a public key or subkey packet"""
+    if len(body) < 6:
+        raise OpenPGPError('Truncated public key packet')
+
+    version = ord(body[0])
+    if version != 4:
+        raise UnsupportedOpenPGP('Version %d public key' % version)
+
+    (created, algorithm) = struct.unpack('>IB', body[1:6])
+    if algorithm not in KEY_MPI_COUNTS:
+        raise UnsupportedOpenPGP('Public key algorithm %d' % algorithm)
+
+    # Walk the MPIs to check the packet isn't truncated
+    offset = 6
+    strength = None
+    for i in xrange(KEY_MPI_COUNTS[algorithm]):
+        if offset + 2 > len(body):
+            raise OpenPGPError('Truncated public key packet')
+        (bits,) = struct.unpack('>H', body[offset:offset + 2])
+        if strength is None:
+            strength = bits
+        offset += 2 + (bits + 7) // 8
+    if offset > len(body):
+        raise OpenPGPError('Truncated public key packet')
+
+    fingerprint = hashlib.sha1('\x99' + struct.pack('>H', len(body)) + body).hexdigest().upper()
+
+    return PublicKey(algorithm, strength, created, fingerprint)
+
+
+def parse_key_block(data):
+    """
+    Returns the KeyBlock for the (armored or binary) public key block in
+    ``data``, which must hold exactly one primary key.
+    """
+    key = None
+    user_ids = []
+    subkeys = []
+
+    for tag, body in iter_packets(dearmor(data)):
+        if tag == TAG_PUBLIC_KEY:
+            if key is not None:
+                raise UnsupportedOpenPGP('Several public keys')
+            key = parse_public_key(body)
+        elif key is None:
+            raise OpenPGPError('Key block not starting with a public key')
+        elif tag == TAG_USER_ID:
+            user_ids.append(body.decode('utf-8', 'replace'))
+        elif tag == TAG_PUBLIC_SUBKEY:
+            subkeys.append(parse_public_key(body))
+
+    if key is None:
+        raise OpenPGPError('No public key found')
+
+    return KeyBlock(key, user_ids, subkeys)
+
+
+def split_key_blocks(data):
+    """
+    Yields the binary public key blocks, one per primary key, of the
+    keyring or of the (possibly several) armored key blocks in ``data``.
+
+    The gpg trust packets of keyring files are left out.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('ascii', 'replace')
+
+    armor_begin = ARMOR_BEGIN % PUBLIC_KEY_BLOCK
+    if armor_begin in data:
+        keyrings = [dearmor(armor_begin + block) for block in data.split(armor_begin)[1:]]
+    else:
+        keyrings = [data]
+
+    for keyring in keyrings:
+        packets = []
+        for tag, start, body_start, end in _iter_packet_offsets(keyring):
+            if tag == TAG_PUBLIC_KEY and packets:
+                yield ''.join(packets)
+                packets = []
+            elif not packets and tag != TAG_PUBLIC_KEY:
+                raise OpenPGPError('Key block not starting with a public key')
+            if tag != TAG_TRUST:
+                packets.append(keyring[start:end])
+        if packets:
+            yield ''.join(packets)
+
+
+#
+# Signatures
+#
+
+def signature_issuers(data):
+    """
+    Returns the issuers of the signatures in ``data`` (a signed message,
+    clear-signed or not, or a detached signature): the fingerprints or
+    the long key ids (both in upper-case hex) found in their signature
+    packets.
+
+    Only the issuers found before the first packet this module can't read
+    are returned; none if the armor itself can't be read.
+    """
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+
+    issuers = []
+    try:
+        for block in ('SIGNATURE', 'MESSAGE'):
+            if ARMOR_BEGIN % block in data:
+                data = dearmor(data, block)
+                break
+        _find_issuers(data, issuers)
+    except (OpenPGPError, struct.error, zlib.error, IOError):
+        pass
+    return issuers
+
+
+def _find_issuers(data, issuers):
+    for tag, body in iter_packets(data):
+        if tag == TAG_ONE_PASS_SIGNATURE:
+            if len(body) == 13:
+                _add_issuer(issuers, body[4:12])
+        elif tag == TAG_SIGNATURE:
+            _signature_issuers(body, issuers)
+        elif tag == TAG_COMPRESSED_DATA:
+            algorithm = ord(body[0])
+            if algorithm == 0:
+                _find_issuers(body[1:], issuers)
+            elif algorithm == 1:
+                _find_issuers(zlib.decompress(body[1:], -15), issuers)
+            elif algorithm == 2:
+                _find_issuers(zlib.decompress(body[1:]), issuers)
+            elif algorithm == 3:
+                _find_issuers(bz2.decompress(body[1:]), issuers)
+
+
+def _add_issuer(issuers, issuer):
+    issuer = binascii.hexlify(issuer).upper()
+    if issuer not in issuers:
+        issuers.append(issuer)
+
+
+def _signature_issuers(body, issuers):
+    version = ord(body[0])
+    if version == 3:
+        _add_issuer(issuers, body[7:15])
+        return
+    if version != 4:
+        return
+
+    offset = 4
+    for i in xrange(2):
+        (length,) = struct.unpack('>H', body[offset:offset + 2])
+        offset += 2
+        end = offset + length
+        while offset < end:
+            first = ord(body[offset])
+            if first < 192:
+                (size, offset) = (first, offset + 1)
+            elif first < 255:
+                (size, offset) = (((first - 192) << 8) + ord(body[offset + 1]) + 192, offset + 2)
+            else:
+                (size,) = struct.unpack('>I', body[offset + 1:offset + 5])
+                offset += 5
+            subpacket_type = ord(body[offset]) & 0x7F
+            if subpacket_type == SUBPACKET_ISSUER_FINGERPRINT and size == 22 and ord(body[offset + 1]) == 4:
+                _add_issuer(issuers, body[offset + 2:offset + size])
+            elif subpacket_type == SUBPACKET_ISSUER and size == 9:
+                _add_issuer(issuers, body[offset + 1:offset + size])
+            offset += size
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/bench_deb822.py — Benchmarks for the deb822 reader
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmarks for lib.deb822, against python-debian when it is installed.
+
+Run them from the mentors directory with::
+
+    python -m lib.tests.bench_deb822 [--paragraphs N | --packages FILE]
+        [--json FILE]
+
+Without ``--packages``, a synthetic Packages file of ``--paragraphs``
+paragraphs is generated. The results written with ``--json`` carry the
+commit and the python-debian version they were measured with.
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+
+from .. import deb822
+from .bench_gnupg import _command_output, timed
+
+try:
+    from debian import deb822 as debian_deb822
+except ImportError:
+    debian_deb822 = None
+
+
+def synthetic_packages(count):
+    """A temporary Packages file of ``count`` paragraphs"""
+    f = tempfile.TemporaryFile()
+    for i in xrange(count):
+        f.write('Package: package-%d\n' % i)
+        f.write('Version: %d.0-1\n' % i)
+        f.write('Architecture: amd64\n')
+        f.write('Maintainer: Maintainer %d <maintainer-%d@example.com>\n' % (i, i))
+        f.write('Installed-Size: %d\n' % (i % 10000))
+        f.write('Depends: libc6 (>= 2.14), package-%d (= %d.0-1)\n' % (i + 1, i + 1))
+        f.write('Section: devel\n')
+        f.write('Priority: optional\n')
+        f.write('Filename: pool/main/p/package-%d/package-%d_%d.0-1_amd64.deb\n' % (i, i, i))
+        f.write('Size: %d\n' % (i * 7 % 100000))
+        f.write('MD5sum: %032x\n' % i)
+        f.write('SHA256: %064x\n' % i)
+        f.write('Description: Generated package %d\n' % i)
+        f.write(' This package was generated to benchmark the deb822 parsers.\n')
+        f.write(' .\n')
+        f.write(' It has a multi-line description, as most packages do.\n')
+        f.write('\n')
+    f.seek(0)
+    return f
+
+
+def bench_parsers(f, count):
+    def lib_iter():
+        f.seek(0)
+        return sum(1 for paragraph in deb822.iter_paragraphs(f))
+
+    def lib_fields():
+        f.seek(0)
+        return sum(1 for paragraph in deb822.iter_paragraphs(f) if paragraph['Package'] and paragraph['Version'])
+
+    def lib_all_fields():
+        f.seek(0)
+        return sum(len(dict(paragraph)) for paragraph in deb822.iter_paragraphs(f))
+
+    results = [
+        timed('deb822/paragraphs', count, lib_iter),
+        timed('deb822/package+version', count, lib_fields),
+        timed('deb822/all fields', count, lib_all_fields),
+    ]
+
+    if debian_deb822 is not None:
+        def debian_fields():
+            f.seek(0)
+            return sum(1 for paragraph in debian_deb822.Packages.iter_paragraphs(f, use_apt_pkg=False)
+                       if paragraph['Package'] and paragraph['Version'])
+
+        results.append(timed('python-debian/package+version', count, debian_fields))
+
+    return results
+
+
+def write_json(results, path):
+    """Write the results and the environment they were measured in"""
+    document = {
+        'commit': _command_output(['git', 'rev-parse', 'HEAD']),
+        'python_debian_version': getattr(debian_deb822, '__version__', None) if debian_deb822 else None,
+        'python_version': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, separators=(',', ': '), sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, default=200000,
+                        help='number of paragraphs of the synthetic Packages file')
+    parser.add_argument('--packages', metavar='FILE', help='benchmark this Packages file instead')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE, as JSON')
+    options = parser.parse_args()
+
+    if options.packages:
+        f = open(options.packages, 'rb')
+        count = sum(1 for paragraph in deb822.iter_paragraphs(f))
+    else:
+        f = synthetic_packages(options.paragraphs)
+        count = options.paragraphs
+
+    if debian_deb822 is None:
+        print 'python-debian is not installed, only benchmarking lib.deb822'
+
+    results = bench_parsers(f, count)
+    for item in results:
+        print '%(benchmark)-30s %(items)8d items %(seconds)8.3fs %(items_per_second)10.0f items/s %(max_rss_kb)8d kB' % item
+
+    if options.json:
+        write_json(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/bench_gnupg.py — Benchmarks for the GnuPG wrapper
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmarks for lib.gnupg.
+
+Run them from the mentors directory with::
+
+    python -m lib.tests.bench_gnupg [--keys N] [--key-blocks N]
+        [--keyring-sizes N,N,...] [--rounds N] [--json FILE]
+
+The results written with ``--json`` carry the commit and the gpg version
+they were measured with, so that runs can be compared across commits.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+
+from .. import openpgp
+from ..gnupg import GnuPG, GPG_STATUS_PREFIX
+from .test_gnupg import clement_gpg_key, test_gpg_key
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'gpg')
+
+
+def synthetic_listings(count):
+    """
+    Write listings of ``count`` keys, in gpg 1's human-readable format and
+    in the --with-colons format, to two temporary files.
+    """
+    human = tempfile.TemporaryFile()
+    colons = tempfile.TemporaryFile()
+
+    human.write('/var/lib/mentors/gpg/pubring.gpg\n')
+    human.write('--------------------------------\n')
+    colons.write('tru::1:1381363200:0:3:1:5\n')
+
+    for i in xrange(count):
+        fpr = '%040X' % (0xE4BA6F4097B08D5AE8DC68C95E39E0E300000000 + i)
+        sub_fpr = '%040X' % (0xAFAFBBB1FF03E66297DB2934CFF4370000000000 + i)
+        human.write('pub   4096R/%s 2011-10-12\n' % fpr[-8:])
+        human.write('      Key fingerprint = %s\n' % ' '.join(
+            [' '.join(fpr[j:j + 4] for j in range(0, 20, 4)), ' '.join(fpr[j:j + 4] for j in range(20, 40, 4))]))
+        human.write('uid                  Key Owner %d <owner%d@example.com>\n' % (i, i))
+        human.write('uid                  Key Owner %d <owner%d@example.org>\n' % (i, i))
+        human.write('sub   4096R/%s 2011-10-12\n' % sub_fpr[-8:])
+        human.write('\n')
+
+        colons.write('pub:-:4096:1:%s:1318409866:::-:::scESC::::::23::0:\n' % fpr[-16:])
+        colons.write('fpr:::::::::%s:\n' % fpr)
+        colons.write('uid:-::::1318409866::%s::Key Owner %d <owner%d@example.com>::::::::::0:\n' % (fpr, i, i))
+        colons.write('uid:-::::1318409866::%s::Key Owner %d <owner%d@example.org>::::::::::0:\n' % (fpr, i, i))
+        colons.write('sub:-:4096:1:%s:1318409866::::::e::::::23:\n' % sub_fpr[-16:])
+        colons.write('fpr:::::::::%s:\n' % sub_fpr)
+
+    human.seek(0)
+    colons.seek(0)
+    return human, colons
+
+
+def _packet(tag, body):
+    """A new format OpenPGP packet"""
+    return chr(0xC0 | tag) + '\xff' + struct.pack('>I', len(body)) + body
+
+
+def synthetic_keyring(path, count):
+    """
+    Write a keyring of ``count`` keys to ``path``, followed by test_gpg_key
+    so that its signatures can be verified.
+
+    The keys are clement_gpg_key's primary key with another creation date,
+    hence another fingerprint, and a single user id. Their self-signatures
+    don't match, so gpg deems them invalid, but it lists and deletes them
+    like any other key, and generating them takes no time.
+    """
+    key = user_id_signature = None
+    for tag, body in openpgp.iter_packets(openpgp.dearmor(clement_gpg_key)):
+        if tag == openpgp.TAG_PUBLIC_KEY:
+            key = body
+        elif tag == openpgp.TAG_SIGNATURE and user_id_signature is None:
+            user_id_signature = body
+
+    with open(path, 'wb') as keyring:
+        for i in xrange(count):
+            keyring.write(_packet(openpgp.TAG_PUBLIC_KEY, key[:1] + struct.pack('>I', 1300000000 + i) + key[5:]))
+            keyring.write(_packet(openpgp.TAG_USER_ID, 'Key Owner %d <owner%d@example.com>' % (i, i)))
+            keyring.write(_packet(openpgp.TAG_SIGNATURE, user_id_signature))
+        keyring.write(openpgp.dearmor(test_gpg_key))
+
+
+def result(name, count, parsed, elapsed):
+    """The timings of a benchmark, as a dictionary"""
+    return {
+        'benchmark': name,
+        'items': count,
+        'parsed': parsed,
+        'seconds': elapsed,
+        'items_per_second': count / elapsed if elapsed else None,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def timed(name, count, function, *args):
+    """Run ``function`` and return its timings as a dictionary"""
+    start = time.time()
+    parsed = function(*args)
+    return result(name, count, parsed, time.time() - start)
+
+
+def bench_listing_parsers(count):
+    gnupg = GnuPG(gpg_path=None)
+    human, colons = synthetic_listings(count)
+
+    def parse_human():
+        # list_keys() reads the whole output before parsing it
+        lines = human.read().decode('utf-8').splitlines()[2:]
+        return sum(1 for key in gnupg._parse_key_listing(lines))
+
+    def parse_colons():
+        return sum(1 for key in gnupg._parse_colons_listing(colons))
+
+    # The colons parser runs first, so that its memory high-water mark isn't
+    # hidden by the one of the human-readable parser.
+    results = [
+        timed('list_keys/with_colons', count, parse_colons),
+        timed('list_keys/human_readable', count, parse_human),
+    ]
+    human.close()
+    colons.close()
+    return results
+
+
+def bench_key_block_parsers(count, gpg_count):
+    """
+    Parse a public key block ``count`` times in-process, and ``gpg_count``
+    times with gpg.
+    """
+    gnupg = GnuPG()
+
+    def parse_in_process():
+        return sum(1 for i in xrange(count) if gnupg._parse_key_block_in_process(clement_gpg_key))
+
+    def parse_with_gpg():
+        # Only time gpg: its output is parsed in no time
+        (stdin, args) = gnupg._key_block_input(clement_gpg_key)
+        return sum(1 for i in xrange(gpg_count) if gnupg._run(stdin, args)[3] == 0)
+
+    return [
+        timed('parse_key_block/in_process', count, parse_in_process),
+        timed('parse_key_block/gpg', gpg_count, parse_with_gpg),
+    ]
+
+
+def bench_output_parsers(count):
+    """
+    Run the parsers of gpg's output ``count`` times on recorded outputs:
+    the key blocks of a gpg 1 listing and the status lines of a signature
+    check.
+    """
+    gnupg = GnuPG(gpg_path=None)
+
+    with open(os.path.join(DATA_DIR, 'list_keys_gpg1')) as listing:
+        lines = listing.read().decode('utf-8').splitlines()[2:]
+    blocks = [block.splitlines() for block in '\n'.join(lines).split('\n\n') if block.strip()]
+
+    with open(os.path.join(DATA_DIR, 'verify_status')) as status_lines:
+        status = [line[len(GPG_STATUS_PREFIX):].split() for line in status_lines]
+
+    def parse_key_info():
+        return sum(1 for i in xrange(count) for block in blocks if gnupg._parse_key_info(block).key)
+
+    def parse_verify_result():
+        return sum(1 for i in xrange(count) if gnupg._parse_verify_result('', '', status, 0).fingerprint)
+
+    return [
+        timed('_parse_key_info', count * len(blocks), parse_key_info),
+        timed('_parse_verify_result', count, parse_verify_result),
+    ]
+
+
+def bench_keyring(size, rounds):
+    """
+    Time the keyring operations of GnuPG on a synthetic keyring of ``size``
+    keys. Keys are added and removed, and signatures are checked,
+    ``rounds`` times.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        keyring = os.path.join(directory, 'pubring.gpg')
+        synthetic_keyring(keyring, size)
+        gnupg = GnuPG(default_keyring=keyring)
+        signed_file = os.path.join(DATA_DIR, 'signed_by_355304E4.gpg')
+        fingerprint = gnupg.parse_key_block(data=clement_gpg_key).key.fingerprint
+
+        def list_keys():
+            return sum(1 for key in gnupg.list_keys(with_colons=True))
+
+        def verify_file():
+            return sum(1 for i in xrange(rounds) if gnupg.verify_file(path=signed_file).fingerprint)
+
+        # Time the additions and removals separately, as each one needs the
+        # other one to run in between
+        timings = {'add_key': [0, 0], 'remove_key': [0, 0]}
+        for i in xrange(rounds):
+            for name, function, args in (('add_key', gnupg.add_key, {'data': clement_gpg_key}),
+                                         ('remove_key', gnupg.remove_key, {'keyid': fingerprint})):
+                start = time.time()
+                if function(**args).success:
+                    timings[name][0] += 1
+                timings[name][1] += time.time() - start
+
+        return [
+            timed('list_keys/%d' % size, size + 1, list_keys),
+            result('add_key/%d' % size, rounds, timings['add_key'][0], timings['add_key'][1]),
+            result('remove_key/%d' % size, rounds, timings['remove_key'][0], timings['remove_key'][1]),
+            timed('verify_file/%d' % size, rounds, verify_file),
+        ]
+    finally:
+        shutil.rmtree(directory)
+
+
+def _command_output(args):
+    """The first line of the output of a command, or None if it fails"""
+    try:
+        return subprocess.check_output(args, stderr=open(os.devnull, 'w')).splitlines()[0]
+    except (OSError, subprocess.CalledProcessError, IndexError):
+        return None
+
+
+def write_json(results, path):
+    """Write the results and the environment they were measured in"""
+    document = {
+        'commit': _command_output(['git', 'rev-parse', 'HEAD']),
+        'gpg_version': _command_output([GnuPG().gpg_path, '--version']),
+        'python_version': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, separators=(',', ': '), sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=20000, help='number of keys in the synthetic listings')
+    parser.add_argument('--key-blocks', type=int, default=200,
+                        help='number of key blocks parsed with gpg (50 times more are parsed in-process)')
+    parser.add_argument('--keyring-sizes', default='10,1000,50000',
+                        help='comma-separated sizes of the synthetic keyrings')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='number of gpg runs for each keyring operation')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE, as JSON')
+    options = parser.parse_args()
+
+    results = bench_listing_parsers(options.keys)
+    results.extend(bench_key_block_parsers(options.key_blocks * 50, options.key_blocks))
+    results.extend(bench_output_parsers(options.key_blocks * 50))
+    for size in options.keyring_sizes.split(','):
+        results.extend(bench_keyring(int(size), options.rounds))
+
+    for item in results:
+        print '%(benchmark)-30s %(items)8d items %(seconds)8.3fs %(items_per_second)10.0f items/s %(max_rss_kb)8d kB' % item
+
+    if options.json:
+        write_json(results, options.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/test_blobstore.py — Tests for the content-addressed file storage
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Test cases for lib.blobstore.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from .. import blobstore
+
+
+class TestBlobStore(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = blobstore.BlobStore(os.path.join(self.tempdir, 'pool'))
+        self.data = os.urandom(3000)
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.path = os.path.join(self.tempdir, 'upload')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_path(self):
+        self.assertEqual(self.store.path(self.sha256),
+                         os.path.join(self.tempdir, 'pool', self.sha256[:2], self.sha256[2:4], self.sha256))
+        self.assertRaises(ValueError, self.store.path, '../../etc/passwd')
+        self.assertRaises(ValueError, self.store.path, self.sha256.upper())
+        self.assertNotIn('../../etc/passwd', self.store)
+
+    def test_add(self):
+        self.assertNotIn(self.sha256, self.store)
+
+        self.assertTrue(self.store.add(self.path, self.sha256))
+
+        self.assertIn(self.sha256, self.store)
+        with self.store.open(self.sha256) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.store.temporary_files(), [])
+
+    def test_add_mismatch(self):
+        # The file changed since its digest was computed
+        other_sha256 = hashlib.sha256(b'other').hexdigest()
+
+        self.assertRaises(blobstore.BlobStoreError, self.store.add, self.path, other_sha256)
+
+        self.assertEqual(list(self.store), [])
+        self.assertEqual(self.store.temporary_files(), [])
+
+    def test_write(self):
+        pending = self.store.write(self.path)
+
+        self.assertEqual(pending.file_digests.size, len(self.data))
+        self.assertEqual(pending.file_digests.digests['md5'], hashlib.md5(self.data).hexdigest())
+        self.assertEqual(pending.sha256, self.sha256)
+        self.assertNotIn(self.sha256, self.store)
+        self.assertEqual(self.store.temporary_files(), [pending.tmp_path])
+
+        self.assertTrue(pending.commit())
+        self.assertEqual(self.store.temporary_files(), [])
+        with self.store.open(self.sha256) as f:
+            self.assertEqual(f.read(), self.data)
+
+        # Modifying the uploaded file doesn't change the blob
+        with open(self.path, 'wb') as f:
+            f.write(b'modified')
+        with self.store.open(self.sha256) as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_write_existing(self):
+        self.store.add(self.path, self.sha256)
+        pending = self.store.write(self.path)
+
+        self.assertFalse(pending.commit())
+        self.assertEqual(self.store.temporary_files(), [])
+
+    def test_discard(self):
+        pending = self.store.write(self.path)
+        pending.discard()
+
+        self.assertEqual(self.store.temporary_files(), [])
+        self.assertEqual(list(self.store), [])
+
+    def test_locked(self):
+        lock_path = os.path.join(self.tempdir, 'pool', 'lock')
+        with self.store.locked():
+            with open(lock_path) as lock:
+                self.assertRaises(IOError, fcntl.flock, lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        with self.store.locked(exclusive=False):
+            with open(lock_path) as lock:
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                self.assertRaises(IOError, fcntl.flock, lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_add_existing(self):
+        self.store.add(self.path, self.sha256)
+        blob_path = self.store.path(self.sha256)
+        os.utime(blob_path, (0, 0))
+        inode = os.stat(blob_path).st_ino
+
+        self.assertFalse(self.store.add(self.path, self.sha256))
+
+        # Not written again, but marked as recently added
+        self.assertEqual(os.stat(blob_path).st_ino, inode)
+        self.assertNotEqual(os.stat(blob_path).st_mtime, 0)
+
+    def test_add_failure(self):
+        self.assertRaises(IOError, self.store.add, os.path.join(self.tempdir, 'missing'), self.sha256)
+
+        self.assertNotIn(self.sha256, self.store)
+        self.assertEqual(self.store.temporary_files(), [])
+
+    def test_add_waits_for_removals(self):
+        self.store.add(self.path, self.sha256)
+        added = []
+        thread = threading.Thread(target=lambda: added.append(self.store.add(self.path, self.sha256)))
+
+        with self.store.locked():
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.store.remove(self.sha256)
+        thread.join()
+
+        # Written again, as it was removed in the meantime
+        self.assertEqual(added, [True])
+        self.assertIn(self.sha256, self.store)
+
+    def test_iter_remove(self):
+        self.assertEqual(list(self.store), [])
+        other = os.path.join(self.tempdir, 'other')
+        with open(other, 'wb') as f:
+            f.write(b'other')
+        other_sha256 = hashlib.sha256(b'other').hexdigest()
+        self.store.add(self.path, self.sha256)
+        self.store.add(other, other_sha256)
+
+        self.assertEqual(sorted(self.store), sorted([self.sha256, other_sha256]))
+
+        self.store.remove(self.sha256)
+        self.store.remove(self.sha256)
+        self.assertEqual(list(self.store), [other_sha256])
+        self.assertRaises(IOError, self.store.open, self.sha256)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/test_deb822.py — Tests for the deb822 reader
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Test cases for lib.deb822.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import os
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase
+
+from .. import deb822
+from .test_gnupg import SigningKeyMixin
+
+test_dsc = """\
+Format: 3.0 (quilt)
+Source: mentors
+Binary: mentors
+Architecture: all
+Version: 1.0-1
+Maintainer: Nicolas Dandrimont <nicolas@dandrimont.eu>
+Standards-Version: 3.9.5
+Checksums-Sha1:
+ 6a9f24ae9a0bc16bc8d5b4aa10e38b2e8cd3a16b 2048 mentors_1.0.orig.tar.gz
+ 33f8b6a1d8ba97b4ac5e4a30b8e7c8a6e1d7d3e1 1024 mentors_1.0-1.debian.tar.xz
+Checksums-Sha256:
+ 0c7d5ac7b0b2f1bd6a3b8f2a9c5f0e95d5bdcc0de4e6e3fb9e4c1e4d8a1c2b3e 2048 mentors_1.0.orig.tar.gz
+ 9F86D081884C7D659A2FEAA0C55AD015A3BF4F1B2B0B822CD15D6C15B0F00A08 1024 mentors_1.0-1.debian.tar.xz
+Files:
+ d41d8cd98f00b204e9800998ecf8427e 2048 mentors_1.0.orig.tar.gz
+ 900150983cd24fb0d6963f7d28e17f72 1024 mentors_1.0-1.debian.tar.xz
+"""
+
+test_packages = """\
+Package: mentors
+Version: 1.0-1
+Architecture: all
+Description: Debian mentors website
+ The website helping people get their packages into Debian.
+ .
+ It checks the uploads, and lists them for the sponsors.
+
+Package: debexpo
+Version: 0.1-1
+Architecture: all
+Description: Former Debian mentors website
+  \t
+PACKAGE: not-a-paragraph
+Version: 0.2-1
+"""
+
+
+class TestParagraph(TestCase):
+    def test_fields(self):
+        paragraph, = deb822.iter_paragraphs(test_dsc)
+
+        self.assertEqual(paragraph['Source'], 'mentors')
+        self.assertEqual(paragraph['source'], 'mentors')
+        self.assertEqual(paragraph['Checksums-Sha1'].splitlines()[1],
+                         ' 6a9f24ae9a0bc16bc8d5b4aa10e38b2e8cd3a16b 2048 mentors_1.0.orig.tar.gz')
+        self.assertEqual(list(paragraph)[:3], ['Format', 'Source', 'Binary'])
+        self.assertEqual(len(paragraph), 10)
+        self.assertIn('STANDARDS-VERSION', paragraph)
+        self.assertNotIn('Uploaders', paragraph)
+        self.assertEqual(paragraph.get('Uploaders', ''), '')
+        self.assertRaises(KeyError, lambda: paragraph['Uploaders'])
+        self.assertEqual(paragraph.raw, test_dsc)
+
+    def test_lazy(self):
+        paragraphs = list(deb822.iter_paragraphs(test_packages))
+
+        self.assertEqual(len(paragraphs), 3)
+        self.assertTrue(all(paragraph._fields is None for paragraph in paragraphs))
+        self.assertEqual(paragraphs[1]['Package'], 'debexpo')
+        self.assertIsNone(paragraphs[0]._fields)
+
+    def test_multiline(self):
+        paragraphs = list(deb822.iter_paragraphs(test_packages))
+
+        self.assertEqual(paragraphs[0]['Description'].splitlines(), [
+            'Debian mentors website',
+            ' The website helping people get their packages into Debian.',
+            ' .',
+            ' It checks the uploads, and lists them for the sponsors.',
+        ])
+        # Whitespace-only lines separate paragraphs
+        self.assertEqual(paragraphs[1]['Description'], 'Former Debian mentors website')
+        self.assertEqual(paragraphs[2]['Package'], 'not-a-paragraph')
+
+    def test_checksums(self):
+        paragraph, = deb822.iter_paragraphs(test_dsc)
+
+        self.assertEqual(paragraph.checksums('Checksums-Sha256')[1], deb822.ChecksumEntry(
+            '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08', 1024, 'mentors_1.0-1.debian.tar.xz'))
+        self.assertEqual([entry.name for entry in paragraph.checksums('Files')],
+                         ['mentors_1.0.orig.tar.gz', 'mentors_1.0-1.debian.tar.xz'])
+
+        # .changes files have section and priority columns
+        changes, = deb822.iter_paragraphs('Files:\n 900150983cd24fb0d6963f7d28e17f72 1024 web optional mentors.deb\n')
+        self.assertEqual(changes.checksums('Files'),
+                         [deb822.ChecksumEntry('900150983cd24fb0d6963f7d28e17f72', 1024, 'mentors.deb')])
+
+        invalid, = deb822.iter_paragraphs('Files:\n 900150983cd24fb0d6963f7d28e17f72 mentors.deb\n')
+        self.assertRaises(deb822.Deb822Error, invalid.checksums, 'Files')
+
+    def test_invalid(self):
+        paragraph, = deb822.iter_paragraphs(' continued\nSource: mentors\n')
+        self.assertRaises(deb822.Deb822Error, paragraph.get, 'Source')
+
+        paragraph, = deb822.iter_paragraphs(' not a field\n')
+        self.assertRaises(deb822.Deb822Error, len, paragraph)
+
+
+class TestIterParagraphs(TestCase):
+    def test_blank_lines(self):
+        paragraphs = list(deb822.iter_paragraphs('\n\nSource: a\n\n\n \nSource: b'))
+        self.assertEqual([paragraph['Source'] for paragraph in paragraphs], ['a', 'b'])
+        self.assertEqual(list(deb822.iter_paragraphs('\n  \n')), [])
+
+    def test_file(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(test_packages)
+            f.seek(0)
+            paragraphs = list(deb822.iter_paragraphs(f))
+
+        self.assertEqual([paragraph['Version'] for paragraph in paragraphs], ['1.0-1', '0.1-1', '0.2-1'])
+
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual(list(deb822.iter_paragraphs(f)), [])
+
+    def test_file_object(self):
+        chunk_size = deb822.READ_CHUNK_SIZE
+        deb822.READ_CHUNK_SIZE = 7
+        try:
+            paragraphs = list(deb822.iter_paragraphs(StringIO(test_packages)))
+        finally:
+            deb822.READ_CHUNK_SIZE = chunk_size
+
+        self.assertEqual([paragraph['Package'] for paragraph in paragraphs], ['mentors', 'debexpo', 'not-a-paragraph'])
+        self.assertEqual(paragraphs[0]['Description'].count('\n'), 3)
+
+    def test_signed(self):
+        signed = '-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA256\n\n' + test_dsc
+        self.assertRaises(deb822.Deb822SignatureError, list, deb822.iter_paragraphs(signed))
+        self.assertRaises(deb822.Deb822SignatureError, list, deb822.iter_paragraphs(StringIO(signed)))
+
+
+class TestVerifyParagraphs(SigningKeyMixin, TestCase):
+    # flake8: noqa
+    def test_verify_paragraphs(self):
+        signed = self.gnupg.clearsign(data=test_dsc, keyid=self.fingerprint).data
+
+        result = deb822.verify_paragraphs(self.gnupg, data=signed)
+        self.assertEqual(result.signature.fingerprint, self.fingerprint)
+        self.assertEqual([paragraph['Version'] for paragraph in result.paragraphs], ['1.0-1'])
+
+        path = os.path.join(self.tempdir, 'mentors_1.0-1.dsc')
+        with open(path, 'w') as f:
+            f.write(signed)
+        self.assertEqual(deb822.verify_paragraphs(self.gnupg, path=path).paragraphs[0]['Source'], 'mentors')
+
+    def test_verify_tampered(self):
+        signed = self.gnupg.clearsign(data=test_dsc, keyid=self.fingerprint).data
+
+        self.assertRaises(deb822.Deb822SignatureError, deb822.verify_paragraphs, self.gnupg,
+                          data=signed.replace('Version: 1.0-1', 'Version: 1.0-2'))
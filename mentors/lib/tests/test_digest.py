@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/test_digest.py — Tests for the file digests
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Test cases for lib.digest.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from .. import digest
+
+
+class TestDigest(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.files = {}
+        for name, size in (('empty', 0), ('small', 17), ('buffer', digest.BUFFER_SIZE),
+                           ('large', 2 * digest.BUFFER_SIZE + 3)):
+            path = os.path.join(self.tempdir, name)
+            data = os.urandom(size)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.files[path] = data
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _expected(self, path, algorithms=digest.DEFAULT_ALGORITHMS):
+        data = self.files[path]
+        return digest.FileDigests(path, len(data), dict((algorithm, hashlib.new(algorithm, data).hexdigest())
+                                                        for algorithm in algorithms))
+
+    def test_digest_file(self):
+        for path in self.files:
+            self.assertEqual(digest.digest_file(path), self._expected(path))
+
+    def test_buffer_size(self):
+        path = os.path.join(self.tempdir, 'large')
+        self.assertEqual(digest.digest_file(path, ('sha256',), buffer_size=7), self._expected(path, ('sha256',)))
+        self.assertEqual(digest.digest_file(path, ('md5',)), self._expected(path, ('md5',)))
+
+    def test_output(self):
+        path = os.path.join(self.tempdir, 'large')
+        copy = os.path.join(self.tempdir, 'copy')
+
+        with open(copy, 'wb') as output:
+            self.assertEqual(digest.digest_file(path, buffer_size=1000, output=output), self._expected(path))
+        with open(copy, 'rb') as f:
+            self.assertEqual(f.read(), self.files[path])
+
+    def test_digest_files(self):
+        paths = sorted(self.files)
+
+        for workers in (1, 3):
+            self.assertEqual(digest.digest_files(paths, workers=workers), [self._expected(path) for path in paths])
+        self.assertEqual(digest.digest_files([]), [])
+
+    def test_missing_file(self):
+        paths = sorted(self.files) + [os.path.join(self.tempdir, 'missing')]
+        self.assertRaises(IOError, digest.digest_files, paths)
@@ -39,12 +39,19 @@ __copyright__ = ', '.join([
 
 __license__ = 'MIT'
 
+import errno
 import os
 import shutil
+import subprocess
+import sys
 import tempfile
+import time
 from unittest import TestCase
 
-from ..gnupg import GnuPG, GpgUserId, GpgFailure, GpgVerifyInvalidData, GpgVerifyNoData, GpgInvalidKeyBlock
+from .. import openpgp
+from ..gnupg import (GnuPG, GpgBaseException, GpgUserId, GpgFailure, GpgVerifyInvalidData, GpgVerifyNoData, GpgInvalidKeyBlock, GpgResultCache,
+                     GpgTimeout, GpgOverloaded, GpgLimiter, AsyncGnuPG, GpgOperation, as_completed, gather,
+                     ShardedKeyring, GpgMetrics, GpgCommandEvent, gpg_command_verb, GpgNoSigningHomedir)
 
 clement_gpg_key = """\
 -----BEGIN PGP PUBLIC KEY BLOCK-----
@@ -250,7 +257,8 @@ class TestGnuPGController(TestCase):
         key = gnupg.string_to_key(key_string)
         key = key._replace(fingerprint=test_gpg_key_fpr)
 
-        self.assertEqual(key, expected_key)
+        # string_to_key doesn't know about the creation date and subkeys
+        self.assertEqual(key, expected_key._replace(created=None, subkeys=None))
 
     def test_parse_userid(self):
         """
@@ -262,6 +270,27 @@ class TestGnuPGController(TestCase):
         (k, u) = parsed_key_block
         self.assertEqual(u, [GpgUserId('Serafeim Zanikolas', 'serzan@hellug.gr')])
 
+    def test_parse_key_block_in_process(self):
+        """The in-process parser agrees with gpg"""
+        gnupg = self._get_gnupg()
+        for data in (test_gpg_key, clement_gpg_key):
+            gnupg.in_process_parsing = True
+            (key, user_ids) = gnupg.parse_key_block(data)
+            gnupg.in_process_parsing = False
+            (gpg_key, gpg_user_ids) = gnupg.parse_key_block(data)
+
+            self.assertEqual(key[:4], gpg_key[:4])
+            self.assertEqual(user_ids, gpg_user_ids)
+
+    def test_parse_key_block_fallback(self):
+        """Key blocks the in-process parser can't read are parsed by gpg"""
+        gnupg = self._get_gnupg()
+        gnupg._run = lambda *args, **kwargs: ('', '', [], 2)
+
+        self.assertEqual(gnupg.parse_key_block(test_gpg_key).key.id, '355304E4')
+        self.assertRaises(GpgInvalidKeyBlock, gnupg.parse_key_block, test_gpg_key.replace('mQGiB', 'mQGiC'))
+        self.assertRaises(GpgInvalidKeyBlock, gnupg.parse_key_block, test_gpg_key + test_gpg_key)
+
     def test_parse_invalid_key_block(self):
         gnupg = self._get_gnupg()
         self.assertFalse(gnupg.is_unusable)
@@ -288,6 +317,56 @@ class TestGnuPGController(TestCase):
         self.assertIn(test_gpg_key_fpr, fingerprints)
         self.assertIn(clement_gpg_key_fpr, fingerprints)
 
+    def test_list_keys_with_colons(self):
+        gnupg = self._get_gnupg()
+        gnupg.add_key(data=clement_gpg_key)
+
+        keys = dict((key.key.fingerprint, key) for key in gnupg.list_keys(with_colons=True))
+        self.assertEqual(len(keys), 2)
+
+        test_key = keys[test_gpg_key_fpr]
+        self.assertEqual(gnupg.key_to_string(test_key.key), test_gpg_key_id)
+        self.assertEqual(test_key.user_ids, [GpgUserId('Serafeim Zanikolas', 'serzan@hellug.gr')])
+
+        clement_key = keys[clement_gpg_key_fpr]
+        self.assertEqual(len(clement_key.user_ids), 4)
+        self.assertEqual(len(clement_key.key.subkeys), 1)
+
+    def test_parse_colons_listing(self):
+        gnupg = self._get_gnupg()
+        with open(self._get_data_file('list_keys_colons')) as listing:
+            keys = list(gnupg._parse_colons_listing(listing))
+
+        self.assertEqual(len(keys), 2)
+        (test_key, test_uids), (clement_key, clement_uids) = keys
+
+        self.assertEqual(test_key.fingerprint, test_gpg_key_fpr)
+        self.assertEqual(gnupg.key_to_string(test_key), test_gpg_key_id)
+        self.assertEqual(test_key.created, 1126636421)
+        self.assertEqual(test_key.expires, 1334141249)
+        self.assertEqual(test_key.validity, 'e')
+        self.assertEqual(len(test_key.subkeys), 1)
+        self.assertEqual(test_key.subkeys[0].fingerprint, '429EADAEDCAA1D2515B378DDDCB9F0CAC082E9B7')
+        self.assertEqual(test_key.subkeys[0].type, 'g')
+        self.assertEqual(test_uids, [GpgUserId('Serafeim Zanikolas', 'serzan@hellug.gr')])
+
+        self.assertEqual(clement_key.fingerprint, clement_gpg_key_fpr)
+        self.assertIsNone(clement_key.expires)
+        self.assertIn(GpgUserId(u'Cl\xe9ment Schreiner', 'clement@mux.me'), clement_uids)
+
+    def test_parse_listings_agree(self):
+        gnupg = self._get_gnupg()
+        with open(self._get_data_file('list_keys_colons')) as listing:
+            colons_keys = list(gnupg._parse_colons_listing(listing))
+        with open(self._get_data_file('list_keys_gpg1')) as listing:
+            human_keys = list(gnupg._parse_key_listing(listing.read().decode('utf-8').splitlines()[2:]))
+
+        self.assertEqual(len(colons_keys), len(human_keys))
+        for colons_key, human_key in zip(colons_keys, human_keys):
+            self.assertEqual(gnupg.key_to_string(colons_key.key), gnupg.key_to_string(human_key.key))
+            self.assertEqual(colons_key.key.fingerprint, human_key.key.fingerprint)
+            self.assertEqual(colons_key.user_ids, human_key.user_ids)
+
     def test_obsolete_signature_verification(self):
         """
         Verify the signature in the file
@@ -368,7 +447,725 @@ class TestGnuPGController(TestCase):
         verif = gnupg.verify_file(path='/etc/passwd')
         self.assertFalse(verif.is_valid)
 
+    def test_verify_files_async(self):
+        plaintext = "Lorem Ipsum is simply dummy text of the printing and typesetting industry."
+        gnupg = AsyncGnuPG('/usr/bin/gpg', self._get_data_file('pubring_with_355304E4.gpg'))
+        signed_file_path = self._get_data_file('signed_by_8123F27C.gpg')
+        pubring = self._get_data_file('pubring_with_8123F27C.gpg')
+
+        verifs = gnupg.verify_files([signed_file_path] * 4, pubring=pubring, concurrency=2)
+
+        self.assertEqual(len(verifs), 4)
+        for verif in verifs:
+            self.assertTrue(verif.is_valid)
+            self.assertEqual(verif.data, plaintext)
+
+        # Unknown key
+        verifs = gnupg.verify_files([signed_file_path], return_exceptions=True)
+        self.assertIsInstance(verifs[0], GpgFailure)
+        self.assertRaises(GpgFailure, gnupg.verify_files, [signed_file_path])
+
+    def test_verify_many(self):
+        gnupg = self._get_gnupg()
+        signed_file_path = self._get_data_file('signed_by_8123F27C.gpg')
+        pubring = self._get_data_file('pubring_with_8123F27C.gpg')
+        with open(signed_file_path) as f:
+            signed_data = f.read()
+        closed_file = open(signed_file_path)
+        closed_file.close()
+
+        not_signed = u'not signed: \xe9\n'
+        items = [signed_file_path, signed_data, 'not signed', closed_file, not_signed]
+        results = list(gnupg.verify_many(items, pubring=pubring, workers=2))
+
+        self.assertEqual(len(results), 5)
+        results = dict((id(result.item), result) for result in results)
+        for item in items[:2]:
+            self.assertTrue(results[id(item)].signature.is_valid)
+            self.assertIsNone(results[id(item)].error)
+        self.assertFalse(results[id('not signed')].signature.is_valid)
+        self.assertIsNone(results[id(closed_file)].signature)
+        self.assertIsInstance(results[id(closed_file)].error, GpgVerifyInvalidData)
+        self.assertFalse(results[id(not_signed)].signature.is_valid)
+
+        # Unknown key
+        results = list(gnupg.verify_many([signed_file_path, signed_data]))
+        for result in results:
+            self.assertIsNone(result.signature)
+            self.assertIsInstance(result.error, GpgFailure)
+
+    def test_verify_item_input(self):
+        signed_file_path = self._get_data_file('signed_by_8123F27C.gpg')
+        self.assertEqual(GnuPG._verify_item_input(signed_file_path), {'path': signed_file_path})
+        self.assertEqual(GnuPG._verify_item_input(u'\xe9\n'), {'data': u'\xe9\n'})
+
+        # Not representable in the filesystem encoding
+        def isfile(path):
+            return u'\xe9'.encode('ascii')
+        orig_isfile = os.path.isfile
+        os.path.isfile = isfile
+        try:
+            self.assertEqual(GnuPG._verify_item_input(u'\xe9'), {'data': u'\xe9'})
+        finally:
+            os.path.isfile = orig_isfile
+
+    def test_verify_cache(self):
+        gnupg = self._get_gnupg()
+        gnupg.verify_cache = GpgResultCache()
+        signed_file_path = self._get_data_file('signed_by_8123F27C.gpg')
+        pubring = self._get_data_file('pubring_with_8123F27C.gpg')
+        with open(signed_file_path) as f:
+            signed_data = f.read()
+
+        verif = gnupg.verify_file(path=signed_file_path, pubring=pubring)
+        self.assertTrue(verif.is_valid)
+        self.assertEqual(gnupg.verify_cache.stats()['misses'], 1)
+
+        # Same signed data, by path or by content
+        self.assertEqual(gnupg.verify_file(path=signed_file_path, pubring=pubring), verif)
+        self.assertEqual(gnupg.verify_file(data=signed_data, pubring=pubring), verif)
+        self.assertEqual(gnupg.verify_cache.stats()['hits'], 2)
+
+        # Failures aren't cached
+        self.assertRaises(GpgFailure, gnupg.verify_file, data=signed_data)
+        self.assertRaises(GpgFailure, gnupg.verify_file, data=signed_data)
+        self.assertEqual(gnupg.verify_cache.stats()['misses'], 3)
+
+        # Changing the keyring invalidates the results
+        generation = gnupg.keyring_generation(pubring)
+        gnupg.add_key(data=test_gpg_key, pubring=pubring)
+        self.assertNotEqual(gnupg.keyring_generation(pubring), generation)
+        self.assertEqual(gnupg.verify_file(data=signed_data, pubring=pubring), verif)
+        self.assertEqual(gnupg.verify_cache.stats()['misses'], 4)
+
+    def test_keyring_generation(self):
+        gnupg = self._get_gnupg()
+        pubring = os.path.join(self.gpg_data_dir, 'missing.gpg')
+
+        generation = gnupg.keyring_generation(pubring)
+        self.assertEqual(gnupg.keyring_generation(pubring), generation)
+        gnupg.bump_keyring_generation(pubring)
+        self.assertNotEqual(gnupg.keyring_generation(pubring), generation)
+        self.assertNotEqual(gnupg.keyring_generation(), gnupg.keyring_generation(pubring))
+
     def test_remove_key(self):
         gnupg = self._get_gnupg()
         result = gnupg.remove_key('355304E4')
         self.assertTrue(result.success)
+
+    def test_fast_path_options(self):
+        gnupg = GnuPG('/usr/bin/gpg', self._get_data_file('pubring_with_355304E4.gpg'),
+                      trust_model='always', auto_check_trustdb=False)
+        for cmd in (gnupg._command(['--list-keys']), gnupg._command(['--clearsign'], homedir=self.gpg_data_dir)):
+            self.assertIn('--no-auto-check-trustdb', cmd)
+            self.assertEqual(cmd[cmd.index('--trust-model') + 1], 'always')
+
+        cmd = self._get_gnupg()._command(['--list-keys'])
+        self.assertNotIn('--no-auto-check-trustdb', cmd)
+        self.assertNotIn('--trust-model', cmd)
+
+        gnupg.add_key(data=clement_gpg_key)
+        signature = gnupg.verify_file(path=self._get_data_file('signed_by_8123F27C.gpg'))
+        self.assertTrue(signature.is_valid)
+
+    def test_check_trustdb(self):
+        self.assertTrue(self._get_gnupg().check_trustdb().success)
+
+    def test_compact_keyring(self):
+        gnupg = self._get_gnupg()
+        gnupg.add_key(data=clement_gpg_key)
+        gnupg.remove_key(clement_gpg_key_fpr)
+        generation = gnupg.keyring_generation()
+
+        compaction = gnupg.compact_keyring()
+
+        self.assertEqual(compaction.keys, 1)
+        self.assertEqual(compaction.size_after, os.path.getsize(gnupg.default_keyring))
+        self.assertNotEqual(gnupg.keyring_generation(), generation)
+        self.assertEqual([key_block.key.fingerprint for key_block in gnupg.list_keys(with_colons=True)],
+                         [test_gpg_key_fpr])
+        self.assertEqual(gnupg.verify_file(path=self._get_data_file('signed_by_355304E4.gpg')).fingerprint,
+                         test_gpg_key_fpr)
+        self.assertEqual([name for name in os.listdir(self.gpg_data_dir) if name.startswith('.compact-')], [])
+
+    def test_compact_changed_keyring(self):
+        gnupg = self._get_gnupg()
+        with open(gnupg.default_keyring) as f:
+            before = f.read()
+
+        export_keys = gnupg.export_keys
+
+        def export_and_change(*args, **kwargs):
+            data = export_keys(*args, **kwargs)
+            gnupg.bump_keyring_generation()
+            return data
+        gnupg.export_keys = export_and_change
+
+        with self.assertRaises(GpgFailure):
+            gnupg.compact_keyring()
+        with open(gnupg.default_keyring) as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual([name for name in os.listdir(self.gpg_data_dir) if name.startswith('.compact-')], [])
+
+
+class DictCache(dict):
+    """Stand-in for a Django cache"""
+    def __init__(self, *args, **kwargs):
+        super(DictCache, self).__init__(*args, **kwargs)
+        self.timeouts = {}
+
+    def set(self, key, value, timeout=None):
+        self[key] = value
+        self.timeouts[key] = timeout
+
+
+class TestGpgResultCache(TestCase):
+    def test_lru_eviction(self):
+        cache = GpgResultCache(size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # 'b' is now the least recently used entry
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['entries'], 2)
+
+    def test_shared_cache(self):
+        shared = DictCache()
+        GpgResultCache(shared_cache=shared, prefix='test').set('a', 1)
+        self.assertIn('test:a', shared)
+
+        cache = GpgResultCache(shared_cache=shared, prefix='test')
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['shared_hits'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_expiry(self):
+        shared = DictCache()
+        cache = GpgResultCache(shared_cache=shared, prefix='test', timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2, expires=time.time() + 10)
+        cache.set('c', 3, expires=time.time() - 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(shared.timeouts, {'test:a': 60, 'test:b': 10, 'test:c': 1})
+
+        # Past their expiry, in this process and in the shared cache
+        now = time.time()
+        orig_time = time.time
+        time.time = lambda: now + 30
+        try:
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNone(GpgResultCache(shared_cache=shared, prefix='test').get('b'))
+            time.time = lambda: now + 61
+            self.assertIsNone(cache.get('a'))
+        finally:
+            time.time = orig_time
+
+    def test_signature_expiry(self):
+        status = [['NEWSIG'], ['GOODSIG', '5E39E0E38123F27C', 'Clement'],
+                  ['VALIDSIG', 'E4BA6F4097B08D5AE8DC68C95E39E0E38123F27C', '2013-09-01', '1378000000', '1400000000',
+                   '4', '0', '1', '8', '00', 'E4BA6F4097B08D5AE8DC68C95E39E0E38123F27C']]
+        self.assertEqual(GnuPG._signature_expiry(status), 1400000000)
+
+        status[2][4] = '0'
+        self.assertIsNone(GnuPG._signature_expiry(status))
+        self.assertIsNone(GnuPG._signature_expiry([['BADSIG', '5E39E0E38123F27C', 'Clement']]))
+
+    def test_digest(self):
+        self.assertEqual(GpgResultCache.digest('key'), GpgResultCache.digest(u'key'))
+        self.assertNotEqual(GpgResultCache.digest('key'), GpgResultCache.digest('other key'))
+
+    def test_parse_key_block_cached(self):
+        cache = GpgResultCache()
+        gnupg = GnuPG('/usr/bin/gpg', key_block_cache=cache)
+        cache.set(cache.digest(test_gpg_key), 'parsed')
+
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run for a cached key block")
+        gnupg._run = run_gpg
+
+        self.assertEqual(gnupg.parse_key_block(test_gpg_key), 'parsed')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+# A fake gpg writing lots of status lines, and echoing its stdin
+fake_gpg_script = """\
+#!%(python)s
+import os, sys
+status_fd = int(sys.argv[sys.argv.index('--status-fd') + 1])
+if os.environ.get('FAKE_GPG_SLEEP'):
+    import time
+    time.sleep(float(os.environ['FAKE_GPG_SLEEP']))
+for i in xrange(%(lines)d):
+    os.write(status_fd, '[GNUPG:] PROGRESS fake %%d\\n' %% i)
+sys.stdout.write(sys.stdin.read())
+sys.stderr.write('x' * %(lines)d)
+"""
+
+
+class TestGnuPGProcessIO(TestCase):
+    # flake8: noqa
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _get_fake_gnupg(self, lines, cls=GnuPG):
+        path = os.path.join(self.tempdir, 'gpg')
+        with open(path, 'w') as f:
+            f.write(fake_gpg_script % {'python': sys.executable, 'lines': lines})
+        os.chmod(path, 0o755)
+        return cls(path, os.path.join(self.tempdir, 'pubring.gpg'))
+
+    def test_large_status_output(self):
+        """More than a pipe buffer of status and input doesn't block gpg"""
+        gnupg = self._get_fake_gnupg(100000)
+        stdin = 'y' * (1 << 20)
+
+        (out, err, status, code) = gnupg._run(stdin=stdin)
+
+        self.assertEqual(code, 0)
+        self.assertEqual(out, stdin)
+        self.assertEqual(len(err), 100000)
+        self.assertEqual(len(status), 100000)
+        self.assertEqual(status[-1], ['PROGRESS', 'fake', '99999'])
+
+    def test_status_callback(self):
+        gnupg = self._get_fake_gnupg(10)
+        received = []
+
+        (out, err, status, code) = gnupg._run(status_callback=received.append)
+
+        self.assertEqual(received, status)
+        self.assertEqual(len(received), 10)
+
+    def test_timeout(self):
+        gnupg = self._get_fake_gnupg(10)
+        os.environ['FAKE_GPG_SLEEP'] = '10'
+        try:
+            with self.assertRaises(GpgTimeout):
+                gnupg._run(timeout=0.2)
+        finally:
+            del os.environ['FAKE_GPG_SLEEP']
+
+    def test_overloaded(self):
+        gnupg = self._get_fake_gnupg(10)
+        gnupg.limiter = GpgLimiter(max_processes=1)
+
+        release = gnupg.limiter.acquire()
+        with self.assertRaises(GpgOverloaded):
+            gnupg._run()
+        release()
+
+        gnupg._run()
+        self.assertEqual(gnupg.limiter.stats(), {'running': 0, 'rejected': 1})
+
+    def test_overloaded_host(self):
+        lock_dir = os.path.join(self.tempdir, 'locks')
+        limiter = GpgLimiter(lock_dir=lock_dir, max_host_processes=1)
+        other_process_limiter = GpgLimiter(lock_dir=lock_dir, max_host_processes=1)
+
+        release = limiter.acquire()
+        with self.assertRaises(GpgOverloaded):
+            other_process_limiter.acquire()
+        release()
+
+        other_process_limiter.acquire()()
+
+    def test_metrics(self):
+        gnupg = self._get_fake_gnupg(10)
+        gnupg.metrics = GpgMetrics()
+
+        gnupg._run(stdin='abc')
+        gnupg._run(stdin='abc', args=['--import-options', 'import-minimal', '--import'])
+        os.environ['FAKE_GPG_SLEEP'] = '10'
+        try:
+            with self.assertRaises(GpgTimeout):
+                gnupg._run(args=['--import'], timeout=0.2)
+        finally:
+            del os.environ['FAKE_GPG_SLEEP']
+
+        stats = gnupg.metrics.stats()
+        self.assertEqual(sorted(stats), ['default', 'import'])
+        self.assertEqual(stats['default']['count'], 1)
+        self.assertEqual(stats['default']['failures'], 0)
+        self.assertEqual(stats['default']['bytes_in'], 3)
+        self.assertEqual(stats['default']['bytes_out'], 13)
+        self.assertEqual(stats['import']['count'], 2)
+        self.assertEqual(stats['import']['failures'], 1)
+        self.assertEqual(sum(count for bound, count in stats['import']['histogram']), 2)
+
+    def test_metrics_sink_failure(self):
+        class BrokenSink(object):
+            def record(self, event):
+                raise ValueError(event)
+
+        gnupg = self._get_fake_gnupg(10)
+        gnupg.metrics = BrokenSink()
+        self.assertEqual(gnupg._run(stdin='abc')[0], 'abc')
+
+
+# gpg --gen-key parameters of the throwaway signing key of TestGnuPGSigning
+signing_key_parameters = """\
+%no-protection
+Key-Type: RSA
+Key-Length: 1024
+Key-Usage: sign
+Name-Real: Throwaway Signing Key
+Name-Email: signing@example.com
+Expire-Date: 0
+%commit
+"""
+
+
+class SigningKeyMixin(object):
+    """
+    Sets up a GnuPG object whose signing homedir holds a throwaway key, and
+    whose keyring holds its public key.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.homedir = os.path.join(self.tempdir, 'signing')
+        os.mkdir(self.homedir, 0o700)
+
+        with open(os.devnull, 'w') as devnull:
+            gen_key = subprocess.Popen(['/usr/bin/gpg', '--homedir', self.homedir, '--batch', '--gen-key'],
+                                       stdin=subprocess.PIPE, stdout=devnull, stderr=devnull)
+            gen_key.communicate(signing_key_parameters)
+            self.assertEqual(gen_key.returncode, 0)
+            public_key = subprocess.check_output(['/usr/bin/gpg', '--homedir', self.homedir, '--armor', '--export'],
+                                                 stderr=devnull)
+
+        self.gnupg = GnuPG('/usr/bin/gpg', os.path.join(self.tempdir, 'pubring.gpg'), signing_homedir=self.homedir)
+        self.gnupg.add_key(data=public_key)
+        self.fingerprint = self.gnupg.parse_key_block(data=public_key).key.fingerprint
+
+    def tearDown(self):
+        # Stop the gpg-agent gpg 2 started for the signing homedir
+        with open(os.devnull, 'w') as devnull:
+            try:
+                subprocess.call(['gpgconf', '--homedir', self.homedir, '--kill', 'gpg-agent'],
+                                stdout=devnull, stderr=devnull)
+            except OSError:
+                pass
+        # The exiting agent removes its sockets while they get deleted
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+
+class TestGnuPGSigning(SigningKeyMixin, TestCase):
+    # flake8: noqa
+    def _verify_detached(self, signature, data):
+        signature_path = os.path.join(self.tempdir, 'Release.gpg')
+        data_path = os.path.join(self.tempdir, 'Release')
+        with open(signature_path, 'w') as f:
+            f.write(signature)
+        with open(data_path, 'w') as f:
+            f.write(data)
+        (out, err, status, code) = self.gnupg._run(args=['--verify', signature_path, data_path])
+        return code == 0 and any(line[0] == 'GOODSIG' for line in status)
+
+    def test_sign_detached(self):
+        signature = self.gnupg.sign_detached(data='Origin: mentors\n')
+
+        self.assertTrue(signature.data.startswith('-----BEGIN PGP SIGNATURE-----'))
+        self.assertEqual(signature.fingerprint, self.fingerprint)
+        self.assertTrue(self._verify_detached(signature.data, 'Origin: mentors\n'))
+        self.assertFalse(self._verify_detached(signature.data, 'Origin: elsewhere\n'))
+
+    def test_clearsign(self):
+        path = os.path.join(self.tempdir, 'Release')
+        with open(path, 'w') as f:
+            f.write('Origin: mentors\n')
+
+        signed = self.gnupg.clearsign(path=path, keyid=self.fingerprint)
+
+        self.assertTrue(signed.data.startswith('-----BEGIN PGP SIGNED MESSAGE-----'))
+        signature = self.gnupg.verify_file(data=signed.data)
+        self.assertTrue(signature.is_valid)
+        self.assertEqual(signature.fingerprint, self.fingerprint)
+        self.assertEqual(signature.data, 'Origin: mentors\n')
+
+    def test_sign_many(self):
+        items = ['Suite: %s\n' % suite for suite in ('unstable', 'experimental', 'stable')]
+
+        results = list(self.gnupg.sign_many(items, workers=2))
+
+        self.assertEqual(sorted(result.item for result in results), sorted(items))
+        for item, signature, error in results:
+            self.assertIsNone(error)
+            self.assertTrue(self._verify_detached(signature.data, item))
+
+        results = list(self.gnupg.sign_many(items, keyid='0123456789ABCDEF'))
+        self.assertEqual(len(results), 3)
+        for item, signature, error in results:
+            self.assertIsInstance(error, GpgFailure)
+
+    def test_async_sign(self):
+        gnupg = AsyncGnuPG('/usr/bin/gpg', self.gnupg.default_keyring, signing_homedir=self.homedir)
+        signatures = gather([gnupg.sign_detached(data='Origin: mentors\n'),
+                             gnupg.clearsign(data='Origin: mentors\n')])
+        self.assertTrue(self._verify_detached(signatures[0].data, 'Origin: mentors\n'))
+        self.assertTrue(self.gnupg.verify_file(data=signatures[1].data).is_valid)
+
+    def test_no_signing_homedir(self):
+        gnupg = GnuPG('/usr/bin/gpg', self.gnupg.default_keyring)
+        with self.assertRaises(GpgNoSigningHomedir):
+            gnupg.sign_detached(data='Origin: mentors\n')
+
+
+class TestGpgMetrics(TestCase):
+    def test_histogram(self):
+        metrics = GpgMetrics(buckets=(0.1, 1))
+        for seconds in (0.05, 0.1, 0.5, 2, 3):
+            metrics.record(GpgCommandEvent('verify', 'pubring.gpg', 0, 10, 100, seconds))
+        metrics.record(GpgCommandEvent('import', 'pubring.gpg', 2, 10, 100, 0.2))
+
+        stats = metrics.stats()
+        self.assertEqual(stats['verify']['histogram'], [(0.1, 2), (1, 1), (None, 2)])
+        self.assertEqual(stats['verify']['count'], 5)
+        self.assertEqual(stats['verify']['bytes_out'], 500)
+        self.assertAlmostEqual(stats['verify']['seconds'], 5.65)
+        self.assertEqual(stats['import']['failures'], 1)
+
+        metrics.clear()
+        self.assertEqual(metrics.stats(), {})
+
+    def test_command_verb(self):
+        self.assertEqual(gpg_command_verb(['--yes', '--delete-key', 'ABCD']), 'delete-key')
+        self.assertEqual(gpg_command_verb(['--with-colons', '--fixed-list-mode', '--list-keys']), 'list-keys')
+        self.assertEqual(gpg_command_verb(['/tmp/key.asc']), 'default')
+        self.assertEqual(gpg_command_verb(None), 'default')
+
+
+class TestAsyncGnuPG(TestGnuPGProcessIO):
+    # flake8: noqa
+    def _run_sleeping(self, operations, concurrency=None):
+        os.environ['FAKE_GPG_SLEEP'] = '0.5'
+        try:
+            return gather(operations, concurrency, return_exceptions=True)
+        finally:
+            del os.environ['FAKE_GPG_SLEEP']
+
+    def test_gather(self):
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        operations = [GpgOperation(gnupg, lambda out, err, status, code: out, stdin=str(i)) for i in range(4)]
+
+        self.assertEqual(gather(operations), ['0', '1', '2', '3'])
+        self.assertEqual(operations[2].result(), '2')
+
+    def test_as_completed(self):
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        operations = [GpgOperation(gnupg, lambda out, err, status, code: len(status), stdin=str(i)) for i in range(4)]
+
+        completed = list(as_completed(operations, concurrency=2))
+
+        self.assertEqual(sorted(completed), sorted(operations))
+        self.assertEqual([operation.result() for operation in completed], [10] * 4)
+
+    def test_start_failure(self):
+        """A gpg process that can't be started only fails its own operation"""
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        gnupg.limiter = GpgLimiter(max_processes=4)
+        operations = [GpgOperation(gnupg, lambda out, err, status, code: out, stdin=str(i)) for i in range(3)]
+        popens = []
+        orig_popen = subprocess.Popen
+
+        def popen(*args, **kwargs):
+            popens.append(args)
+            if len(popens) == 2:
+                raise OSError(errno.EMFILE, 'Too many open files')
+            return orig_popen(*args, **kwargs)
+
+        subprocess.Popen = popen
+        try:
+            results = gather(operations, return_exceptions=True)
+        finally:
+            subprocess.Popen = orig_popen
+
+        self.assertEqual(results[0], '0')
+        self.assertIsInstance(results[1], OSError)
+        self.assertEqual(results[2], '2')
+        self.assertEqual(gnupg.limiter.stats()['running'], 0)
+
+    def test_stop_iteration(self):
+        """The gpg processes still running are killed when the caller stops iterating"""
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        slow_path = os.path.join(self.tempdir, 'slow-gpg')
+        with open(slow_path, 'w') as f:
+            f.write(fake_gpg_script.replace("os.environ.get('FAKE_GPG_SLEEP')", 'True')
+                    .replace("float(os.environ['FAKE_GPG_SLEEP'])", '5') % {'python': sys.executable, 'lines': 10})
+        os.chmod(slow_path, 0o755)
+        slow_gnupg = AsyncGnuPG(slow_path, gnupg.default_keyring)
+        gnupg.limiter = slow_gnupg.limiter = GpgLimiter(max_processes=4)
+        parse = lambda out, err, status, code: out
+
+        start = time.time()
+        completed = as_completed([GpgOperation(slow_gnupg, parse, stdin='slow'), GpgOperation(gnupg, parse, stdin='fast')])
+        self.assertEqual(next(completed).result(), 'fast')
+        completed.close()
+
+        self.assertLess(time.time() - start, 4)
+        self.assertEqual(gnupg.limiter.stats()['running'], 0)
+
+    def test_concurrency(self):
+        """gpg processes run at the same time, but no more than asked for"""
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        parse = lambda out, err, status, code: out
+
+        start = time.time()
+        self.assertEqual(self._run_sleeping([GpgOperation(gnupg, parse, stdin='x') for i in range(4)]), ['x'] * 4)
+        self.assertLess(time.time() - start, 1.5)
+
+        start = time.time()
+        self._run_sleeping([GpgOperation(gnupg, parse, stdin='x') for i in range(4)], concurrency=2)
+        self.assertGreaterEqual(time.time() - start, 1)
+
+    def test_limiter(self):
+        """Operations wait for the ones already running to free limiter slots"""
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        gnupg.limiter = GpgLimiter(max_processes=2)
+        parse = lambda out, err, status, code: out
+
+        results = self._run_sleeping([GpgOperation(gnupg, parse, stdin=str(i)) for i in range(4)])
+
+        self.assertEqual(results, ['0', '1', '2', '3'])
+        self.assertEqual(gnupg.limiter.stats()['running'], 0)
+
+    def test_timeout(self):
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        gnupg.timeout = 0.2
+        operations = [GpgOperation(gnupg, lambda out, err, status, code: out) for i in range(2)]
+
+        results = self._run_sleeping(operations)
+
+        self.assertIsInstance(results[0], GpgTimeout)
+        self.assertIsInstance(results[1], GpgTimeout)
+        self.assertRaises(GpgTimeout, operations[0].result)
+
+    def test_keyring_generation(self):
+        """The keyring generation changes even if gpg timed out while changing the keyring"""
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        gnupg.timeout = 0.2
+        generation = gnupg.keyring_generation()
+
+        results = self._run_sleeping([gnupg.add_key(data=test_gpg_key), gnupg.remove_key(test_gpg_key_fpr)])
+
+        self.assertIsInstance(results[0], GpgTimeout)
+        self.assertIsInstance(results[1], GpgTimeout)
+        with open(gnupg.default_keyring + '.generation') as f:
+            self.assertEqual(f.read().strip(), '2')
+        self.assertNotEqual(gnupg.keyring_generation(), generation)
+
+    def test_parse_key_block_cached(self):
+        gnupg = self._get_fake_gnupg(10, AsyncGnuPG)
+        gnupg.key_block_cache = GpgResultCache()
+        gnupg.key_block_cache.set(gnupg.key_block_cache.digest(test_gpg_key), 'parsed')
+
+        operation = gnupg.parse_key_block(test_gpg_key)
+
+        self.assertTrue(operation.done)
+        self.assertEqual(operation.result(), 'parsed')
+
+
+class TestShardedKeyring(TestCase):
+    # flake8: noqa
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.gnupg = GnuPG('/usr/bin/gpg', os.path.join(self.tempdir, 'pubring.gpg'))
+        self.keyring = ShardedKeyring(self.gnupg, os.path.join(self.tempdir, 'shards'), shards=4)
+        self.signed_file_path = os.path.join(os.path.dirname(__file__), 'gpg', 'signed_by_8123F27C.gpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _shard_fingerprints(self, fingerprint):
+        pubring = self.keyring.shard_path(self.keyring.shard_for(fingerprint))
+        return [key_block.key.fingerprint for key_block in self.gnupg.list_keys(pubring=pubring, with_colons=True)]
+
+    def test_add_key(self):
+        result = self.keyring.add_key(data=test_gpg_key + clement_gpg_key)
+
+        self.assertTrue(result.success)
+        self.assertEqual(self._shard_fingerprints(test_gpg_key_fpr), [test_gpg_key_fpr])
+        self.assertEqual(self._shard_fingerprints(clement_gpg_key_fpr), [clement_gpg_key_fpr])
+        self.assertEqual(len(list(self.keyring.list_keys(with_colons=True))), 2)
+
+        index = self.keyring.index()
+        self.assertEqual(index[test_gpg_key_fpr], self.keyring.shard_for(test_gpg_key_fpr))
+        # Long key id of the encryption subkey
+        self.assertEqual(index['CFF437A347BD353A'], self.keyring.shard_for(clement_gpg_key_fpr))
+
+    def test_verify_file(self):
+        self.keyring.add_key(data=test_gpg_key + clement_gpg_key)
+        pubrings = []
+        verify_file = self.gnupg.verify_file
+
+        def spy(*args, **kwargs):
+            pubrings.append(kwargs['pubring'])
+            return verify_file(*args, **kwargs)
+        self.gnupg.verify_file = spy
+
+        self.assertTrue(self.keyring.verify_file(path=self.signed_file_path).is_valid)
+        with open(self.signed_file_path) as f:
+            self.assertTrue(self.keyring.verify_file(file_object=f).is_valid)
+
+        shard = self.keyring.shard_path(self.keyring.shard_for(clement_gpg_key_fpr))
+        self.assertEqual(pubrings, [[shard], [shard]])
+
+    def test_verify_malformed_armor(self):
+        """Armor this module can't read is checked by gpg, against all the shards"""
+        self.keyring.add_key(data=test_gpg_key + clement_gpg_key)
+        with open(self.signed_file_path) as f:
+            armored = openpgp.armor(f.read()).replace('PUBLIC KEY BLOCK', 'MESSAGE')
+        lines = armored.splitlines(True)
+        pubrings = []
+        verify_file = self.gnupg.verify_file
+
+        def spy(*args, **kwargs):
+            pubrings.append(kwargs['pubring'])
+            return verify_file(*args, **kwargs)
+        self.gnupg.verify_file = spy
+
+        for data in (''.join(lines[:-1]), ''.join(lines[:-2] + ['=AAAA\n', lines[-1]])):
+            try:
+                self.keyring.verify_file(data=data)
+            except GpgBaseException:
+                pass
+        self.assertEqual(pubrings, [self.keyring.keyrings()] * 2)
+
+    def test_remove_key(self):
+        self.keyring.add_key(data=test_gpg_key + clement_gpg_key)
+
+        self.assertTrue(self.keyring.remove_key(clement_gpg_key_fpr).success)
+
+        self.assertNotIn(clement_gpg_key_fpr, self.keyring.index())
+        self.assertNotIn('CFF437A347BD353A', self.keyring.index())
+        self.assertIn(test_gpg_key_fpr, self.keyring.index())
+        with self.assertRaises(GpgFailure):
+            self.keyring.verify_file(path=self.signed_file_path)
+
+    def test_import_keyring(self):
+        self.gnupg.add_key(data=test_gpg_key)
+        self.gnupg.add_key(data=clement_gpg_key)
+
+        self.assertEqual(self.keyring.import_keyring(self.gnupg.default_keyring), 2)
+
+        self.assertEqual(sorted(self.keyring.index()), sorted([
+            test_gpg_key_fpr, test_gpg_key_fpr[-16:], '429EADAEDCAA1D2515B378DDDCB9F0CAC082E9B7', 'DCB9F0CAC082E9B7',
+            clement_gpg_key_fpr, clement_gpg_key_fpr[-16:], 'AFAFBBB1FF03E66297DB2934CFF437A347BD353A', 'CFF437A347BD353A',
+        ]))
+        self.assertTrue(self.keyring.verify_file(path=self.signed_file_path).is_valid)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/test_hkp.py — Tests for the HKP keyserver client
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Test cases for lib.hkp, against a local stand-in for the keyserver.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import hashlib
+import httplib
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from unittest import TestCase
+
+from .. import hkp
+from .test_gnupg import test_gpg_key, test_gpg_key_fpr
+
+
+class HKPRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(url.query)
+        server.requests.append((query.get('search', [''])[0], self.headers.get('If-None-Match')))
+
+        if url.path != '/pks/lookup' or query.get('op') != ['get']:
+            return self.send_error(400)
+        if server.fail:
+            return self.send_error(500)
+
+        data = server.keys.get(query['search'][0][2:].upper())
+        if data is None:
+            return self.send_error(404)
+
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pgp-keys')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class HKPServer(HTTPServer):
+    """
+    A keyserver serving the armored key blocks in ``keys``, indexed by
+    fingerprint, on a random local port, until ``stop`` is called.
+    """
+
+    def __init__(self, keys=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), HKPRequestHandler)
+        self.keys = keys or {}
+        self.requests = []
+        self.fail = False
+        self.url = 'hkp://127.0.0.1:%d' % self.server_address[1]
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()
+
+
+class TruncatingOpener(object):
+    """Stand-in for an urllib2 opener, whose responses are cut short"""
+
+    class Response(object):
+        def read(self):
+            raise httplib.IncompleteRead('')
+
+        def close(self):
+            pass
+
+    def open(self, request, timeout=None):
+        return self.Response()
+
+
+class TestHKPClient(TestCase):
+    def setUp(self):
+        self.server = HKPServer({test_gpg_key_fpr: test_gpg_key})
+        self.client = hkp.HKPClient(self.server.url, timeout=5)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_http_url(self):
+        self.assertEqual(hkp.HKPClient.http_url('hkp://keys.example.org'), 'http://keys.example.org:11371')
+        self.assertEqual(hkp.HKPClient.http_url('hkps://keys.example.org/'), 'https://keys.example.org:443')
+        self.assertEqual(hkp.HKPClient.http_url('hkp://keys.example.org:80'), 'http://keys.example.org:80')
+        self.assertEqual(hkp.HKPClient.http_url('https://keys.example.org/'), 'https://keys.example.org')
+
+    def test_fetch_key(self):
+        result = self.client.fetch_key(test_gpg_key_fpr)
+
+        self.assertEqual(result.status, hkp.KEY_MODIFIED)
+        self.assertEqual(result.data, test_gpg_key)
+        self.assertTrue(result.etag)
+        self.assertEqual(self.server.requests, [('0x%s' % test_gpg_key_fpr, None)])
+
+    def test_fetch_key_not_modified(self):
+        etag = self.client.fetch_key(test_gpg_key_fpr).etag
+
+        result = self.client.fetch_key(test_gpg_key_fpr, etag=etag)
+        self.assertEqual(result, hkp.HKPResult(test_gpg_key_fpr, hkp.KEY_NOT_MODIFIED, None, etag, None))
+        self.assertEqual(self.server.requests[-1], ('0x%s' % test_gpg_key_fpr, etag))
+
+        # Stale validators
+        self.assertEqual(self.client.fetch_key(test_gpg_key_fpr, etag='"stale"').status, hkp.KEY_MODIFIED)
+
+    def test_fetch_key_not_found(self):
+        result = self.client.fetch_key('0' * 40)
+        self.assertEqual(result.status, hkp.KEY_NOT_FOUND)
+        self.assertIsNone(result.data)
+
+    def test_fetch_key_error(self):
+        self.server.fail = True
+        self.assertRaises(hkp.HKPError, self.client.fetch_key, test_gpg_key_fpr)
+
+        # Nothing listening
+        client = hkp.HKPClient('http://127.0.0.1:1', timeout=5)
+        self.assertRaises(hkp.HKPError, client.fetch_key, test_gpg_key_fpr)
+
+    def test_fetch_key_truncated(self):
+        self.client._opener = TruncatingOpener()
+        self.assertRaises(hkp.HKPError, self.client.fetch_key, test_gpg_key_fpr)
+
+        results = list(self.client.fetch_keys([(test_gpg_key_fpr, None, None), ('0' * 40, None, None)]))
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(isinstance(error, hkp.HKPError) for fpr, result, error in results))
+
+    def test_fetch_keys(self):
+        requests = [(test_gpg_key_fpr, None, None), ('0' * 40, None, None)]
+        results = dict((fpr, (result, error)) for fpr, result, error in self.client.fetch_keys(requests, 2))
+
+        self.assertEqual(results[test_gpg_key_fpr][0].status, hkp.KEY_MODIFIED)
+        self.assertEqual(results['0' * 40][0].status, hkp.KEY_NOT_FOUND)
+
+        self.server.fail = True
+        results = list(self.client.fetch_keys(requests))
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(isinstance(error, hkp.HKPError) for fpr, result, error in results))
@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/tests/test_middleware.py: tests for the site-wide middleware
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.test.client import RequestFactory
+
+from lib.gnupg import GpgFailure, GpgOverloaded
+from lib.middleware import GpgOverloadedMiddleware
+from lib.test import TestCase
+
+
+class GpgOverloadedMiddlewareTests(TestCase):
+    def test_overloaded(self):
+        request = RequestFactory().get('/')
+        response = GpgOverloadedMiddleware().process_exception(request, GpgOverloaded())
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_other_exceptions(self):
+        request = RequestFactory().get('/')
+        self.assertIsNone(GpgOverloadedMiddleware().process_exception(request, GpgFailure()))
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# lib/tests/test_openpgp.py — Tests for the OpenPGP packet reader
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont <nicolas.dandrimont@crans.org>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Test cases for lib.openpgp.
+"""
+
+__author__ = 'Nicolas Dandrimont'
+__copyright__ = 'Copyright © 2013 Nicolas Dandrimont'
+__license__ = 'MIT'
+
+import os
+import struct
+from unittest import TestCase
+
+from .. import openpgp
+from .test_gnupg import test_gpg_key, clement_gpg_key
+
+
+class TestOpenPGP(TestCase):
+    def test_crc24(self):
+        self.assertEqual(openpgp.crc24(''), openpgp.CRC24_INIT)
+        # Armor checksum of test_gpg_key, "=VNMB"
+        self.assertEqual(openpgp.crc24(openpgp.dearmor(test_gpg_key)), 0x54d301)
+
+    def test_dearmor(self):
+        data = openpgp.dearmor(test_gpg_key)
+        self.assertEqual(ord(data[0]), 0x99)
+
+        # unicode and binary input
+        self.assertEqual(openpgp.dearmor(unicode(test_gpg_key)), data)
+        self.assertEqual(openpgp.dearmor(data), data)
+
+    def test_dearmor_invalid(self):
+        self.assertRaises(openpgp.OpenPGPError, openpgp.dearmor, 'Lorem ipsum')
+        self.assertRaises(openpgp.OpenPGPError, openpgp.dearmor, test_gpg_key.replace('mQGiB', 'mQGiC'))
+        self.assertRaises(openpgp.OpenPGPError, openpgp.dearmor, test_gpg_key[:-100])
+        self.assertRaises(openpgp.UnsupportedOpenPGP, openpgp.dearmor, test_gpg_key + test_gpg_key)
+
+    def test_iter_packets(self):
+        # Old format with one, two and four byte lengths, new format with
+        # one, two and five byte lengths
+        packets = [
+            '\xb4\x03abc',
+            '\xb5\x00\x03abc',
+            '\xb6\x00\x00\x00\x03abc',
+            '\xcd\x03abc',
+            '\xcd\xc0\x00' + 'a' * 192,
+            '\xcd\xff' + struct.pack('>I', 10000) + 'a' * 10000,
+        ]
+        self.assertEqual([(tag, len(body)) for (tag, body) in openpgp.iter_packets(''.join(packets))],
+                         [(13, 3), (13, 3), (13, 3), (13, 3), (13, 192), (13, 10000)])
+
+        self.assertRaises(openpgp.OpenPGPError, list, openpgp.iter_packets('\xb4\x05abc'))
+        self.assertRaises(openpgp.OpenPGPError, list, openpgp.iter_packets('abc'))
+        self.assertRaises(openpgp.UnsupportedOpenPGP, list, openpgp.iter_packets('\xcd\xe1abc'))
+
+    def test_parse_key_block(self):
+        key_block = openpgp.parse_key_block(test_gpg_key)
+
+        self.assertEqual(key_block.key, openpgp.PublicKey(17, 1024, 1126636421,
+                                                          '634D55694BF2BAC22204245EEDC24562355304E4'))
+        self.assertEqual(key_block.user_ids, [u'Serafeim Zanikolas <serzan@hellug.gr>'])
+        self.assertEqual(key_block.subkeys, [openpgp.PublicKey(16, 1024, 1126636423,
+                                                               '429EADAEDCAA1D2515B378DDDCB9F0CAC082E9B7')])
+
+    def test_parse_user_ids(self):
+        key_block = openpgp.parse_key_block(clement_gpg_key)
+
+        self.assertEqual(key_block.key.fingerprint, 'E4BA6F4097B08D5AE8DC68C95E39E0E38123F27C')
+        self.assertEqual(key_block.user_ids[0], u'Cl\xe9ment Schreiner <clement@mux.me>')
+        self.assertEqual(len(key_block.user_ids), 4)
+
+    def test_unsupported_key(self):
+        data = bytearray(openpgp.dearmor(test_gpg_key))
+        # Public key packet version
+        data[3] = 3
+        self.assertRaises(openpgp.UnsupportedOpenPGP, openpgp.parse_key_block, str(data))
+        # Public key algorithm (EdDSA)
+        data[3] = 4
+        data[8] = 22
+        self.assertRaises(openpgp.UnsupportedOpenPGP, openpgp.parse_key_block, str(data))
+
+    def test_several_keys(self):
+        data = openpgp.dearmor(test_gpg_key)
+        self.assertRaises(openpgp.UnsupportedOpenPGP, openpgp.parse_key_block, data + data)
+
+    def test_armor(self):
+        data = openpgp.dearmor(clement_gpg_key)
+        self.assertEqual(openpgp.dearmor(openpgp.armor(data)), data)
+
+    def test_split_key_blocks(self):
+        test_key = openpgp.dearmor(test_gpg_key)
+        clement_key = openpgp.dearmor(clement_gpg_key)
+        # gpg trust packet
+        trust = '\xb0\x02\x00\x00'
+
+        self.assertEqual(list(openpgp.split_key_blocks(test_key + trust + clement_key)), [test_key, clement_key])
+        self.assertEqual(list(openpgp.split_key_blocks(test_gpg_key + clement_gpg_key)), [test_key, clement_key])
+        self.assertEqual(list(openpgp.split_key_blocks(openpgp.armor(test_key + clement_key))), [test_key, clement_key])
+        self.assertRaises(openpgp.OpenPGPError, list, openpgp.split_key_blocks(trust + test_key))
+
+    def test_signature_issuers(self):
+        for key_id in ('EDC24562355304E4', '5E39E0E38123F27C'):
+            with open(os.path.join(os.path.dirname(__file__), 'gpg', 'signed_by_%s.gpg' % key_id[-8:])) as f:
+                self.assertEqual(openpgp.signature_issuers(f.read()), [key_id])
+
+        self.assertEqual(openpgp.signature_issuers('Lorem ipsum'), [])
+
+    def test_signature_issuers_armored(self):
+        with open(os.path.join(os.path.dirname(__file__), 'gpg', 'signed_by_8123F27C.gpg')) as f:
+            armored = openpgp.armor(f.read()).replace('PUBLIC KEY BLOCK', 'MESSAGE')
+        self.assertEqual(openpgp.signature_issuers(armored), ['5E39E0E38123F27C'])
+
+        lines = armored.splitlines(True)
+        truncated = ''.join(lines[:-1])
+        bad_checksum = ''.join(lines[:-2] + ['=AAAA\n', lines[-1]])
+        bad_encoding = ''.join(lines[:2] + ['A\n'] + lines[2:])
+        for data in (truncated, bad_checksum, bad_encoding):
+            self.assertEqual(openpgp.signature_issuers(data), [])
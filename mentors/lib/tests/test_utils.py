@@ -0,0 +1,63 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/tests/test_utils.py: tests for the gpg helpers
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import os
+
+from django.conf import settings
+from django.test.utils import override_settings
+
+from lib.test import TestCase, OverrideMentorsRoot
+from lib.utils import get_gnupg
+
+
+class GetGnuPGTests(TestCase):
+    def test_shared_instance(self):
+        gnupg = get_gnupg()
+
+        self.assertIs(get_gnupg(), gnupg)
+        self.assertEqual(gnupg.default_keyring, os.path.join(settings.MENTORS_ROOT, 'gpg', 'pubring.gpg'))
+        self.assertTrue(os.path.isdir(os.path.join(settings.MENTORS_ROOT, 'gpg')))
+
+    def test_keyring(self):
+        keyring = os.path.join(settings.MENTORS_ROOT, 'other', 'pubring.gpg')
+
+        self.assertIs(get_gnupg(keyring), get_gnupg(keyring))
+        self.assertIsNot(get_gnupg(keyring), get_gnupg())
+        self.assertEqual(get_gnupg(keyring).default_keyring, keyring)
+
+    def test_settings_override(self):
+        gnupg = get_gnupg()
+
+        with OverrideMentorsRoot():
+            self.assertIsNot(get_gnupg(), gnupg)
+
+        with override_settings(MENTORS_GPG_TIMEOUT=1):
+            self.assertEqual(get_gnupg().timeout, 1)
+        self.assertEqual(get_gnupg().timeout, settings.MENTORS_GPG_TIMEOUT)
@@ -0,0 +1,61 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/tests/test_views.py: tests for the site-wide views
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import json
+
+from django.core.urlresolvers import reverse
+
+from lib.test import TestCase
+from lib.utils import get_gnupg
+from profiles.models import MentorsUser
+
+
+class GpgMetricsViewTests(TestCase):
+    def setUp(self):
+        self.user = MentorsUser.objects.create_user('user@example.com', 'test_pwd')
+        self.staff = MentorsUser.objects.create_user('staff@example.com', 'test_pwd')
+        self.staff.is_staff = True
+        self.staff.save()
+
+    def test_staff_only(self):
+        self.client.login(username='user@example.com', password='test_pwd')
+        response = self.client.get(reverse('gpg_metrics'))
+        self.assertRedirects(response, reverse('login') + '?next=%s' % reverse('gpg_metrics'))
+
+    def test_metrics(self):
+        get_gnupg().export_keys()
+
+        self.client.login(username='staff@example.com', password='test_pwd')
+        response = self.client.get(reverse('gpg_metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['commands']['export']['count'], 1)
+        self.assertEqual(data['limiter']['running'], 0)
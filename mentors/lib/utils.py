@@ -29,16 +29,142 @@
 #
 
 import os
+import threading
 
 from django.conf import settings
+from django.core.cache import get_cache
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_by_path
 
 from . import gnupg
 
 
-# Provide a well-configured instance of the GnuPG object
-def get_gnupg():
-    gpg_dir = os.path.join(settings.MENTORS_ROOT, 'gpg')
-    if not os.path.exists(gpg_dir):
-        os.makedirs(gpg_dir)
-    pubring = os.path.join(gpg_dir, 'pubring.gpg')
-    return gnupg.GnuPG(default_keyring=pubring)
+_key_block_cache = None
+_verify_cache = None
+_limiter = None
+_metrics = None
+
+# GnuPG and ShardedKeyring objects, by keyring path
+_gnupg_instances = {}
+_sharded_keyrings = {}
+_gnupg_instances_lock = threading.Lock()
+
+
+# The parsed key blocks are shared by all the GnuPG objects of the process
+def get_key_block_cache():
+    global _key_block_cache
+
+    if _key_block_cache is None and settings.MENTORS_GPG_KEY_BLOCK_CACHE_SIZE:
+        shared_cache = None
+        if settings.MENTORS_GPG_KEY_BLOCK_CACHE_BACKEND:
+            shared_cache = get_cache(settings.MENTORS_GPG_KEY_BLOCK_CACHE_BACKEND)
+        _key_block_cache = gnupg.GpgResultCache(
+            size=settings.MENTORS_GPG_KEY_BLOCK_CACHE_SIZE,
+            shared_cache=shared_cache,
+            prefix='gpg-key-block',
+        )
+    return _key_block_cache
+
+
+# The signature verification results are shared by all the GnuPG objects of
+# the process
+def get_verify_cache():
+    global _verify_cache
+
+    if _verify_cache is None and settings.MENTORS_GPG_VERIFY_CACHE_SIZE:
+        shared_cache = None
+        if settings.MENTORS_GPG_VERIFY_CACHE_BACKEND:
+            shared_cache = get_cache(settings.MENTORS_GPG_VERIFY_CACHE_BACKEND)
+        _verify_cache = gnupg.GpgResultCache(
+            size=settings.MENTORS_GPG_VERIFY_CACHE_SIZE,
+            shared_cache=shared_cache,
+            prefix='gpg-verify',
+            timeout=settings.MENTORS_GPG_VERIFY_CACHE_TIMEOUT,
+        )
+    return _verify_cache
+
+
+# All the gpg processes started by this process share the same limits
+def get_gpg_limiter():
+    global _limiter
+
+    if _limiter is None:
+        _limiter = gnupg.GpgLimiter(
+            max_processes=settings.MENTORS_GPG_MAX_PROCESSES,
+            lock_dir=os.path.join(settings.MENTORS_ROOT, 'gpg', 'locks'),
+            max_host_processes=settings.MENTORS_GPG_MAX_HOST_PROCESSES,
+            wait=settings.MENTORS_GPG_OVERLOAD_WAIT,
+        )
+    return _limiter
+
+
+# The timing events of all the gpg runs of the process go to the same sink
+def get_gpg_metrics():
+    global _metrics
+
+    if _metrics is None and settings.MENTORS_GPG_METRICS_SINK:
+        _metrics = import_by_path(settings.MENTORS_GPG_METRICS_SINK)()
+    return _metrics
+
+
+# Provide a well-configured instance of the GnuPG object, built once per
+# process for each keyring (by default, the one in MENTORS_ROOT)
+def get_gnupg(keyring=None):
+    if keyring is None:
+        keyring = os.path.join(settings.MENTORS_ROOT, 'gpg', 'pubring.gpg')
+
+    instance = _gnupg_instances.get(keyring)
+    if instance is not None:
+        return instance
+
+    with _gnupg_instances_lock:
+        instance = _gnupg_instances.get(keyring)
+        if instance is None:
+            gpg_dir = os.path.dirname(keyring)
+            if not os.path.exists(gpg_dir):
+                os.makedirs(gpg_dir)
+            instance = gnupg.GnuPG(default_keyring=keyring,
+                                   key_block_cache=get_key_block_cache(),
+                                   verify_cache=get_verify_cache(),
+                                   in_process_parsing=settings.MENTORS_GPG_IN_PROCESS_KEY_PARSING,
+                                   timeout=settings.MENTORS_GPG_TIMEOUT,
+                                   limiter=get_gpg_limiter(),
+                                   metrics=get_gpg_metrics(),
+                                   signing_homedir=os.path.join(settings.MENTORS_ROOT, 'gpg', 'signing'),
+                                   signing_key=settings.MENTORS_GPG_SIGNING_KEY,
+                                   trust_model=settings.MENTORS_GPG_TRUST_MODEL,
+                                   auto_check_trustdb=settings.MENTORS_GPG_AUTO_CHECK_TRUSTDB)
+            _gnupg_instances[keyring] = instance
+    return instance
+
+
+# Provide the keyring holding the keys of the users: the default keyring of
+# get_gnupg(), or, if MENTORS_GPG_KEYRING_SHARDS is set, a ShardedKeyring in
+# MENTORS_ROOT/gpg/shards
+def get_keyring():
+    if not settings.MENTORS_GPG_KEYRING_SHARDS:
+        return get_gnupg()
+
+    directory = os.path.join(settings.MENTORS_ROOT, 'gpg', 'shards')
+    keyring = _sharded_keyrings.get(directory)
+    if keyring is None:
+        gpg = get_gnupg()
+        with _gnupg_instances_lock:
+            keyring = _sharded_keyrings.get(directory)
+            if keyring is None:
+                keyring = gnupg.ShardedKeyring(gpg, directory, shards=settings.MENTORS_GPG_KEYRING_SHARDS)
+                _sharded_keyrings[directory] = keyring
+    return keyring
+
+
+# Rebuild the gpg objects when tests override their settings
+@receiver(setting_changed)
+def reset_gnupg(sender, setting, **kwargs):
+    global _key_block_cache, _verify_cache, _limiter, _metrics
+
+    if setting.startswith('MENTORS_GPG_'):
+        with _gnupg_instances_lock:
+            _gnupg_instances.clear()
+            _sharded_keyrings.clear()
+            _key_block_cache = _verify_cache = _limiter = _metrics = None
@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+#
+# lib/views.py: Site-wide views.
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import json
+
+from django.contrib.auth.decorators import user_passes_test
+from django.http import HttpResponse
+
+from .utils import get_gpg_limiter, get_gpg_metrics, get_key_block_cache, get_verify_cache
+
+
+@user_passes_test(lambda user: user.is_staff)
+def gpg_metrics(request):
+    """The gpg metrics of this process, as JSON"""
+    metrics = get_gpg_metrics()
+    key_block_cache = get_key_block_cache()
+    verify_cache = get_verify_cache()
+
+    data = {
+        'commands': metrics.stats() if hasattr(metrics, 'stats') else None,
+        'limiter': get_gpg_limiter().stats(),
+        'key_block_cache': key_block_cache.stats() if key_block_cache is not None else None,
+        'verify_cache': verify_cache.stats() if verify_cache is not None else None,
+    }
+    return HttpResponse(json.dumps(data, indent=2, sort_keys=True), content_type='application/json')
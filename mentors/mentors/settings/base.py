@@ -171,6 +171,9 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+
+    # Turn gpg overload errors into "503 Service Unavailable" responses
+    'lib.middleware.GpgOverloadedMiddleware',
 )
 ########## END MIDDLEWARE CONFIGURATION
 
@@ -211,6 +214,7 @@ THIRD_PARTY_APPS = (
 LOCAL_APPS = (
     'profiles',
     'deblayout',
+    'repository',
 )
 
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#installed-apps
@@ -338,4 +342,106 @@ WSGI_APPLICATION = 'wsgi.application'
 ########## MENTORS-SPECIFIC CONFIGURATION
 # See: docs/installing.rst
 MENTORS_ROOT = environ.get('MENTORS_ROOT', normpath(join(SITE_ROOT, 'var')))
+
+# Number of parsed PGP key blocks kept in memory by each process (0 disables
+# the cache)
+MENTORS_GPG_KEY_BLOCK_CACHE_SIZE = 1024
+
+# Name of the Django cache in which parsed PGP key blocks are shared between
+# processes (None to only cache them in-process)
+MENTORS_GPG_KEY_BLOCK_CACHE_BACKEND = None
+
+# Parse the usual PGP key blocks in-process instead of running gpg (gpg is
+# still used for the keys the in-process parser doesn't support)
+MENTORS_GPG_IN_PROCESS_KEY_PARSING = True
+
+# Number of signature verification results kept in memory by each process, for
+# the same signed data and keyring (0 disables the cache)
+MENTORS_GPG_VERIFY_CACHE_SIZE = 256
+
+# Name of the Django cache in which signature verification results are shared
+# between processes (None to only cache them in-process)
+MENTORS_GPG_VERIFY_CACHE_BACKEND = None
+
+# Number of seconds a signature verification result is kept (None for no
+# limit). Results are also dropped when the signature expires; this bounds
+# how long a signature by a key that has expired since stays valid.
+MENTORS_GPG_VERIFY_CACHE_TIMEOUT = 600
+
+# Number of keyrings the keys of the users are spread in, by fingerprint, in
+# MENTORS_ROOT/gpg/shards (None to keep all of them in MENTORS_ROOT/gpg/pubring.gpg;
+# run the split_keyring command when enabling this)
+MENTORS_GPG_KEYRING_SHARDS = None
+
+# Instead of deleting the key from the keyring, reconcile the whole keyring
+# with the database after each save or deletion of a GPGKey (this lists the
+# whole keyring each time; the reconcile_keyring command can be run
+# periodically instead). The changed keys are imported either way.
+MENTORS_GPG_RECONCILE_ON_SAVE = False
+
+# Key id of the key signing the repository metadata, in the gpg homedir
+# MENTORS_ROOT/gpg/signing (None for the default key of that homedir). The key
+# must not be protected by a passphrase.
+MENTORS_GPG_SIGNING_KEY = None
+
+# Trust model passed to gpg (None for gpg's default). The signature checks
+# don't depend on the web of trust, and 'always' spares gpg the trust database
+# lookups.
+MENTORS_GPG_TRUST_MODEL = 'always'
+
+# Let gpg check its trust database whenever it deems it necessary, which can
+# happen in the middle of a request. When False, run the maintain_keyring
+# command periodically instead.
+MENTORS_GPG_AUTO_CHECK_TRUSTDB = False
+
+# HKP keyserver the refresh_keys command fetches the updates of the registered
+# keys from (hkp://, hkps://, http:// or https:// URL)
+MENTORS_GPG_KEYSERVER = 'hkps://keyserver.ubuntu.com'
+
+# Maximum number of requests to the keyserver made at once by refresh_keys
+MENTORS_GPG_KEYSERVER_CONCURRENCY = 4
+
+# Number of seconds after which a keyserver request is given up
+MENTORS_GPG_KEYSERVER_TIMEOUT = 30
+
+# Number of seconds after which a gpg process gets killed (None for no limit)
+MENTORS_GPG_TIMEOUT = 60
+
+# Maximum number of gpg processes run at once by each process (None for no
+# limit)
+MENTORS_GPG_MAX_PROCESSES = 8
+
+# Maximum number of gpg processes run at once by all the processes sharing
+# MENTORS_ROOT, using lock files in MENTORS_ROOT/gpg/locks (None for no limit)
+MENTORS_GPG_MAX_HOST_PROCESSES = None
+
+# Number of seconds to wait for the number of gpg processes to go under the
+# limits before giving up with an "overloaded" error
+MENTORS_GPG_OVERLOAD_WAIT = 5
+
+# Dotted path of the class receiving the timing event of each gpg run (None to
+# disable the gpg metrics). The default one aggregates them in per-command
+# latency histograms, shown to staff members at /metrics/gpg/. The events are
+# also logged by the lib.gnupg logger, at the DEBUG level.
+MENTORS_GPG_METRICS_SINK = 'lib.gnupg.GpgMetrics'
+
+# Cache backend (a key of CACHES) of the key lookups served at
+# /profiles/keys/<search>/, None to always query the database
+MENTORS_KEY_LOOKUP_CACHE_BACKEND = 'default'
+
+# Number of seconds the key lookups are kept in MENTORS_KEY_LOOKUP_CACHE_BACKEND.
+# Changing a key, or the email address or activation of its owner, makes all
+# the processes forget the lookups right away (see profiles.lookup).
+MENTORS_KEY_LOOKUP_CACHE_TIMEOUT = 3600
+
+# Number of seconds clients and proxies may reuse the served keys without
+# revalidating them
+MENTORS_KEY_LOOKUP_MAX_AGE = 3600
+
+# Number of files of an upload whose digests are computed at once
+MENTORS_DIGEST_WORKERS = 4
+
+# Number of seconds an unreferenced file of the pool is kept before being
+# garbage collected, so that the uploads being processed keep theirs
+MENTORS_POOL_GC_MIN_AGE = 3600
 ########## END MENTORS-SPECIFIC CONFIGURATION
@@ -11,5 +11,7 @@ urlpatterns = patterns(
 
     url(r'^profiles/', include('profiles.urls')),
 
+    url(r'^metrics/gpg/$', 'lib.views.gpg_metrics', name='gpg_metrics'),
+
     url(r'^django-admin/', include(admin.site.urls)),
 )
@@ -78,5 +78,15 @@ class MentorsUserAdmin(UserAdmin):
     ordering = ('email', 'full_name')
     filter_horizontal = ()
 
+
+class GPGKeyAdmin(admin.ModelAdmin):
+    # Only display the columns filled in at save time, so that listing the
+    # keys doesn't need to run gpg.
+    list_display = ('fingerprint', 'algorithm', 'key_id', 'owner')
+    list_select_related = True
+    readonly_fields = ('algorithm', 'fingerprint', 'key_id', 'long_key_id', 'user_ids')
+    search_fields = ('fingerprint', 'owner__email', 'user_ids')
+
+
 admin.site.register(MentorsUser, MentorsUserAdmin)
-admin.site.register(GPGKey)
+admin.site.register(GPGKey, GPGKeyAdmin)
@@ -34,6 +34,7 @@ from django.utils.safestring import mark_safe
 
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit
+from django.forms.models import BaseInlineFormSet
 from extra_views import InlineFormSet
 
 from lib.utils import get_gnupg
@@ -140,10 +141,17 @@ class SetPasswordForm(auth_forms.SetPasswordForm):
 
 
 class GPGKeyInputWidget(forms.FileInput):
+    # The GPGKey instance being edited, set by GPGKeyUploadForm
+    instance = None
+
     def render(self, name, value, attrs=None):
         if value:
-            key = get_gnupg().parse_key_block(value).key
-            return mark_safe("<div>Existing key: %(key)s</div>" % {'key': "%s%s/%s" % (key.strength, key.type, key.fingerprint[-16:])})
+            if self.instance is not None and self.instance.key == value and self.instance.fingerprint:
+                key = "%s/%s" % (self.instance.algorithm, self.instance.fingerprint[-16:])
+            else:
+                key = get_gnupg().parse_key_block(value).key
+                key = "%s%s/%s" % (key.strength, key.type, key.fingerprint[-16:])
+            return mark_safe("<div>Existing key: %(key)s</div>" % {'key': key})
         else:
             return super(GPGKeyInputWidget, self).render(name, None, attrs)
 
@@ -157,21 +165,49 @@ class GPGKeyInputWidget(forms.FileInput):
             return None
 
 
+class GPGKeyField(forms.CharField):
+    """The contents of an uploaded key. No upload leaves the key unchanged"""
+    widget = GPGKeyInputWidget
+
+    def _has_changed(self, initial, data):
+        if data is None:
+            return False
+        return super(GPGKeyField, self)._has_changed(initial, data)
+
+
 class GPGKeyUploadForm(forms.ModelForm):
     """A form to allow upload of a GPG key"""
+    key = GPGKeyField(label='Key contents')
+
     def __init__(self, *args, **kwargs):
         self.helper = FormHelper()
         self.helper.form_tag = False
 
         super(GPGKeyUploadForm, self).__init__(*args, **kwargs)
+        self.fields['key'].widget.instance = self.instance
+        # Existing keys are kept when no new key is uploaded
+        self.fields['key'].required = self.instance.pk is None
+
+    def clean_key(self):
+        return self.cleaned_data['key'] or self.instance.key
 
     class Meta:
         model = GPGKey
         fields = ('key',)
-        widgets = {'key': GPGKeyInputWidget()}
+
+
+class BaseGPGKeyFormSet(BaseInlineFormSet):
+    """Save the changed keys of the formset with a single keyring import"""
+    def save(self, commit=True):
+        instances = super(BaseGPGKeyFormSet, self).save(commit=False)
+        if commit:
+            GPGKey.save_keys(instances)
+            self.save_m2m()
+        return instances
 
 
 class InlineGPGKeyFormSet(InlineFormSet):
     model = GPGKey
     extra = 1
     form_class = GPGKeyUploadForm
+    formset_class = BaseGPGKeyFormSet
@@ -0,0 +1,300 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/keyring.py: Bulk operations on the mentors keyring
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from lib import hkp, openpgp
+from lib.gnupg import GpgBaseException, GpgFailure
+from lib.utils import get_gnupg, get_keyring
+from profiles.lookup import forget_key_lookups
+from profiles.models import GPGKey, MentorsUser
+
+
+# A key of the imported keyring that didn't make it to the database
+KeyReject = namedtuple('KeyReject', ['fingerprint', 'reason'])
+
+KeyringImport = namedtuple('KeyringImport', ['imported', 'rejected'])
+
+KeyringReconciliation = namedtuple('KeyringReconciliation',
+                                   ['to_import',  # fingerprints missing from the keyring
+                                    'to_delete',  # fingerprints missing from the database
+                                    'timings',  # seconds spent in each step
+                                    ])
+
+KeyRefresh = namedtuple('KeyRefresh',
+                        ['updated',  # fingerprints of the keys updated from the keyserver
+                         'unchanged',  # fingerprints of the keys the keyserver has no news of
+                         'rejected',  # KeyReject of the keys that couldn't be refreshed
+                         ])
+
+logger = logging.getLogger(__name__)
+
+
+def chunks(items, size):
+    """Splits the ``items`` list in lists of at most ``size`` items"""
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def import_keyring(path=None, data=None, chunk_size=500, progress=None):
+    """
+    Import all the keys of a keyring (binary, or one or several armored
+    key blocks) in the mentors keyring (see lib.utils.get_keyring), and register them for the users
+    whose email address is in one of their user ids.
+
+    The keys are split and parsed in-process, the users and the already
+    registered keys are looked up ``chunk_size`` at a time, the GPGKey
+    rows are inserted ``chunk_size`` at a time and the keys are imported
+    with a single gpg run.
+
+    ``progress``, if not None, is called with the number of processed
+    keys and the total number of keys after each chunk.
+
+    Returns a KeyringImport(imported, rejected) with the list of the new
+    GPGKey objects and the list of the KeyReject(fingerprint, reason) of
+    the keys that weren't imported.
+    """
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+    gnupg = get_gnupg()
+    rejected = []
+
+    key_blocks = []
+    for key_block_data in openpgp.split_key_blocks(data):
+        try:
+            key_blocks.append((key_block_data, gnupg.parse_key_block(data=key_block_data)))
+        except GpgBaseException:
+            rejected.append(KeyReject(None, 'invalid key block'))
+
+    emails = set(user_id.email for (key_block_data, key_block) in key_blocks for user_id in key_block.user_ids)
+    users = {}
+    for emails_chunk in chunks(list(emails), chunk_size):
+        users.update((user.email, user) for user in MentorsUser.objects.filter(email__in=emails_chunk))
+
+    fingerprints = [key_block.key.fingerprint for (key_block_data, key_block) in key_blocks]
+    registered = set()
+    for fingerprints_chunk in chunks(fingerprints, chunk_size):
+        registered.update(GPGKey.objects.filter(fingerprint__in=fingerprints_chunk)
+                          .values_list('fingerprint', flat=True))
+
+    keys = []
+    keys_data = []
+    for key_block_data, key_block in key_blocks:
+        fingerprint = key_block.key.fingerprint
+        if fingerprint in registered:
+            rejected.append(KeyReject(fingerprint, 'already registered'))
+            continue
+
+        for user_id in key_block.user_ids:
+            owner = users.get(user_id.email)
+            if owner is not None:
+                break
+        else:
+            rejected.append(KeyReject(fingerprint, 'no matching user'))
+            continue
+
+        key = GPGKey(owner=owner,
+                     key=openpgp.armor(key_block_data),
+                     fingerprint=fingerprint,
+                     algorithm="%(strength)s%(type)s" % (key_block.key._asdict()),
+                     key_id=key_block.key.id,
+                     long_key_id=fingerprint[-16:])
+        key.set_user_ids(key_block.user_ids)
+        keys.append(key)
+        keys_data.append(key_block_data)
+        registered.add(fingerprint)
+
+    total = len(keys) + len(rejected)
+    done = len(rejected)
+    with transaction.atomic():
+        for keys_chunk in chunks(keys, chunk_size):
+            GPGKey.objects.bulk_create(keys_chunk)
+            done += len(keys_chunk)
+            if progress is not None:
+                progress(done, total)
+
+        if keys_data:
+            result = get_keyring().add_key(data=''.join(keys_data))
+            if not result.success:
+                raise GpgFailure('gpg --import failed: %s' % result.err)
+
+    # The owners' lookups by email now have more keys
+    forget_key_lookups()
+
+    return KeyringImport(keys, rejected)
+
+
+def reconcile_keyring(dry_run=False, chunk_size=500):
+    """
+    Make the mentors keyring hold exactly the keys of the GPGKey table:
+    import the registered keys missing from the keyring, and delete the
+    keys of the keyring that aren't registered, ``chunk_size`` keys per
+    gpg run.
+
+    If ``dry_run`` is True, only compute what needs to be done.
+
+    Returns a KeyringReconciliation(to_import, to_delete, timings).
+    """
+    keyring = get_keyring()
+    timings = {}
+
+    start = time.time()
+    registered = set(GPGKey.objects.values_list('fingerprint', flat=True))
+    timings['database'] = time.time() - start
+
+    start = time.time()
+    in_keyring = set(key_block.key.fingerprint for key_block in keyring.list_keys(with_colons=True))
+    timings['keyring'] = time.time() - start
+
+    to_import = sorted(registered - in_keyring)
+    to_delete = sorted(in_keyring - registered)
+
+    if not dry_run:
+        start = time.time()
+        for fingerprints_chunk in chunks(to_import, chunk_size):
+            keys = GPGKey.objects.filter(fingerprint__in=fingerprints_chunk).values_list('key', flat=True)
+            result = keyring.add_key(data='\n'.join(keys))
+            if not result.success:
+                raise GpgFailure('gpg --import failed: %s' % result.err)
+        timings['import'] = time.time() - start
+
+        start = time.time()
+        for fingerprints_chunk in chunks(to_delete, chunk_size):
+            result = keyring.remove_keys(fingerprints_chunk)
+            if not result.success:
+                raise GpgFailure('gpg --delete-key failed: %s' % result.err)
+        timings['delete'] = time.time() - start
+
+    logger.info('%s keyring reconciliation: %d keys to import, %d keys to delete (%s)',
+                'Dry-run' if dry_run else 'Done', len(to_import), len(to_delete),
+                ', '.join('%s: %.3fs' % timing for timing in sorted(timings.items())))
+
+    return KeyringReconciliation(to_import, to_delete, timings)
+
+
+def refresh_keys(keyserver=None, concurrency=None, chunk_size=500):
+    """
+    Fetch the registered keys from the HKP ``keyserver`` (by default,
+    MENTORS_GPG_KEYSERVER), with at most ``concurrency`` requests at once,
+    and update the ones that changed: new subkeys, signatures or expiry
+    dates.
+
+    The requests are conditional on the validators of the previous
+    answer of the keyserver. The keys whose packets didn't change are left
+    alone; the changed keys are saved, and imported in the mentors keyring
+    with one gpg run per ``chunk_size`` keys. A key that doesn't hold its
+    owner's email address anymore isn't updated.
+
+    Returns a KeyRefresh(updated, unchanged, rejected).
+    """
+    client = hkp.HKPClient(keyserver or settings.MENTORS_GPG_KEYSERVER,
+                           timeout=settings.MENTORS_GPG_KEYSERVER_TIMEOUT)
+    if concurrency is None:
+        concurrency = settings.MENTORS_GPG_KEYSERVER_CONCURRENCY
+    gnupg = get_gnupg()
+    now = timezone.now()
+
+    keys = dict((key.fingerprint, key) for key in GPGKey.objects.select_related('owner'))
+    requests = [(fingerprint, key.keyserver_etag, key.keyserver_last_modified)
+                for fingerprint, key in keys.iteritems()]
+
+    updated = []
+    unchanged = []
+    rejected = []
+    for fingerprint, result, error in client.fetch_keys(requests, concurrency):
+        key = keys[fingerprint]
+        if error is not None:
+            rejected.append(KeyReject(fingerprint, 'keyserver error: %s' % error))
+            continue
+        if result.status == hkp.KEY_NOT_FOUND:
+            rejected.append(KeyReject(fingerprint, 'not on the keyserver'))
+            continue
+
+        key.refreshed = now
+        key.keyserver_etag = result.etag or ''
+        key.keyserver_last_modified = result.last_modified or ''
+        reason = None
+        if result.status == hkp.KEY_MODIFIED:
+            try:
+                reason = _refresh_key(gnupg, key, result.data)
+            except (GpgBaseException, openpgp.OpenPGPError) as e:
+                reason = 'invalid key block: %s' % e
+            if reason is None and key.key_changed():
+                updated.append(key)
+                continue
+
+        GPGKey.objects.filter(pk=key.pk).update(refreshed=key.refreshed, keyserver_etag=key.keyserver_etag,
+                                                keyserver_last_modified=key.keyserver_last_modified)
+        if reason is not None:
+            rejected.append(KeyReject(fingerprint, reason))
+        else:
+            unchanged.append(fingerprint)
+
+    for keys_chunk in chunks(updated, chunk_size):
+        with transaction.atomic():
+            GPGKey.save_keys(keys_chunk)
+
+    logger.info('Key refresh from %s: %d keys updated, %d unchanged, %d rejected',
+                client.base_url, len(updated), len(unchanged), len(rejected))
+
+    return KeyRefresh(sorted(key.fingerprint for key in updated), sorted(unchanged), rejected)
+
+
+def _refresh_key(gnupg, key, data):
+    """
+    Replace the contents of ``key`` with its key block in ``data``, unless
+    its packets are the same. Returns why the key can't be updated, or None.
+    """
+    for key_block_data in openpgp.split_key_blocks(data):
+        if gnupg.parse_key_block(data=key_block_data).key.fingerprint == key.fingerprint:
+            break
+    else:
+        return 'not returned by the keyserver'
+
+    if list(openpgp.split_key_blocks(key.key)) == [key_block_data]:
+        return None
+
+    old_key = key.key
+    key.key = openpgp.armor(key_block_data)
+    try:
+        key.clean()
+    except ValidationError:
+        key.key = old_key
+        return 'no user id of the owner'
+    return None
@@ -0,0 +1,134 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/lookup.py: Lookups of the registered keys
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Lookups of the registered keys by fingerprint, long key id or owner email,
+served from the stored key contents (without running gpg) through a cache.
+
+The cache keys hold the generation of the lookups, stored in the database
+(see KeyLookupGeneration): changing a key, or the email address or
+activation of its owner, increments it, so that no process keeps serving
+the previous lookups, whatever the cache backend.
+"""
+
+import hashlib
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from profiles.models import GPGKey, KeyLookupGeneration
+
+KeyLookup = namedtuple('KeyLookup',
+                       ['etag',  # SHA-256 digest of data
+                        'data',  # the armored key blocks, in fingerprint order
+                        ])
+
+HEX_RE = re.compile(r'^(?:0x)?([0-9a-f]+)$', re.IGNORECASE)
+
+
+def lookup_field(search):
+    """
+    The (GPGKey lookup, value) matching ``search``: a fingerprint, a long
+    key id (maybe prefixed with 0x) or an email address. None if ``search``
+    is none of them.
+    """
+    if '@' in search:
+        return 'owner__email', search
+    match = HEX_RE.match(search)
+    if match is None:
+        return None
+    value = match.group(1).upper()
+    if len(value) == 40:
+        return 'fingerprint', value
+    if len(value) == 16:
+        return 'long_key_id', value
+    return None
+
+
+def _cache():
+    if settings.MENTORS_KEY_LOOKUP_CACHE_BACKEND:
+        return get_cache(settings.MENTORS_KEY_LOOKUP_CACHE_BACKEND)
+    return None
+
+
+def _cache_key(generation, field, value):
+    # Email addresses aren't valid memcached keys
+    return 'key-lookup:%d:%s:%s' % (generation, field, hashlib.sha1(value.encode('utf-8')).hexdigest())
+
+
+def lookup_generation():
+    """The current generation of the key lookups"""
+    generations = KeyLookupGeneration.objects.filter(pk=1).values_list('generation', flat=True)
+    return generations[0] if generations else 0
+
+
+def lookup_keys(search):
+    """
+    The KeyLookup of the keys of active users matching ``search`` (see
+    lookup_field), or None if there are none.
+    """
+    field = lookup_field(search)
+    if field is None:
+        return None
+
+    cache = _cache()
+    if cache is not None:
+        cache_key = _cache_key(lookup_generation(), *field)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return KeyLookup(*cached)
+
+    keys = (GPGKey.objects.filter(owner__is_active=True, **dict([field]))
+            .order_by('fingerprint').values_list('key', flat=True))
+    if not keys:
+        return None
+
+    data = ''.join(key.strip() + '\n' for key in keys).encode('utf-8')
+    result = KeyLookup(hashlib.sha256(data).hexdigest(), data)
+    if cache is not None:
+        cache.set(cache_key, tuple(result), settings.MENTORS_KEY_LOOKUP_CACHE_TIMEOUT)
+    return result
+
+
+def forget_key_lookups():
+    """Drop the cached lookups, in all the processes, by incrementing their generation"""
+    if _cache() is None:
+        return
+    if not KeyLookupGeneration.objects.filter(pk=1).update(generation=F('generation') + 1):
+        try:
+            with transaction.atomic():
+                KeyLookupGeneration.objects.create(pk=1, generation=1)
+        except IntegrityError:
+            # Created in the meantime
+            KeyLookupGeneration.objects.filter(pk=1).update(generation=F('generation') + 1)
@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/management/commands/import_keyring.py: Import an existing keyring
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.gnupg import GpgBaseException
+from lib.openpgp import OpenPGPError
+from profiles.keyring import import_keyring
+
+
+class Command(BaseCommand):
+    args = '<keyring>'
+    help = ("Import the keys of a keyring in the mentors keyring, for the users "
+            "whose email address is in their user ids")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of keys looked up and inserted at once'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: import_keyring %s' % self.args)
+        verbosity = int(options['verbosity'])
+
+        def progress(done, total):
+            if verbosity >= 1:
+                self.stdout.write('%d/%d keys processed' % (done, total))
+
+        try:
+            result = import_keyring(path=args[0], chunk_size=options['chunk_size'], progress=progress)
+        except (IOError, OpenPGPError, GpgBaseException) as e:
+            raise CommandError('Could not import %s: %s' % (args[0], e))
+
+        if verbosity >= 1:
+            for fingerprint, reason in result.rejected:
+                self.stdout.write('Rejected %s: %s' % (fingerprint or 'key', reason))
+        self.stdout.write('%d keys imported, %d rejected' % (len(result.imported), len(result.rejected)))
@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/management/commands/maintain_keyring.py: Offline keyring maintenance
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.gnupg import GpgBaseException, ShardedKeyring
+from lib.utils import get_gnupg, get_keyring
+
+
+class Command(BaseCommand):
+    help = ("Check gpg's trust database and compact the mentors keyrings; run it "
+            "periodically, ideally when the site is quiet")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--skip-trustdb', action='store_true', default=False,
+                    help="Don't check gpg's trust database"),
+        make_option('--skip-compaction', action='store_true', default=False,
+                    help="Don't compact the keyrings"),
+    )
+
+    def handle(self, *args, **options):
+        gnupg = get_gnupg()
+        keyring = get_keyring()
+        if isinstance(keyring, ShardedKeyring):
+            keyrings = keyring.keyrings()
+        else:
+            keyrings = [path for path in [gnupg.default_keyring] if os.path.exists(path)]
+
+        if not keyrings:
+            self.stdout.write('No keyring to maintain')
+            return
+
+        if not options['skip_trustdb']:
+            result = gnupg.check_trustdb(pubring=keyrings)
+            if not result.success:
+                raise CommandError('Could not check the trust database: %s' % result.err)
+            self.stdout.write('Trust database checked')
+
+        if not options['skip_compaction']:
+            for path in keyrings:
+                try:
+                    compaction = gnupg.compact_keyring(pubring=path)
+                except GpgBaseException as e:
+                    raise CommandError('Could not compact %s: %s' % (path, e))
+                self.stdout.write('%s: %d keys, %d bytes before, %d bytes after compaction' % (
+                    path, compaction.keys, compaction.size_before, compaction.size_after))
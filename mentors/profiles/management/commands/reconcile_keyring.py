@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/management/commands/reconcile_keyring.py: Sync the keyring with the database
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.gnupg import GpgBaseException
+from profiles.keyring import reconcile_keyring
+
+
+class Command(BaseCommand):
+    help = ("Import the registered keys missing from the mentors keyring, and delete "
+            "the keys of the keyring that aren't registered")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', default=False,
+                    help="Only report the keys to import and delete"),
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of keys imported or deleted per gpg run'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+
+        try:
+            result = reconcile_keyring(dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+        except GpgBaseException as e:
+            raise CommandError('Could not reconcile the keyring: %s' % e)
+
+        if verbosity >= 2 or options['dry_run']:
+            for fingerprint in result.to_import:
+                self.stdout.write('Import %s' % fingerprint)
+            for fingerprint in result.to_delete:
+                self.stdout.write('Delete %s' % fingerprint)
+
+        if options['dry_run']:
+            self.stdout.write('%d keys to import, %d keys to delete' % (len(result.to_import), len(result.to_delete)))
+        else:
+            self.stdout.write('%d keys imported, %d keys deleted' % (len(result.to_import), len(result.to_delete)))
+        if verbosity >= 1:
+            for step, seconds in sorted(result.timings.items()):
+                self.stdout.write('%s: %.3fs' % (step, seconds))
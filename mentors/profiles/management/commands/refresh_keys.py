@@ -0,0 +1,67 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/management/commands/refresh_keys.py: Update the registered keys from a keyserver
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.gnupg import GpgBaseException
+from profiles.keyring import refresh_keys
+
+
+class Command(BaseCommand):
+    help = ("Fetch the registered keys from the keyserver, and update the ones "
+            "that changed (new subkeys, signatures or expiry dates)")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--keyserver', default=None,
+                    help='URL of the HKP keyserver (default: MENTORS_GPG_KEYSERVER)'),
+        make_option('--concurrency', type='int', default=None,
+                    help='Number of requests made at once (default: MENTORS_GPG_KEYSERVER_CONCURRENCY)'),
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of keys imported per gpg run'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+
+        try:
+            result = refresh_keys(keyserver=options['keyserver'], concurrency=options['concurrency'],
+                                  chunk_size=options['chunk_size'])
+        except GpgBaseException as e:
+            raise CommandError('Could not import the refreshed keys: %s' % e)
+
+        if verbosity >= 2:
+            for fingerprint in result.updated:
+                self.stdout.write('Updated %s' % fingerprint)
+        for fingerprint, reason in result.rejected:
+            self.stdout.write('Not refreshed %s: %s' % (fingerprint, reason))
+        self.stdout.write('%d keys updated, %d unchanged, %d not refreshed' % (
+            len(result.updated), len(result.unchanged), len(result.rejected)))
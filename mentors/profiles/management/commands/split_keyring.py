@@ -0,0 +1,54 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/management/commands/split_keyring.py: Split the keyring in shards
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.gnupg import GpgBaseException
+from lib.utils import get_gnupg, get_keyring
+
+
+class Command(BaseCommand):
+    help = ("Copy the keys of the mentors keyring in the shard keyrings, "
+            "when enabling MENTORS_GPG_KEYRING_SHARDS")
+
+    def handle(self, *args, **options):
+        if not settings.MENTORS_GPG_KEYRING_SHARDS:
+            raise CommandError('MENTORS_GPG_KEYRING_SHARDS is not set')
+
+        gnupg = get_gnupg()
+        keyring = get_keyring()
+        try:
+            count = keyring.import_keyring(gnupg.default_keyring)
+        except GpgBaseException as e:
+            raise CommandError('Could not split %s: %s' % (gnupg.default_keyring, e))
+
+        self.stdout.write('%d keys copied from %s to %d shards in %s' % (
+            count, gnupg.default_keyring, keyring.shards, keyring.directory))
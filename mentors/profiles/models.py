@@ -36,8 +36,8 @@ from django.db import models
 from django.utils.translation import ugettext as _
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 
-from lib.utils import get_gnupg
-from lib.gnupg import GpgInvalidKeyBlock
+from lib.utils import get_gnupg, get_keyring
+from lib.gnupg import GpgInvalidKeyBlock, GpgUserId
 
 
 class MentorsUserManager(BaseUserManager):
@@ -76,6 +76,25 @@ class MentorsUser(AbstractBaseUser, PermissionsMixin):
 
     objects = MentorsUserManager()
 
+    def __init__(self, *args, **kwargs):
+        super(MentorsUser, self).__init__(*args, **kwargs)
+        # What the key lookups by email depend on, as stored in the database
+        self._saved_lookup_fields = (self.email, self.is_active) if self.pk else None
+
+    def save(self, *args, **kwargs):
+        ret = super(MentorsUser, self).save(*args, **kwargs)
+        lookup_fields = (self.email, self.is_active)
+        if self._saved_lookup_fields not in (None, lookup_fields):
+            GPGKey._forget_lookups()
+        self._saved_lookup_fields = lookup_fields
+        return ret
+
+    def delete(self, *args, **kwargs):
+        # Deletes the keys too, without calling GPGKey.delete
+        ret = super(MentorsUser, self).delete(*args, **kwargs)
+        GPGKey._forget_lookups()
+        return ret
+
     def get_full_name(self):
         return "%s <%s>" % (self.full_name, self.email)
 
@@ -94,43 +113,151 @@ class GPGKey(models.Model):
     key = models.TextField(verbose_name=_('key contents'), blank=False)
     algorithm = models.CharField(max_length=10)
     fingerprint = models.CharField(max_length=128, unique=True)
+    key_id = models.CharField(verbose_name=_('key id'), max_length=16, blank=True)
+    # Indexed for the key lookups, see profiles.lookup
+    long_key_id = models.CharField(verbose_name=_('long key id'), max_length=16, blank=True, db_index=True)
+    user_ids = models.TextField(verbose_name=_('user ids'), blank=True)
+    # Validators of the last keyserver answer, for conditional requests
+    keyserver_etag = models.CharField(max_length=255, blank=True)
+    keyserver_last_modified = models.CharField(max_length=64, blank=True)
+    refreshed = models.DateTimeField(verbose_name=_('last refresh from the keyserver'), null=True, blank=True)
 
     def __init__(self, *args, **kwargs):
         super(GPGKey, self).__init__(*args, **kwargs)
-        self.gpg = get_gnupg()
+        # Key contents as stored in the database (a reference, not a copy)
+        self._saved_key = self.key if self.pk else None
+
+    @property
+    def gpg(self):
+        """The GnuPG object managing the mentors keyring"""
+        return get_gnupg()
+
+    @property
+    def keyring(self):
+        """The keyring holding the keys of the users, maybe sharded"""
+        return get_keyring()
 
     def as_key_block(self):
+        """Parse the key contents with gpg, once per distinct key contents"""
         from django.core.exceptions import ValidationError
-        if not hasattr(self, '__key_block'):
+        if getattr(self, '_key_block_source', None) != self.key:
             try:
-                self.__key_block = self.gpg.parse_key_block(data=self.key)
+                self._key_block = self.gpg.parse_key_block(data=self.key)
             except GpgInvalidKeyBlock:
                 raise ValidationError(_('The given key data is invalid'))
-        return self.__key_block
+            self._key_block_source = self.key
+        return self._key_block
+
+    def key_changed(self):
+        """Whether the key contents differ from the ones in the database"""
+        return self._saved_key is None or self._saved_key != self.key
+
+    def get_user_ids(self):
+        """The user ids stored at save time, as a list of GpgUserId"""
+        user_ids = []
+        for line in self.user_ids.splitlines():
+            name, _sep, email = line.rpartition(' <')
+            user_ids.append(GpgUserId(name, email.rstrip('>')))
+        return user_ids
+
+    def set_user_ids(self, user_ids):
+        self.user_ids = '\n'.join('%s <%s>' % (name, email) for name, email in user_ids)
 
     def clean(self):
         from django.core.exceptions import ValidationError
 
-        if self.as_key_block().key is None:
-            raise ValidationError(_('The given key data is invalid'))
+        changed = self.key_changed()
+        if changed:
+            key_block = self.as_key_block()
+            if key_block.key is None:
+                raise ValidationError(_('The given key data is invalid'))
+            user_ids = key_block.user_ids
+        else:
+            # The stored key was parsed when it was saved; its owner may have
+            # changed since
+            user_ids = self.get_user_ids()
 
-        for name, email in self.as_key_block().user_ids:
+        for name, email in user_ids:
             if email == self.owner.email:
                 break
         else:
             raise ValidationError(_('The given key does not belong to the user'))
 
-        self.fingerprint = self.as_key_block().key.fingerprint
-        self.algorithm = "%(strength)s%(type)s" % (self.as_key_block().key._asdict())
+        if not changed:
+            return
+
+        self.fingerprint = key_block.key.fingerprint
+        self.algorithm = "%(strength)s%(type)s" % (key_block.key._asdict())
+        self.key_id = key_block.key.id
+        self.long_key_id = self.fingerprint[-16:]
+        self.set_user_ids(key_block.user_ids)
 
     def save(self, *args, **kwargs):
+        """
+        Save the key, and import it in the keyring if its contents changed.
+
+        Callers saving several keys at once pass ``update_keyring=False``
+        and import all the changed keys themselves.
+        """
+        update_keyring = kwargs.pop('update_keyring', True)
+        changed = self.key_changed()
         self.clean()
-        self.gpg.add_key(data=self.key)
-        return super(GPGKey, self).save(*args, **kwargs)
+        if changed:
+            # Even when reconciling: it only compares the fingerprints, and
+            # wouldn't import new subkeys, expiry dates or revocations
+            if update_keyring:
+                self.keyring.add_key(data=self.key)
+        ret = super(GPGKey, self).save(*args, **kwargs)
+        self._saved_key = self.key
+        if changed:
+            self._forget_lookups()
+        if changed and update_keyring and settings.MENTORS_GPG_RECONCILE_ON_SAVE:
+            self._reconcile_keyring()
+        return ret
+
+    @classmethod
+    def save_keys(cls, keys):
+        """
+        Save several keys, importing the changed ones in the keyring with a
+        single gpg call.
+        """
+        changed = [key for key in keys if key.key_changed()]
+        for key in changed:
+            key.clean()
+        if changed:
+            get_keyring().add_key(data='\n'.join(key.key for key in changed))
+        for key in keys:
+            key.save(update_keyring=False)
+        if changed and settings.MENTORS_GPG_RECONCILE_ON_SAVE:
+            cls._reconcile_keyring()
 
     def delete(self, *args, **kwargs):
-        self.gpg.remove_key(self.fingerprint)
+        self._forget_lookups()
+        if settings.MENTORS_GPG_RECONCILE_ON_SAVE:
+            ret = super(GPGKey, self).delete(*args, **kwargs)
+            self._reconcile_keyring()
+            return ret
+        self.keyring.remove_key(self.fingerprint)
         return super(GPGKey, self).delete(*args, **kwargs)
 
+    @staticmethod
+    def _forget_lookups():
+        from profiles.lookup import forget_key_lookups
+        forget_key_lookups()
+
+    @staticmethod
+    def _reconcile_keyring():
+        from profiles.keyring import reconcile_keyring
+        reconcile_keyring()
+
     def __unicode__(self):
         return "%(algorithm)s/%(fingerprint)s" % self.__dict__
+
+
+class KeyLookupGeneration(models.Model):
+    """
+    A counter, in a single row, incremented whenever the served key lookups
+    may change: it is part of their cache keys (see profiles.lookup), so that
+    all the processes forget them at once.
+    """
+    generation = models.PositiveIntegerField(default=0)
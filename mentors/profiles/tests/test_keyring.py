@@ -0,0 +1,273 @@
+# -*- encoding: utf-8 -*-
+#
+# profiles/tests/test_keyring.py: Tests for the bulk keyring operations
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from __future__ import unicode_literals
+
+import os
+import struct
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+
+from lib import openpgp
+from lib.test import TestCase
+from lib.tests.test_gnupg import clement_gpg_key, test_gpg_key, test_gpg_key_fpr
+from lib.tests.test_hkp import HKPServer
+from lib.utils import get_keyring
+from profiles.keyring import import_keyring, reconcile_keyring, refresh_keys
+from profiles.models import GPGKey, MentorsUser
+
+
+class KeyringTestCase(TestCase):
+    #flake8: noqa
+    def setUp(self):
+        self.nicolas = MentorsUser.objects.create_user('nicolas@dandrimont.eu')
+        self.clement = MentorsUser.objects.create_user('clement@mux.me')
+
+        data_dir = os.path.join(os.path.dirname(__file__), 'data')
+        self.keyring = ''.join(file(os.path.join(data_dir, name)).read()
+                               for name in ('dandrimont.asc', 'schreiner.asc'))
+        # Nobody registered this one
+        self.keyring += test_gpg_key
+
+        self.nicolas_key_fingerprint = '791F12396630DD71FD364375B8E5087766475AAF'
+        self.clement_key_fingerprint = 'E4BA6F4097B08D5AE8DC68C95E39E0E38123F27C'
+
+
+class ImportKeyringTests(KeyringTestCase):
+    def test_import_keyring(self):
+        progress = []
+        result = import_keyring(data=self.keyring, chunk_size=1, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(len(result.imported), 2)
+        self.assertEqual(result.rejected, [(test_gpg_key_fpr, 'no matching user')])
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+
+        key = GPGKey.objects.get(owner=self.clement)
+        self.assertEqual(key.fingerprint, self.clement_key_fingerprint)
+        self.assertEqual(key.algorithm, '4096R')
+        self.assertEqual(key.key_id, '8123F27C')
+        self.assertIn('Clément Schreiner <clement@mux.me>', key.user_ids.splitlines())
+        # The stored key can be parsed again
+        self.assertEqual(key.as_key_block().key.fingerprint, self.clement_key_fingerprint)
+
+        fingerprints = [key_block.key.fingerprint for key_block in key.gpg.list_keys(with_colons=True)]
+        self.assertEqual(sorted(fingerprints), sorted([self.nicolas_key_fingerprint, self.clement_key_fingerprint]))
+
+    def test_import_twice(self):
+        import_keyring(data=self.keyring)
+        result = import_keyring(data=self.keyring)
+
+        self.assertEqual(result.imported, [])
+        self.assertEqual(len(result.rejected), 3)
+        self.assertIn((self.nicolas_key_fingerprint, 'already registered'), result.rejected)
+        self.assertEqual(GPGKey.objects.count(), 2)
+
+    def test_import_command(self):
+        keyring_path = os.path.join(os.path.dirname(GPGKey().gpg.default_keyring), 'import.asc')
+        with open(keyring_path, 'w') as f:
+            f.write(self.keyring)
+        stdout = StringIO()
+
+        call_command('import_keyring', keyring_path, stdout=stdout)
+
+        self.assertIn('2 keys imported, 1 rejected', stdout.getvalue())
+        self.assertEqual(GPGKey.objects.count(), 2)
+
+
+class ReconcileKeyringTests(KeyringTestCase):
+    def setUp(self):
+        super(ReconcileKeyringTests, self).setUp()
+        import_keyring(data=self.keyring)
+
+        # Out of sync keyring
+        self.gpg = GPGKey().gpg
+        self.gpg.remove_key(self.nicolas_key_fingerprint)
+        self.gpg.add_key(data=test_gpg_key)
+
+    def _keyring_fingerprints(self):
+        return sorted(key_block.key.fingerprint for key_block in self.gpg.list_keys(with_colons=True))
+
+    def test_reconcile_keyring(self):
+        result = reconcile_keyring(chunk_size=1)
+
+        self.assertEqual(result.to_import, [self.nicolas_key_fingerprint])
+        self.assertEqual(result.to_delete, [test_gpg_key_fpr])
+        self.assertEqual(sorted(result.timings), ['database', 'delete', 'import', 'keyring'])
+        self.assertEqual(self._keyring_fingerprints(), [self.nicolas_key_fingerprint, self.clement_key_fingerprint])
+
+        result = reconcile_keyring()
+        self.assertEqual((result.to_import, result.to_delete), ([], []))
+
+    def test_dry_run(self):
+        before = self._keyring_fingerprints()
+        stdout = StringIO()
+
+        call_command('reconcile_keyring', dry_run=True, stdout=stdout)
+
+        self.assertIn('Import %s' % self.nicolas_key_fingerprint, stdout.getvalue())
+        self.assertIn('Delete %s' % test_gpg_key_fpr, stdout.getvalue())
+        self.assertIn('1 keys to import, 1 keys to delete', stdout.getvalue())
+        self.assertEqual(self._keyring_fingerprints(), before)
+
+    @override_settings(MENTORS_GPG_RECONCILE_ON_SAVE=True)
+    def test_reconcile_on_save(self):
+        GPGKey.objects.get(owner=self.clement).delete()
+
+        self.assertEqual(self._keyring_fingerprints(), [self.nicolas_key_fingerprint])
+
+
+class MaintainKeyringTests(KeyringTestCase):
+    def test_maintain_keyring(self):
+        import_keyring(data=self.keyring)
+        gpg = GPGKey().gpg
+        gpg.remove_key(self.clement_key_fingerprint)
+        stdout = StringIO()
+
+        call_command('maintain_keyring', stdout=stdout)
+
+        self.assertIn('Trust database checked', stdout.getvalue())
+        self.assertIn('%s: 1 keys' % gpg.default_keyring, stdout.getvalue())
+        fingerprints = [key_block.key.fingerprint for key_block in gpg.list_keys(with_colons=True)]
+        self.assertEqual(fingerprints, [self.nicolas_key_fingerprint])
+
+    @override_settings(MENTORS_GPG_KEYRING_SHARDS=4)
+    def test_maintain_sharded(self):
+        import_keyring(data=self.keyring)
+        stdout = StringIO()
+
+        call_command('maintain_keyring', skip_trustdb=True, stdout=stdout)
+
+        self.assertNotIn('Trust database', stdout.getvalue())
+        self.assertEqual(stdout.getvalue().count('1 keys'), 2)
+
+
+class RefreshKeysTests(KeyringTestCase):
+    def setUp(self):
+        super(RefreshKeysTests, self).setUp()
+        # Clément's key, as registered before he added his other user ids
+        packets = []
+        user_ids = 0
+        for tag, body in openpgp.iter_packets(openpgp.dearmor(clement_gpg_key)):
+            user_ids += tag == openpgp.TAG_USER_ID
+            if user_ids > 1:
+                break
+            packets.append(chr(0xC0 | tag) + b'\xff' + struct.pack(b'>I', len(body)) + body)
+        import_keyring(data=openpgp.armor(b''.join(packets)) + self.keyring.replace(clement_gpg_key, ''))
+
+        self.server = HKPServer({self.clement_key_fingerprint: clement_gpg_key})
+
+    def tearDown(self):
+        self.server.stop()
+        super(RefreshKeysTests, self).tearDown()
+
+    def test_refresh_keys(self):
+        result = refresh_keys(keyserver=self.server.url, concurrency=2)
+
+        self.assertEqual(result.updated, [self.clement_key_fingerprint])
+        self.assertEqual(result.unchanged, [])
+        self.assertEqual(result.rejected, [(self.nicolas_key_fingerprint, 'not on the keyserver')])
+
+        key = GPGKey.objects.get(owner=self.clement)
+        self.assertEqual(len(key.user_ids.splitlines()), 4)
+        self.assertTrue(key.keyserver_etag)
+        self.assertIsNotNone(key.refreshed)
+        key_block = key.gpg.parse_key_block(data=key.gpg.export_keys([self.clement_key_fingerprint]))
+        self.assertEqual(len(key_block.user_ids), 4)
+
+        # The keyserver has no news of the key
+        result = refresh_keys(keyserver=self.server.url)
+        self.assertEqual((result.updated, result.unchanged), ([], [self.clement_key_fingerprint]))
+        self.assertIn(('0x%s' % self.clement_key_fingerprint, key.keyserver_etag), self.server.requests)
+
+    @override_settings(MENTORS_GPG_RECONCILE_ON_SAVE=True)
+    def test_refresh_reconcile_on_save(self):
+        # Same fingerprint, new user ids: reconciling alone wouldn't see it
+        self.assertEqual(refresh_keys(keyserver=self.server.url).updated, [self.clement_key_fingerprint])
+
+        gpg = GPGKey().gpg
+        key_block = gpg.parse_key_block(data=gpg.export_keys([self.clement_key_fingerprint]))
+        self.assertEqual(len(key_block.user_ids), 4)
+
+    @override_settings(MENTORS_GPG_RECONCILE_ON_SAVE=True)
+    def test_save_reconcile_on_save(self):
+        key = GPGKey.objects.get(owner=self.clement)
+        key.key = clement_gpg_key
+        key.save()
+
+        key_block = key.gpg.parse_key_block(data=key.gpg.export_keys([self.clement_key_fingerprint]))
+        self.assertEqual(len(key_block.user_ids), 4)
+
+    def test_refresh_wrong_key(self):
+        self.server.keys[self.nicolas_key_fingerprint] = clement_gpg_key
+        self.server.fail = True
+
+        result = refresh_keys(keyserver=self.server.url)
+        self.assertEqual(len(result.rejected), 2)
+        self.assertTrue(all(reason.startswith('keyserver error') for fpr, reason in result.rejected))
+
+        self.server.fail = False
+        result = refresh_keys(keyserver=self.server.url)
+        self.assertIn((self.nicolas_key_fingerprint, 'not returned by the keyserver'), result.rejected)
+        self.assertNotIn(self.nicolas_key_fingerprint, result.updated + result.unchanged)
+
+    def test_refresh_command(self):
+        stdout = StringIO()
+
+        call_command('refresh_keys', keyserver=self.server.url, verbosity=2, stdout=stdout)
+
+        self.assertIn('Updated %s' % self.clement_key_fingerprint, stdout.getvalue())
+        self.assertIn('Not refreshed %s: not on the keyserver' % self.nicolas_key_fingerprint, stdout.getvalue())
+        self.assertIn('1 keys updated, 0 unchanged, 1 not refreshed', stdout.getvalue())
+
+
+class ShardedKeyringTests(KeyringTestCase):
+    def test_split_keyring(self):
+        import_keyring(data=self.keyring)
+        stdout = StringIO()
+
+        with override_settings(MENTORS_GPG_KEYRING_SHARDS=4):
+            call_command('split_keyring', stdout=stdout)
+
+            fingerprints = [key_block.key.fingerprint for key_block in get_keyring().list_keys(with_colons=True)]
+            self.assertEqual(sorted(fingerprints), sorted([self.nicolas_key_fingerprint, self.clement_key_fingerprint]))
+            self.assertIn('2 keys copied', stdout.getvalue())
+
+    @override_settings(MENTORS_GPG_KEYRING_SHARDS=4)
+    def test_save_sharded(self):
+        import_keyring(data=self.keyring)
+        keyring = get_keyring()
+
+        self.assertEqual(keyring.index()[self.nicolas_key_fingerprint], keyring.shard_for(self.nicolas_key_fingerprint))
+
+        GPGKey.objects.get(owner=self.nicolas).delete()
+        self.assertNotIn(self.nicolas_key_fingerprint, keyring.index())
+        self.assertEqual(reconcile_keyring(dry_run=True)[:2], ([], []))
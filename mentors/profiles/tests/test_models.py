@@ -35,7 +35,7 @@ import os
 from django.conf import settings
 
 from lib.test import TestCase
-from lib.gnupg import GnuPG
+from lib.gnupg import GnuPG, GpgUserId
 from profiles.models import GPGKey, MentorsUser
 
 
@@ -121,6 +121,27 @@ class GPGKeyTests(TestCase):
         self.assertIn(new_key.algorithm, unicode(new_key))
         self.assertIn(new_key.fingerprint[-16:], unicode(new_key))
 
+    def test_gpg_parsed_fields(self):
+        new_key = GPGKey(owner=self.nicolas)
+        new_key.key = self.nicolas_key
+        new_key.save()
+
+        key = GPGKey.objects.get(pk=new_key.pk)
+        self.assertEquals(key.key_id, self.nicolas_key_fingerprint[-8:])
+        self.assertIn(self.nicolas.email, [email for name, email in key.get_user_ids()])
+
+    def test_gpg_user_ids(self):
+        user_ids = [GpgUserId('Nicolas Dandrimont', 'nicolas@dandrimont.eu'),
+                    GpgUserId('Nicolas <Dandrimont>', 'olasd@debian.org')]
+
+        key = GPGKey(owner=self.nicolas)
+        key.set_user_ids(user_ids)
+
+        self.assertEquals(key.get_user_ids(), user_ids)
+
+    def test_gpg_shared(self):
+        self.assertIs(GPGKey().gpg, GPGKey(owner=self.nicolas).gpg)
+
     def test_gpg_keyring(self):
         nicolas_key = GPGKey(owner=self.nicolas)
         nicolas_key.key = self.nicolas_key
@@ -149,3 +170,62 @@ class GPGKeyTests(TestCase):
 
         fprs = [key.key.fingerprint for key in keys]
         self.assertIn(self.nicolas_key_fingerprint, fprs)
+
+    def test_gpg_save_unchanged(self):
+        key = GPGKey(owner=self.nicolas)
+        key.key = self.nicolas_key
+        key.save()
+
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run to save an unchanged key")
+
+        orig_run, orig_start = GnuPG._run, GnuPG._start
+        GnuPG._run = GnuPG._start = run_gpg
+        try:
+            key.save()
+            key = GPGKey.objects.get(pk=key.pk)
+            self.assertFalse(key.key_changed())
+            key.save()
+        finally:
+            GnuPG._run, GnuPG._start = orig_run, orig_start
+
+        key.key = self.clement_key
+        self.assertTrue(key.key_changed())
+
+    def test_gpg_change_owner(self):
+        from django.core.exceptions import ValidationError
+
+        key = GPGKey(owner=self.nicolas)
+        key.key = self.nicolas_key
+        key.save()
+
+        key = GPGKey.objects.get(pk=key.pk)
+        key.owner = self.clement
+        with self.assertRaises(ValidationError):
+            key.clean()
+        with self.assertRaises(ValidationError):
+            key.save()
+
+    def test_gpg_save_keys(self):
+        keys = [GPGKey(owner=self.nicolas, key=self.nicolas_key),
+                GPGKey(owner=self.clement, key=self.clement_key)]
+
+        imports = []
+        orig_add_key = GnuPG.add_key
+
+        def add_key(gpg, *args, **kwargs):
+            imports.append(kwargs)
+            return orig_add_key(gpg, *args, **kwargs)
+
+        GnuPG.add_key = add_key
+        try:
+            GPGKey.save_keys(keys)
+            GPGKey.save_keys(keys)
+        finally:
+            GnuPG.add_key = orig_add_key
+
+        self.assertEqual(len(imports), 1)
+        self.assertEqual(GPGKey.objects.count(), 2)
+
+        fprs = [block.key.fingerprint for block in keys[0].gpg.list_keys(with_colons=True)]
+        self.assertEqual(sorted(fprs), sorted([self.nicolas_key_fingerprint, self.clement_key_fingerprint]))
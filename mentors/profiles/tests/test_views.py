@@ -33,10 +33,13 @@ from __future__ import unicode_literals
 import os
 
 from django.core import mail
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
+from django.db.models import F
 
+from lib.gnupg import GnuPG
 from lib.test import TestCase
-from profiles.models import GPGKey, MentorsUser
+from profiles.models import GPGKey, KeyLookupGeneration, MentorsUser
 
 
 class RegistrationProcessTests(TestCase):
@@ -108,6 +111,21 @@ class ViewProfileTests(TestCase):
         self.assertContains(response, self.nicolas_key_fingerprint)
         self.assertContains(response, self.nicolas_key_algorithm)
 
+    def test_info_display_without_gpg(self):
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run to display a profile")
+
+        orig_run = GnuPG._run
+        GnuPG._run = run_gpg
+        try:
+            response = self.client.get(reverse("profile_view", args=[self.user.email]))
+        finally:
+            GnuPG._run = orig_run
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.nicolas_key_fingerprint)
+        self.assertContains(response, self.nicolas_key_fingerprint[-8:])
+
     def test_wrong_user_display(self):
         response = self.client.get(reverse("profile_view", args=["random@example.com"]))
 
@@ -120,6 +138,102 @@ class ViewProfileTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, reverse("profile_edit"))
 
+class KeyLookupTests(TestCase):
+    #flake8: noqa
+    def setUp(self):
+        get_cache('default').clear()
+
+        self.user = MentorsUser.objects.create_user('nicolas.dandrimont@crans.org')
+        self.user.is_active = True
+        self.user.save()
+
+        self.nicolas_key = open(os.path.join(os.path.dirname(__file__), 'data', 'dandrimont.asc')).read()
+        self.nicolas_key_fingerprint = '791F12396630DD71FD364375B8E5087766475AAF'
+        self.key = GPGKey(owner=self.user, key=self.nicolas_key)
+        self.key.save()
+
+    def _get(self, search, **extra):
+        return self.client.get(reverse('key_lookup', args=[search]), **extra)
+
+    def test_lookup(self):
+        for search in (self.nicolas_key_fingerprint, self.nicolas_key_fingerprint.lower(),
+                       self.nicolas_key_fingerprint[-16:], '0x%s' % self.nicolas_key_fingerprint[-16:],
+                       self.user.email):
+            response = self._get(search)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pgp-keys')
+            self.assertEqual(response.content, self.nicolas_key.strip() + '\n')
+            self.assertIn('max-age=', response['Cache-Control'])
+            self.assertIn('public', response['Cache-Control'])
+
+        self.assertEqual(self.key.long_key_id, self.nicolas_key_fingerprint[-16:])
+
+    def test_lookup_not_found(self):
+        for search in ('0' * 40, '0' * 16, 'random@example.com', self.nicolas_key_fingerprint[-8:], 'Lorem ipsum'):
+            self.assertEqual(self._get(search).status_code, 404)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 404)
+
+    def test_lookup_not_modified(self):
+        etag = self._get(self.user.email)['ETag']
+
+        response = self._get(self.user.email, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, '')
+
+        self.assertEqual(self._get(self.user.email, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        self.assertEqual(self.client.post(reverse('key_lookup', args=[self.user.email])).status_code, 405)
+
+    def test_lookup_without_gpg(self):
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run to serve a key")
+
+        self._get(self.nicolas_key_fingerprint)
+        orig_run = GnuPG._run
+        GnuPG._run = run_gpg
+        try:
+            # The generation of the lookups
+            with self.assertNumQueries(1):
+                response = self._get(self.nicolas_key_fingerprint)
+        finally:
+            GnuPG._run = orig_run
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_lookup_forgotten(self):
+        self.assertEqual(self._get(self.user.email).status_code, 200)
+
+        self.key.delete()
+        self.assertEqual(self._get(self.user.email).status_code, 404)
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 404)
+
+    def test_lookup_forgotten_by_other_process(self):
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 200)
+
+        # Another process deleted the key, and incremented the generation
+        GPGKey.objects.filter(pk=self.key.pk).delete()
+        KeyLookupGeneration.objects.filter(pk=1).update(generation=F('generation') + 1)
+
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 404)
+
+    def test_lookup_owner_changed(self):
+        self.assertEqual(self._get(self.user.email).status_code, 200)
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 200)
+
+        old_email = self.user.email
+        self.user.email = 'nicolas@dandrimont.eu'
+        self.user.save()
+        self.assertEqual(self._get(old_email).status_code, 404)
+        self.assertEqual(self._get(self.user.email).status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._get(self.nicolas_key_fingerprint).status_code, 404)
+
+
 class EditProfileTests(TestCase):
     #flake8: noqa
     def setUp(self):
@@ -149,3 +263,52 @@ class EditProfileTests(TestCase):
         self.assertContains(response, self.user.full_name)
         self.assertContains(response, self.nicolas_key_fingerprint[-16:])
         self.assertContains(response, self.nicolas_key_algorithm)
+
+    def _edit_data(self, **kwargs):
+        data = {
+            'full_name': self.user.full_name,
+            'gpg_keys-TOTAL_FORMS': '2',
+            'gpg_keys-INITIAL_FORMS': '1',
+            'gpg_keys-MAX_NUM_FORMS': '1000',
+            'gpg_keys-0-id': str(self.user.gpg_keys.get().pk),
+            'gpg_keys-0-owner': str(self.user.pk),
+            'gpg_keys-1-owner': str(self.user.pk),
+        }
+        data.update(kwargs)
+        return data
+
+    def test_edit_without_gpg(self):
+        self.client.login(username="nicolas.dandrimont@crans.org", password="test_pwd")
+
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run to save a profile without key changes")
+
+        orig_run, orig_start = GnuPG._run, GnuPG._start
+        GnuPG._run = GnuPG._start = run_gpg
+        try:
+            response = self.client.post(reverse("profile_edit"), data=self._edit_data(full_name="Nicolas D."))
+        finally:
+            GnuPG._run, GnuPG._start = orig_run, orig_start
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(MentorsUser.objects.get(pk=self.user.pk).full_name, "Nicolas D.")
+        key = self.user.gpg_keys.get()
+        self.assertEqual(key.fingerprint, self.nicolas_key_fingerprint)
+        self.assertEqual(key.key, open(self.nicolas_key_path).read())
+
+    def test_edit_same_key_upload(self):
+        self.client.login(username="nicolas.dandrimont@crans.org", password="test_pwd")
+
+        def run_gpg(*args, **kwargs):
+            self.fail("gpg was run to save an unchanged key")
+
+        orig_run, orig_start = GnuPG._run, GnuPG._start
+        GnuPG._run = GnuPG._start = run_gpg
+        try:
+            with open(self.nicolas_key_path) as key_file:
+                response = self.client.post(reverse("profile_edit"), data=self._edit_data(**{'gpg_keys-0-key': key_file}))
+        finally:
+            GnuPG._run, GnuPG._start = orig_run, orig_start
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.user.gpg_keys.count(), 1)
@@ -44,6 +44,7 @@ urlpatterns = patterns(
 
     url(r'^view/(?P<email>[^/]+)/$', views.profile_view, name='profile_view'),
     url(r'^edit/$', views.profile_edit, name='profile_edit'),
+    url(r'^keys/(?P<search>[^/]+)/$', views.key_lookup, name='key_lookup'),
 
     url(r'^login/$', views.login, name='login'),
     url(r'^logout/$', views.logout, name='logout'),
@@ -28,8 +28,13 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 #
 
+from django.conf import settings
 from django.contrib.auth import login as auth_login
 from django.contrib.auth import views as auth_views
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_safe
 from django.views.generic import DetailView
 
 from braces.views import LoginRequiredMixin
@@ -37,6 +42,7 @@ from extra_views import UpdateWithInlinesView
 from le_social.registration import views
 
 from . import forms
+from .lookup import lookup_keys
 from .models import MentorsUser
 
 
@@ -127,6 +133,26 @@ def password_reset_confirm(request, uidb36=None, token=None):
     )
 
 
+@require_safe
+def key_lookup(request, search):
+    """
+    The armored keys matching ``search`` (see profiles.lookup), served
+    from the database with a strong ETag.
+    """
+    result = lookup_keys(search)
+    if result is None:
+        raise Http404
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if result.etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(result.data, content_type='application/pgp-keys')
+    response['ETag'] = quote_etag(result.etag)
+    patch_cache_control(response, public=True, max_age=settings.MENTORS_KEY_LOOKUP_MAX_AGE)
+    return response
+
+
 register = Register.as_view()
 registration_complete = RegistrationComplete.as_view()
 registration_closed = RegistrationClosed.as_view()
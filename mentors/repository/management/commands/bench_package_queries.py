@@ -0,0 +1,194 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/management/commands/bench_package_queries.py: Benchmark the package lookups
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+import datetime
+import hashlib
+import time
+from optparse import make_option
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from repository.models import BinaryPackage, Package, PackageFile, SourcePackage, Suite
+
+# Names of the suites holding the generated packages
+BENCH_SUITES = ('bench-unstable', 'bench-experimental')
+
+# Query plan statement of each database vendor
+EXPLAIN = {
+    'postgresql': 'EXPLAIN ANALYZE',
+    'sqlite': 'EXPLAIN QUERY PLAN',
+    'mysql': 'EXPLAIN',
+}
+
+
+class Command(BaseCommand):
+    help = ("Generate a dataset of uploads, and show the query plans and "
+            "timings of the package lookups. Meant for a scratch database.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--packages', type='int', default=500000,
+                    help='Number of package uploads generated'),
+        make_option('--rounds', type='int', default=20,
+                    help='Number of runs of each query'),
+        make_option('--chunk-size', type='int', default=5000,
+                    help='Number of rows inserted at once'),
+        make_option('--keep', action='store_true', default=False,
+                    help='Keep the dataset for the next runs instead of deleting it'),
+    )
+
+    def handle(self, *args, **options):
+        suites = list(Suite.objects.filter(name__in=BENCH_SUITES).order_by('name'))
+        if suites:
+            self.stdout.write('Reusing the dataset of the suites %s' % ', '.join(BENCH_SUITES))
+        else:
+            start = time.time()
+            suites = self.generate(options['packages'], options['chunk_size'])
+            self.stdout.write('Generated %d uploads in %.1fs' % (options['packages'], time.time() - start))
+
+        try:
+            self.bench(suites, options['rounds'])
+        finally:
+            if not options['keep']:
+                self.cleanup(suites)
+
+    def generate(self, count, chunk_size):
+        """Create ``count`` uploads of a tenth as many packages, by a hundredth as many users"""
+        User = get_user_model()
+        now = timezone.now()
+
+        with transaction.atomic():
+            suites = [Suite.objects.create(name=name) for name in BENCH_SUITES]
+            User.objects.bulk_create([User(email='bench-%d@example.invalid' % i)
+                                      for i in xrange(max(count // 100, 1))])
+            uploaders = list(User.objects.filter(email__startswith='bench-', email__endswith='@example.invalid')
+                             .order_by('pk').values_list('pk', flat=True))
+
+        last_pk = 0
+        for offset in xrange(0, count, chunk_size):
+            with transaction.atomic():
+                Package.objects.bulk_create([
+                    Package(name='bench-package-%d' % (i % max(count // 10, 1)),
+                            version='%d.0-1' % (i // 10),
+                            uploader_id=uploaders[i % len(uploaders)],
+                            suite=suites[i % len(suites)],
+                            maintainer='Maintainer %d <maintainer-%d@example.invalid>' % (i, i),
+                            section='devel', component='main', priority='optional',
+                            description='Generated package %d' % i, closes='', qa_status=0,
+                            upload_time=now - datetime.timedelta(minutes=i))
+                    for i in xrange(offset, min(offset + chunk_size, count))
+                ])
+                packages = list(Package.objects.filter(suite__in=suites, pk__gt=last_pk)
+                                .order_by('pk').values_list('pk', 'name'))
+                last_pk = packages[-1][0]
+
+                SourcePackage.objects.bulk_create([SourcePackage(name=name, package_id=pk)
+                                                   for pk, name in packages])
+                BinaryPackage.objects.bulk_create([
+                    BinaryPackage(name=name, package_id=pk, arch=arch, description='')
+                    for pk, name in packages
+                    for arch in (('amd64', 'i386') if pk % 2 else ('all',))
+                ])
+                sources = dict(SourcePackage.objects.filter(package__in=[pk for pk, name in packages])
+                               .values_list('package', 'pk'))
+                PackageFile.objects.bulk_create([
+                    PackageFile(binary_id=binary_pk, source_id=sources[package_pk],
+                                filename='%s_%s.deb' % (name, arch), size=1024,
+                                sha256sum=hashlib.sha256('%d' % binary_pk).hexdigest())
+                    for binary_pk, package_pk, name, arch
+                    in BinaryPackage.objects.filter(package__in=sources).values_list('pk', 'package', 'name', 'arch')
+                ])
+            self.stdout.write('%d/%d uploads generated' % (min(offset + chunk_size, count), count))
+
+        return suites
+
+    def bench(self, suites, rounds):
+        count = Package.objects.filter(suite__in=suites).count()
+        middle = Package.objects.filter(suite__in=suites).order_by('pk')[count // 2]
+        binary = middle.binarypackage_set.all()[0]
+        checksum = PackageFile.objects.filter(binary=binary).values_list('sha256sum', flat=True)[0]
+
+        queries = [
+            ('packages named X in suite Y', lambda: Package.objects.named(middle.name, middle.suite).for_list()),
+            ('uploads by user Z', lambda: Package.objects.uploaded_by(middle.uploader_id).for_list()[:50]),
+            ('binaries of a package for an arch',
+             lambda: BinaryPackage.objects.filter(package=middle, arch=binary.arch)),
+            ('file by checksum', lambda: PackageFile.objects.filter(sha256sum=checksum)),
+        ]
+
+        for name, query in queries:
+            self.stdout.write('== %s' % name)
+            sql, params = query().query.sql_with_params()
+            self.stdout.write(sql % tuple(repr(param) for param in params))
+            for line in self.explain(sql, params):
+                self.stdout.write('  %s' % line)
+            self.stdout.write('  %s' % self.timing(lambda: list(query()), rounds))
+
+        self.stdout.write('== package detail page')
+        self.stdout.write('  %s' % self.timing(lambda: self.detail(middle.pk), rounds))
+
+    def detail(self, pk):
+        package = Package.objects.for_detail().get(pk=pk)
+        for binary in package.binarypackage_set.all():
+            list(binary.packagefile_set.all())
+        for source in package.sourcepackage_set.all():
+            list(source.packagefile_set.all())
+        return package
+
+    def explain(self, sql, params):
+        statement = EXPLAIN.get(connection.vendor)
+        if statement is None:
+            return ['(no query plan for %s)' % connection.vendor]
+        cursor = connection.cursor()
+        cursor.execute('%s %s' % (statement, sql), params)
+        return [' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+    def timing(self, run, rounds):
+        times = []
+        for _i in xrange(rounds):
+            start = time.time()
+            run()
+            times.append(time.time() - start)
+        times.sort()
+        return 'min %.3fms, median %.3fms, max %.3fms over %d runs' % (
+            times[0] * 1000, times[len(times) // 2] * 1000, times[-1] * 1000, rounds)
+
+    def cleanup(self, suites):
+        """Delete the generated dataset, leaves first to keep the cascades small"""
+        with transaction.atomic():
+            PackageFile.objects.filter(source__package__suite__in=suites).delete()
+            BinaryPackage.objects.filter(package__suite__in=suites).delete()
+            SourcePackage.objects.filter(package__suite__in=suites).delete()
+            Package.objects.filter(suite__in=suites).delete()
+            Suite.objects.filter(pk__in=[suite.pk for suite in suites]).delete()
+            get_user_model().objects.filter(email__startswith='bench-', email__endswith='@example.invalid').delete()
+        self.stdout.write('Deleted the generated dataset')
@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/management/commands/collect_pool_garbage.py: Remove the unused pool files
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from repository.pool import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Remove the files of the pool no package references anymore."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of files checked against the database at once'),
+        make_option('--min-age', type='int', default=None,
+                    help='Number of seconds unreferenced files are kept (default: MENTORS_POOL_GC_MIN_AGE)'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Only count the files which would be removed'),
+    )
+
+    def handle(self, *args, **options):
+        collection = collect_garbage(batch_size=options['batch_size'], min_age=options['min_age'],
+                                     dry_run=options['dry_run'])
+
+        self.stdout.write('%d files %s (%d bytes), %d referenced, %d unreferenced but recent' % (
+            collection.removed, 'to remove' if options['dry_run'] else 'removed', collection.size,
+            collection.referenced, collection.recent))
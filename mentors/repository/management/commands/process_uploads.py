@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/management/commands/process_uploads.py: Process uploaded .changes files
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Nicolas Dandrimont
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from repository.upload import UploadError, process_upload
+
+
+class Command(BaseCommand):
+    args = '<changes> [<changes> ...]'
+    help = ("Check the given uploads, and add them to the repository. The files "
+            "of each upload must be next to its .changes file.")
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('Usage: process_uploads %s' % self.args)
+
+        processed = rejected = 0
+        for path in args:
+            try:
+                package = process_upload(path)
+            except UploadError as e:
+                self.stdout.write('Rejected %s' % e)
+                rejected += 1
+            else:
+                self.stdout.write('Processed %s %s' % (package.name, package.version))
+                processed += 1
+
+        self.stdout.write('%d uploads processed, %d rejected' % (processed, rejected))
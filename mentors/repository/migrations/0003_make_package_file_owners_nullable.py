@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+
+        # Changing field 'PackageFile.binary'
+        db.alter_column(u'repository_packagefile', 'binary_id', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['repository.BinaryPackage'], null=True))
+
+        # Changing field 'PackageFile.source'
+        db.alter_column(u'repository_packagefile', 'source_id', self.gf('django.db.models.fields.related.ForeignKey')(to=orm['repository.SourcePackage'], null=True))
+
+    def backwards(self, orm):
+
+        # User chose to not deal with backwards NULL issues for 'PackageFile.binary'
+        raise RuntimeError("Cannot reverse this migration. 'PackageFile.binary' and its values cannot be restored.")
+
+        # User chose to not deal with backwards NULL issues for 'PackageFile.source'
+        raise RuntimeError("Cannot reverse this migration. 'PackageFile.source' and its values cannot be restored.")
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'profiles.mentorsuser': {
+            'Meta': {'object_name': 'MentorsUser'},
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'}),
+            'full_name': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_admin': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"})
+        },
+        u'repository.binarypackage': {
+            'Meta': {'object_name': 'BinaryPackage'},
+            'arch': ('django.db.models.fields.TextField', [], {}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.TextField', [], {}),
+            'package': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['repository.Package']"})
+        },
+        u'repository.package': {
+            'Meta': {'object_name': 'Package'},
+            'closes': ('django.db.models.fields.TextField', [], {}),
+            'component': ('django.db.models.fields.TextField', [], {}),
+            'description': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'maintainer': ('django.db.models.fields.TextField', [], {}),
+            'name': ('django.db.models.fields.TextField', [], {}),
+            'priority': ('django.db.models.fields.TextField', [], {}),
+            'qa_status': ('django.db.models.fields.IntegerField', [], {}),
+            'section': ('django.db.models.fields.TextField', [], {}),
+            'suite': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['repository.Suite']"}),
+            'upload_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'uploader': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['profiles.MentorsUser']"}),
+            'version': ('django.db.models.fields.TextField', [], {})
+        },
+        u'repository.packagefile': {
+            'Meta': {'object_name': 'PackageFile'},
+            'binary': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['repository.BinaryPackage']", 'null': 'True', 'blank': 'True'}),
+            'checksum': ('django.db.models.fields.CharField', [], {'max_length': '200', 'db_index': 'True'}),
+            'filename': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'size': ('django.db.models.fields.IntegerField', [], {}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['repository.SourcePackage']", 'null': 'True', 'blank': 'True'})
+        },
+        u'repository.sourcepackage': {
+            'Meta': {'object_name': 'SourcePackage'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.TextField', [], {}),
+            'package': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['repository.Package']"})
+        },
+        u'repository.suite': {
+            'Meta': {'object_name': 'Suite'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.TextField', [], {})
+        }
+    }
+
+    complete_apps = ['repository']
\ No newline at end of file
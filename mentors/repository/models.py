@@ -31,6 +31,40 @@
 from django.db import models
 from django.conf import settings
 
+from model_utils.managers import PassThroughManager
+
+from lib.digest import DEFAULT_ALGORITHMS
+
+
+class PackageQuerySet(models.query.QuerySet):
+    """
+    Presets for the access paths of the package pages, matching the indexes
+    of the Package table.
+    """
+
+    def named(self, name, suite=None):
+        """The uploads of the package ``name``, maybe only in ``suite``"""
+        packages = self.filter(name=name)
+        if suite is not None:
+            packages = packages.filter(suite=suite)
+        return packages
+
+    def uploaded_by(self, user):
+        """The uploads of ``user``, most recent first"""
+        return self.filter(uploader=user).order_by('-upload_time')
+
+    def for_list(self):
+        """Fetch what package lists display, in a single query"""
+        return self.select_related('uploader', 'suite')
+
+    def for_detail(self):
+        """Fetch what a package page displays, in five queries"""
+        return self.select_related('uploader', 'suite').prefetch_related(
+            'binarypackage_set__packagefile_set',
+            'sourcepackage_set__packagefile_set',
+        )
+
+
 class Suite(models.Model):
     name = models.TextField()
 
@@ -52,6 +86,14 @@ class Package(models.Model):
     closes = models.TextField()
     upload_time = models.DateTimeField()
 
+    objects = PassThroughManager.for_queryset_class(PackageQuerySet)()
+
+    class Meta:
+        index_together = [
+            ('name', 'suite'),
+            ('uploader', 'upload_time'),
+        ]
+
     def __unicode__(self):
         return '{0}-{1} in {2} (by {3})'.format(self.name,
                                                 self.version,
@@ -65,6 +107,11 @@ class BinaryPackage(models.Model):
     arch = models.TextField()
     description = models.TextField()
 
+    class Meta:
+        index_together = [
+            ('package', 'arch'),
+        ]
+
     def __unicode__(self):
         return '{0} ({1})'.format(self.name,
                                   self.arch)
@@ -80,11 +127,27 @@ class SourcePackage(models.Model):
 
 
 class PackageFile(models.Model):
-    binary = models.ForeignKey(BinaryPackage)
-    source = models.ForeignKey(SourcePackage)
+    # A file belongs either to a binary package or to a source package
+    binary = models.ForeignKey(BinaryPackage, null=True, blank=True)
+    source = models.ForeignKey(SourcePackage, null=True, blank=True)
     filename = models.TextField()
     size = models.IntegerField()
-    checksum = models.CharField(max_length=200)
+    # Hex digests, see lib.digest
+    md5sum = models.CharField(max_length=32, blank=True)
+    sha1sum = models.CharField(max_length=40, blank=True)
+    sha256sum = models.CharField(max_length=64, blank=True, db_index=True)
+    sha512sum = models.CharField(max_length=128, blank=True)
+
+    def set_digests(self, digests):
+        """Fill in the digest columns from an algorithm -> hex digest mapping"""
+        for algorithm in DEFAULT_ALGORITHMS:
+            if algorithm in digests:
+                setattr(self, '%ssum' % algorithm, digests[algorithm])
+
+    def open(self):
+        """The content of the file, from the pool, as a file object"""
+        from repository.pool import get_pool
+        return get_pool().open(self.sha256sum)
 
     def __unicode__(self):
         return '{0} ({1})'.format(self.filename,
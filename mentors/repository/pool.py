@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/pool.py: Content-addressed storage of the package files
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Clément Schreiner <clement@mux.me>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+"""
+The pool, where the files of the uploads are kept.
+
+Files are stored once per content, keyed by their SHA-256 digest (see
+lib.blobstore): uploading the same file again, or the same file in several
+uploads, doesn't use more disk. The PackageFile rows reference the blobs
+through their sha256sum column, so a blob is in use as long as a row has
+its digest, and collect_garbage removes the blobs no row references.
+"""
+
+import logging
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from lib.blobstore import BlobStore
+from repository.models import PackageFile
+
+logger = logging.getLogger(__name__)
+
+PoolCollection = namedtuple('PoolCollection', 'removed referenced recent size')
+
+
+def get_pool():
+    """The BlobStore of the package files, in MENTORS_ROOT/pool"""
+    return BlobStore(os.path.join(settings.MENTORS_ROOT, 'pool'))
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect_garbage(pool=None, batch_size=1000, min_age=None, dry_run=False):
+    """
+    Remove the blobs of the pool no PackageFile references, checking the
+    blobs against the database ``batch_size`` at a time.
+
+    The blobs modified less than ``min_age`` seconds ago (by default
+    MENTORS_POOL_GC_MIN_AGE) are kept, as the upload storing them may not
+    have created its rows yet; so are the temporary files of the writes in
+    progress.
+
+    Returns a PoolCollection of the numbers of removed, referenced and
+    recent unreferenced blobs, and of the number of bytes freed.
+    """
+    if pool is None:
+        pool = get_pool()
+    if min_age is None:
+        min_age = settings.MENTORS_POOL_GC_MIN_AGE
+    limit = time.time() - min_age
+
+    removed = referenced = recent = size = 0
+    for batch in _batches(pool, batch_size):
+        in_use = set(PackageFile.objects.filter(sha256sum__in=batch)
+                     .values_list('sha256sum', flat=True))
+        referenced += len(in_use)
+        # BlobStore.add refreshes the blobs it finds under the shared lock:
+        # the blobs reused since the query above are seen as recent here
+        with pool.locked():
+            for sha256 in batch:
+                if sha256 in in_use:
+                    continue
+                try:
+                    stat = os.stat(pool.path(sha256))
+                except OSError:
+                    continue
+                if stat.st_mtime > limit:
+                    recent += 1
+                    continue
+                if not dry_run:
+                    pool.remove(sha256)
+                logger.info('Removed %s from the pool', sha256)
+                removed += 1
+                size += stat.st_size
+
+    for path in pool.temporary_files():
+        try:
+            if os.stat(path).st_mtime <= limit and not dry_run:
+                os.unlink(path)
+        except OSError:
+            pass
+
+    return PoolCollection(removed, referenced, recent, size)
@@ -31,16 +31,74 @@
 from __future__ import unicode_literals
 
 import os
+from StringIO import StringIO
 
 from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
 
 from lib.test import TestCase
 
+from profiles.models import MentorsUser
 from repository.models import Suite, Package, BinaryPackage, SourcePackage, PackageFile
 
 class PackageTests(TestCase):
     #flake8: noqa
-    pass
+    def setUp(self):
+        self.unstable = Suite.objects.create(name='unstable')
+        self.experimental = Suite.objects.create(name='experimental')
+        self.user = MentorsUser.objects.create_user('nicolas@dandrimont.eu')
+
+        self.packages = []
+        for version, suite in (('1.0-1', self.unstable), ('1.1-1', self.experimental), ('1.0-2', self.unstable)):
+            package = Package.objects.create(name='mentors', version=version, suite=suite, uploader=self.user,
+                                             maintainer='Nicolas Dandrimont <nicolas@dandrimont.eu>',
+                                             section='web', component='main', priority='optional',
+                                             description='', qa_status=0, closes='', upload_time=timezone.now())
+            source = SourcePackage.objects.create(name='mentors', package=package)
+            binary = BinaryPackage.objects.create(name='mentors', package=package, arch='all', description='')
+            PackageFile.objects.create(binary=binary, source=source, filename='mentors_%s_all.deb' % version,
+                                       size=1024, sha256sum=version)
+            self.packages.append(package)
+
+    def test_named(self):
+        self.assertEqual(Package.objects.named('mentors').count(), 3)
+        self.assertEqual(sorted(Package.objects.named('mentors', self.unstable).values_list('version', flat=True)),
+                         ['1.0-1', '1.0-2'])
+        self.assertFalse(Package.objects.named('debexpo').exists())
+
+    def test_uploaded_by(self):
+        self.assertEqual(list(Package.objects.uploaded_by(self.user)), self.packages[::-1])
+        # The presets chain with the other QuerySet methods
+        self.assertEqual(Package.objects.filter(suite=self.unstable).uploaded_by(self.user).count(), 2)
+
+    def test_for_list(self):
+        with self.assertNumQueries(1):
+            for package in Package.objects.uploaded_by(self.user).for_list():
+                unicode(package)
+
+    def test_for_detail(self):
+        with self.assertNumQueries(5):
+            package = Package.objects.for_detail().get(pk=self.packages[0].pk)
+            unicode(package)
+            files = [package_file.filename
+                     for binary in package.binarypackage_set.all()
+                     for package_file in binary.packagefile_set.all()]
+            files += [package_file.filename
+                      for source in package.sourcepackage_set.all()
+                      for package_file in source.packagefile_set.all()]
+
+        self.assertEqual(files, ['mentors_1.0-1_all.deb'] * 2)
+
+    def test_bench_package_queries(self):
+        stdout = StringIO()
+
+        call_command('bench_package_queries', packages=50, rounds=1, chunk_size=20, stdout=stdout)
+
+        self.assertIn('== packages named X in suite Y', stdout.getvalue())
+        self.assertIn('== file by checksum', stdout.getvalue())
+        self.assertEqual(Package.objects.count(), 3)
+        self.assertEqual(MentorsUser.objects.count(), 1)
 
 
 class PackageUploadTests(TestCase):
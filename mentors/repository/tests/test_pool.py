@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/tests/test_pool.py: Tests for the pool of package files
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Clément Schreiner
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+from StringIO import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+
+from lib.test import TestCase
+from repository.models import PackageFile
+from repository.pool import collect_garbage, get_pool
+
+
+class PoolTests(TestCase):
+    #flake8: noqa
+    def setUp(self):
+        self.pool = get_pool()
+        self.upload_dir = os.path.join(settings.MENTORS_ROOT, 'upload')
+        os.mkdir(self.upload_dir)
+        sha256s = []
+        for name in ('referenced', 'unreferenced', 'recent'):
+            path = os.path.join(self.upload_dir, name)
+            with open(path, 'wb') as f:
+                f.write(name.encode('ascii'))
+            sha256s.append(hashlib.sha256(name.encode('ascii')).hexdigest())
+            self.assertTrue(self.pool.add(path, sha256s[-1]))
+        self.referenced, self.unreferenced, self.recent = sha256s
+
+        PackageFile.objects.create(filename='referenced', size=10, sha256sum=self.referenced)
+        for sha256 in (self.referenced, self.unreferenced):
+            os.utime(self.pool.path(sha256), (0, 0))
+
+    def test_collect_garbage(self):
+        collection = collect_garbage(batch_size=2)
+
+        self.assertEqual(collection, (1, 1, 1, len('unreferenced')))
+        self.assertEqual(sorted(self.pool), sorted([self.referenced, self.recent]))
+        with PackageFile.objects.get().open() as f:
+            self.assertEqual(f.read(), b'referenced')
+
+    def test_min_age(self):
+        self.assertEqual(collect_garbage(min_age=0).removed, 2)
+        self.assertEqual(list(self.pool), [self.referenced])
+
+    def test_dry_run(self):
+        self.assertEqual(collect_garbage(dry_run=True).removed, 1)
+        self.assertEqual(len(list(self.pool)), 3)
+
+    def test_temporary_files(self):
+        for name in ('old', 'new'):
+            open(os.path.join(self.pool.tmp_dir, name), 'w').close()
+        os.utime(os.path.join(self.pool.tmp_dir, 'old'), (0, 0))
+
+        collect_garbage()
+
+        self.assertEqual(self.pool.temporary_files(), [os.path.join(self.pool.tmp_dir, 'new')])
+
+    def test_collect_pool_garbage_command(self):
+        stdout = StringIO()
+
+        call_command('collect_pool_garbage', dry_run=True, stdout=stdout)
+        self.assertIn('1 files to remove (12 bytes), 1 referenced, 1 unreferenced but recent', stdout.getvalue())
+
+        call_command('collect_pool_garbage', min_age=0, stdout=stdout)
+        self.assertIn('2 files removed (18 bytes), 1 referenced, 0 unreferenced but recent', stdout.getvalue())
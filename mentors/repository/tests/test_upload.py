@@ -0,0 +1,240 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/tests/test_upload.py: Tests for the processing of the uploads
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Clément Schreiner
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+from StringIO import StringIO
+
+from django.core.management import call_command
+
+from lib import digest, openpgp
+from lib.test import TestCase
+from lib.tests.test_gnupg import SigningKeyMixin
+from profiles.models import GPGKey, MentorsUser
+from repository.models import Package, PackageFile
+from repository.pool import get_pool
+from repository.upload import UploadError, process_upload
+
+
+class UploadTests(SigningKeyMixin, TestCase):
+    #flake8: noqa
+    def setUp(self):
+        super(UploadTests, self).setUp()
+        self.user = MentorsUser.objects.create_user('signing@example.com')
+        self.user.is_active = True
+        self.user.save()
+        GPGKey(owner=self.user, key=openpgp.armor(self.gnupg.export_keys())).save()
+
+        self.upload_dir = os.path.join(self.tempdir, 'upload')
+        os.mkdir(self.upload_dir)
+        self.files = {
+            'mentors_1.0.orig.tar.gz': os.urandom(3 * digest.BUFFER_SIZE + 17),
+            'mentors_1.0-1.debian.tar.xz': os.urandom(1024),
+            'mentors_1.0-1.dsc': b'Format: 3.0 (quilt)\nSource: mentors\nVersion: 1.0-1\n',
+            'mentors_1.0-1_all.deb': os.urandom(2048),
+        }
+        for name, data in self.files.items():
+            with open(os.path.join(self.upload_dir, name), 'wb') as f:
+                f.write(data)
+
+    def _changes(self, files=None, signed=True, sha256_files=None):
+        files = self.files if files is None else files
+        sha256_files = files if sha256_files is None else sha256_files
+        lines = [
+            'Format: 1.8',
+            'Source: mentors',
+            'Binary: mentors',
+            'Architecture: source all',
+            'Version: 1.0-1',
+            'Distribution: unstable',
+            'Maintainer: Nicolas Dandrimont <nicolas@dandrimont.eu>',
+            'Closes: 123456',
+            'Description:',
+            ' mentors    - Debian mentors website',
+        ]
+        for field, algorithm in (('Checksums-Sha256', hashlib.sha256), ('Checksums-Sha512', hashlib.sha512),
+                                 ('Files', hashlib.md5)):
+            field_files = sha256_files if field == 'Checksums-Sha256' else files
+            if not field_files:
+                continue
+            lines.append('%s:' % field)
+            for name, data in sorted(field_files.items()):
+                columns = [algorithm(data).hexdigest(), str(len(data))]
+                if field == 'Files':
+                    columns.extend(['web', 'optional'] if name.endswith('.deb') else ['contrib/web', 'source'])
+                lines.append(' %s %s' % (' '.join(columns), name))
+        changes = '\n'.join(lines) + '\n'
+        if signed:
+            changes = self.gnupg.clearsign(data=changes.encode('utf-8'), keyid=self.fingerprint).data
+
+        path = os.path.join(self.upload_dir, 'mentors_1.0-1_amd64.changes')
+        with open(path, 'wb') as f:
+            f.write(changes)
+        return path
+
+    def test_process_upload(self):
+        package = process_upload(self._changes())
+
+        self.assertEqual((package.name, package.version, package.suite.name), ('mentors', '1.0-1', 'unstable'))
+        self.assertEqual(package.uploader, self.user)
+        self.assertEqual((package.section, package.component, package.priority), ('contrib/web', 'contrib', 'source'))
+        self.assertEqual(package.closes, '123456')
+
+        source = package.sourcepackage_set.get()
+        self.assertEqual(sorted(source.packagefile_set.values_list('filename', flat=True)),
+                         ['mentors_1.0-1.debian.tar.xz', 'mentors_1.0-1.dsc', 'mentors_1.0.orig.tar.gz'])
+        orig = source.packagefile_set.get(filename='mentors_1.0.orig.tar.gz')
+        self.assertEqual(orig.size, len(self.files['mentors_1.0.orig.tar.gz']))
+        orig_data = self.files['mentors_1.0.orig.tar.gz']
+        self.assertEqual((orig.md5sum, orig.sha1sum, orig.sha256sum, orig.sha512sum),
+                         (hashlib.md5(orig_data).hexdigest(), hashlib.sha1(orig_data).hexdigest(),
+                          hashlib.sha256(orig_data).hexdigest(), hashlib.sha512(orig_data).hexdigest()))
+
+        binary = package.binarypackage_set.get()
+        self.assertEqual((binary.name, binary.arch, binary.description), ('mentors', 'all', 'Debian mentors website'))
+        self.assertEqual(binary.packagefile_set.get().filename, 'mentors_1.0-1_all.deb')
+
+        with orig.open() as f:
+            self.assertEqual(f.read(), orig_data)
+
+    def test_reupload(self):
+        process_upload(self._changes())
+        self.files['mentors_1.0-1_all.deb'] = os.urandom(2048)
+        with open(os.path.join(self.upload_dir, 'mentors_1.0-1_all.deb'), 'wb') as f:
+            f.write(self.files['mentors_1.0-1_all.deb'])
+        process_upload(self._changes())
+
+        # The unchanged files are stored once, and rewriting an uploaded
+        # file didn't change the blob of the first upload
+        self.assertEqual(PackageFile.objects.count(), 8)
+        self.assertEqual(len(list(get_pool())), 5)
+        for package_file in PackageFile.objects.all():
+            with package_file.open() as f:
+                self.assertEqual(hashlib.sha256(f.read()).hexdigest(), package_file.sha256sum)
+
+    def test_reupload_collected(self):
+        process_upload(self._changes())
+        store = get_pool()
+        for sha256 in list(store):
+            store.remove(sha256)
+
+        process_upload(self._changes())
+
+        self.assertEqual(len(list(store)), 4)
+
+    def _assertRejected(self, path, message):
+        with self.assertRaises(UploadError) as context:
+            process_upload(path)
+        self.assertIn(message, str(context.exception))
+        self.assertFalse(Package.objects.exists())
+        self.assertFalse(PackageFile.objects.exists())
+        self.assertEqual(list(get_pool()), [])
+
+    def test_unsigned(self):
+        self._assertRejected(self._changes(signed=False), 'Invalid PGP signature')
+
+    def test_unknown_signer(self):
+        GPGKey.objects.get(owner=self.user).delete()
+        self._assertRejected(self._changes(), 'signature check failed')
+
+    def test_inactive_signer(self):
+        self.user.is_active = False
+        self.user.save()
+        self._assertRejected(self._changes(), 'inactive user')
+
+    def test_checksum_mismatch(self):
+        path = self._changes()
+        data = bytearray(self.files['mentors_1.0.orig.tar.gz'])
+        data[-1] ^= 0xff
+        with open(os.path.join(self.upload_dir, 'mentors_1.0.orig.tar.gz'), 'wb') as f:
+            f.write(data)
+
+        self._assertRejected(path, 'mentors_1.0.orig.tar.gz: md5 checksum mismatch')
+        self.assertEqual(get_pool().temporary_files(), [])
+
+    def test_size_mismatch(self):
+        path = self._changes()
+        with open(os.path.join(self.upload_dir, 'mentors_1.0-1.dsc'), 'ab') as f:
+            f.write(b'\n')
+
+        self._assertRejected(path, 'mentors_1.0-1.dsc: size mismatch')
+
+    def test_missing_file(self):
+        os.unlink(os.path.join(self.upload_dir, 'mentors_1.0-1_all.deb'))
+        self._assertRejected(self._changes(), 'mentors_1.0-1_all.deb: No such file')
+
+    def test_invalid_file_name(self):
+        files = dict(self.files)
+        files['../mentors_1.0-1.dsc'] = files.pop('mentors_1.0-1.dsc')
+        self._assertRejected(self._changes(files), "Invalid file name '../mentors_1.0-1.dsc'")
+
+    def _signed_changes(self, edit):
+        # Clearsigns the changes of self.files, after passing them through edit
+        path = self._changes(signed=False)
+        with open(path, 'rb') as f:
+            changes = edit(f.read())
+        with open(path, 'wb') as f:
+            f.write(self.gnupg.clearsign(data=changes, keyid=self.fingerprint).data)
+        return path
+
+    def test_duplicate_file(self):
+        # Files is the last field
+        path = self._signed_changes(lambda changes: changes + changes.splitlines(True)[-1])
+        self._assertRejected(path, 'Duplicate file mentors_1.0.orig.tar.gz')
+
+    def test_no_files(self):
+        path = self._signed_changes(lambda changes: changes[:changes.index('Files:')] + 'Files:\n')
+        self._assertRejected(path, 'Files lists no files')
+
+    def test_missing_fields(self):
+        path = os.path.join(self.upload_dir, 'mentors_1.0-1_amd64.changes')
+        with open(path, 'wb') as f:
+            f.write(self.gnupg.clearsign(data=b'Format: 1.8\nSource: mentors\n', keyid=self.fingerprint).data)
+
+        self._assertRejected(path, 'missing fields Version, Distribution, Maintainer, Files, Checksums-Sha256')
+
+    def test_missing_sha256(self):
+        # The MD5 checksums of Files are not enough
+        self._assertRejected(self._changes(sha256_files={}), 'missing fields Checksums-Sha256')
+
+        sha256_files = dict(self.files)
+        del sha256_files['mentors_1.0-1_all.deb']
+        self._assertRejected(self._changes(sha256_files=sha256_files),
+                             'Checksums-Sha256 does not list mentors_1.0-1_all.deb')
+
+    def test_process_uploads_command(self):
+        stdout = StringIO()
+
+        call_command('process_uploads', self._changes(), stdout=stdout)
+
+        self.assertIn('Processed mentors 1.0-1', stdout.getvalue())
+        self.assertIn('1 uploads processed, 0 rejected', stdout.getvalue())
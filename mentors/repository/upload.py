@@ -0,0 +1,299 @@
+# -*- encoding: utf-8 -*-
+#
+# repository/upload.py: Processing of the uploads
+#
+# This file is part of mentors.debian.net
+#
+# Copyright © 2013 Clément Schreiner <clement@mux.me>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Turn an upload, a signed .changes file and the files it lists, into
+repository rows.
+"""
+
+import logging
+import os
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from lib import deb822, digest
+from lib.blobstore import BlobStoreError
+from lib.gnupg import GpgBaseException
+from lib.utils import get_keyring
+from profiles.models import GPGKey
+from repository import pool
+from repository.models import BinaryPackage, Package, PackageFile, SourcePackage, Suite
+
+# Fields of the .changes files listing the checksums of the uploaded files,
+# and their hash algorithm
+CHECKSUM_FIELDS = (
+    ('Files', 'md5'),
+    ('Checksums-Sha1', 'sha1'),
+    ('Checksums-Sha256', 'sha256'),
+    ('Checksums-Sha512', 'sha512'),
+)
+
+# Checksums-Sha256 is required so that the signature covers the files through
+# a collision-resistant digest, not only MD5
+REQUIRED_FIELDS = ('Source', 'Version', 'Distribution', 'Maintainer', 'Files', 'Checksums-Sha256')
+
+UploadedFile = namedtuple('UploadedFile',
+                          ['name',
+                           'size',
+                           'section',
+                           'priority',
+                           'digests',  # algorithm -> hex digest, computed while checking the file
+                           'blob',  # lib.blobstore.PendingBlob copied while checking the file, or None
+                           ])
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """The upload is invalid, and must be rejected"""
+
+
+def process_upload(changes_path, keyring=None):
+    """
+    Check the upload described by the .changes file at ``changes_path``,
+    whose files are in the same directory, and create its Package,
+    SourcePackage, BinaryPackage and PackageFile rows in one transaction.
+
+    The .changes file must be signed by a key of an active user, found in
+    ``keyring`` (by default, the mentors keyring). Each file is read once,
+    by chunks, to check its size and all its checksums, whose values are
+    stored in the PackageFile digest columns. The files which are not in
+    the pool yet are copied to it during that same read.
+
+    Returns the new Package. Raises UploadError.
+    """
+    name = os.path.basename(changes_path)
+    if keyring is None:
+        keyring = get_keyring()
+
+    try:
+        signed = deb822.verify_paragraphs(keyring, path=changes_path)
+    except deb822.Deb822Error as e:
+        raise UploadError('%s: %s' % (name, e))
+    except GpgBaseException as e:
+        raise UploadError('%s: signature check failed: %s' % (name, e))
+
+    try:
+        key = GPGKey.objects.select_related('owner').get(fingerprint=signed.signature.fingerprint)
+    except GPGKey.DoesNotExist:
+        raise UploadError('%s: signed by the unknown key %s' % (name, signed.signature.fingerprint))
+    if not key.owner.is_active:
+        raise UploadError('%s: signed by the inactive user %s' % (name, key.owner.email))
+
+    if not signed.paragraphs:
+        raise UploadError('%s: no control data' % name)
+    changes = signed.paragraphs[0]
+    missing = [field for field in REQUIRED_FIELDS if field not in changes]
+    if missing:
+        raise UploadError('%s: missing fields %s' % (name, ', '.join(missing)))
+
+    directory = os.path.dirname(changes_path)
+    store = pool.get_pool()
+    files = check_files(changes, directory, store)
+
+    # The files are stored before the rows referencing them are created; the
+    # blobs of a failed upload are removed by pool.collect_garbage
+    try:
+        for entry in files:
+            if entry.blob is not None:
+                entry.blob.commit()
+            else:
+                # Already stored: only mark the blob as in use, copying the
+                # file again if it was collected in the meantime
+                store.add(os.path.join(directory, entry.name), entry.digests['sha256'])
+    except (EnvironmentError, BlobStoreError) as e:
+        _discard_blobs(files)
+        raise UploadError('%s: could not store %s: %s' % (name, entry.name, getattr(e, 'strerror', None) or e))
+
+    with transaction.atomic():
+        package = _create_rows(changes, files, key.owner)
+
+    logger.info('Processed %s %s, uploaded by %s', package.name, package.version, key.owner.email)
+    return package
+
+
+def check_files(changes, directory, store=None):
+    """
+    Check the size and checksums of the files listed by the ``changes``
+    Paragraph, in ``directory``. All the digests of a file are computed
+    in a single read, and the files are read concurrently. Returns a list
+    of UploadedFile.
+
+    The files missing from the ``store`` BlobStore are copied to it while
+    being read, as PendingBlob objects for the caller to commit.
+    """
+    entries = {}
+    for line in changes['Files'].splitlines():
+        columns = line.split()
+        if not columns:
+            continue
+        if len(columns) != 5 or not columns[1].isdigit():
+            raise UploadError('Invalid Files line: %r' % line)
+        md5, size, section, priority, file_name = columns
+        if file_name in ('.', '..') or '/' in file_name:
+            raise UploadError('Invalid file name %r' % file_name)
+        if file_name in entries:
+            raise UploadError('Duplicate file %s' % file_name)
+        entries[file_name] = UploadedFile(file_name, int(size), section, priority, None, None)
+    if not entries:
+        raise UploadError('Files lists no files')
+
+    checksums = dict((file_name, {}) for file_name in entries)
+    for field, algorithm in CHECKSUM_FIELDS:
+        if field not in changes:
+            continue
+        try:
+            field_entries = changes.checksums(field)
+        except deb822.Deb822Error as e:
+            raise UploadError(str(e))
+        for checksum, size, file_name in field_entries:
+            if file_name not in entries:
+                raise UploadError('%s lists %s, which is not in Files' % (field, file_name))
+            if size != entries[file_name].size:
+                raise UploadError('%s and Files disagree on the size of %s' % (field, file_name))
+            checksums[file_name][algorithm] = checksum
+
+    unlisted = sorted(file_name for file_name in entries if 'sha256' not in checksums[file_name])
+    if unlisted:
+        raise UploadError('Checksums-Sha256 does not list %s' % ', '.join(unlisted))
+
+    names = sorted(entries)
+    paths = [os.path.join(directory, file_name) for file_name in names]
+    for file_name, path in zip(names, paths):
+        try:
+            size = os.stat(path).st_size
+        except OSError as e:
+            raise UploadError('%s: %s' % (file_name, e.strerror))
+        if size != entries[file_name].size:
+            raise UploadError('%s: size mismatch' % file_name)
+
+    def read(path, sha256):
+        try:
+            if store is None or sha256 in store:
+                return digest.digest_file(path), None, None
+            blob = store.write(path)
+            return blob.file_digests, blob, None
+        except IOError as e:
+            return None, None, e
+
+    sha256s = [checksums[file_name]['sha256'] for file_name in names]
+    workers = min(settings.MENTORS_DIGEST_WORKERS, len(paths))
+    if workers <= 1:
+        results = map(read, paths, sha256s)
+    else:
+        thread_pool = ThreadPool(workers)
+        try:
+            results = thread_pool.map(lambda args: read(*args), zip(paths, sha256s))
+        finally:
+            thread_pool.terminate()
+
+    files = [entries[file_name]._replace(digests=file_digest and file_digest.digests, blob=blob)
+             for file_name, (file_digest, blob, _error) in zip(names, results)]
+    try:
+        for file_name, (file_digest, _blob, error) in zip(names, results):
+            if error is not None:
+                raise UploadError('%s: %s' % (file_name, error.strerror))
+            if file_digest.size != entries[file_name].size:
+                raise UploadError('%s: size mismatch' % file_name)
+            for algorithm, checksum in sorted(checksums[file_name].iteritems()):
+                if file_digest.digests[algorithm] != checksum.lower():
+                    raise UploadError('%s: %s checksum mismatch' % (file_name, algorithm))
+    except UploadError:
+        _discard_blobs(files)
+        raise
+    return files
+
+
+def _discard_blobs(files):
+    """Remove the pending copies of the UploadedFile objects ``files``"""
+    for entry in files:
+        if entry.blob is not None:
+            entry.blob.discard()
+
+
+def _binary_descriptions(changes):
+    """The short descriptions of the binary packages, by name"""
+    descriptions = {}
+    for line in changes.get('Description', '').splitlines()[1:]:
+        binary, _sep, description = line.strip().partition(' - ')
+        descriptions[binary.strip()] = description.strip()
+    return descriptions
+
+
+def _create_rows(changes, files, uploader):
+    source_files = [entry for entry in files if not entry.name.endswith(('.deb', '.udeb'))]
+    binary_files = [entry for entry in files if entry.name.endswith(('.deb', '.udeb'))]
+    dsc = [entry for entry in files if entry.name.endswith('.dsc')]
+    # The section of the upload is the one of its source package
+    main_file = (dsc or source_files or files)[0]
+    component = main_file.section.split('/')[0] if '/' in main_file.section else 'main'
+
+    suite, _created = Suite.objects.get_or_create(name=changes['Distribution'])
+    package = Package.objects.create(
+        name=changes['Source'],
+        version=changes['Version'],
+        uploader=uploader,
+        maintainer=changes['Maintainer'],
+        section=main_file.section,
+        suite=suite,
+        description=changes.get('Description', ''),
+        qa_status=0,
+        component=component,
+        priority=main_file.priority,
+        closes=changes.get('Closes', ''),
+        upload_time=timezone.now(),
+    )
+
+    if source_files:
+        source = SourcePackage.objects.create(name=changes['Source'], package=package)
+        package_files = []
+        for entry in source_files:
+            package_file = PackageFile(source=source, filename=entry.name, size=entry.size)
+            package_file.set_digests(entry.digests)
+            package_files.append(package_file)
+        PackageFile.objects.bulk_create(package_files)
+
+    descriptions = _binary_descriptions(changes)
+    for entry in binary_files:
+        # name_version_arch.deb
+        parts = entry.name.rsplit('.', 1)[0].split('_')
+        if len(parts) != 3:
+            raise UploadError('Invalid binary package file name %s' % entry.name)
+        binary = BinaryPackage.objects.create(name=parts[0], package=package, arch=parts[2],
+                                              description=descriptions.get(parts[0], ''))
+        package_file = PackageFile(binary=binary, filename=entry.name, size=entry.size)
+        package_file.set_digests(entry.digests)
+        package_file.save()
+
+    return package